@@ -0,0 +1,280 @@
+"""Microbenchmarks for the decoding hot paths.
+
+Times calc_crc, Framer.add/decode_all on clean, noisy and XMODEM-heavy
+streams, decode_packet per attribute and parse_line_generator, on the
+captures in test_decode/ and on streams from the synth traffic generator. Each
+result records throughput (bytes/s, packets/s) and, from a separate
+tracemalloc pass, peak traced memory and allocated blocks per run.
+Results are saved as JSON so runs can be compared with --compare.
+"""
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from .capture import read_records, iter_packets, open_writer
+from .crc import calc_crc
+from .framer import Framer
+from .protocol import decode_packet
+from .synth import TrafficGenerator, SyntheticCapture, Corruptor, xmodem_blocks
+
+DEFAULT_CAPTURES = "test_decode"
+MIN_TIME = 0.5  # seconds per benchmark
+SAMPLE_TIME = 0.01  # seconds per timing sample
+CHUNK_SIZE = 64  # synthetic UART chunk size
+SYNTH_SIZE = 256 * 1024  # bytes per synthetic stream
+NOISE_RATE = 0.001  # corrupted bytes per byte in the noisy stream
+# Average bytes one generated exchange puts on the radar channel
+SYNTH_EXCHANGE_SIZE = 32
+
+class Workload:
+    """Inputs shared by the benchmarks, loaded once."""
+
+    def __init__(self, captures=DEFAULT_CAPTURES, synth_size=SYNTH_SIZE, seed=0):
+        self.captures = sorted(
+            os.path.join(captures, name) for name in os.listdir(captures)
+            if name.endswith((".txt", ".fp2cap"))
+        ) if os.path.isdir(captures) else []
+        rng = random.Random(seed)
+
+        # Real traffic, as the chunks the sniffer recorded
+        self.chunks = ([], [])
+        for path in self.captures:
+            for ts, channel, data in read_records(path):
+                self.chunks[channel].append(data)
+        self.real = [b"".join(c) for c in self.chunks]
+
+        # Every framed packet, for CRC and decode benchmarks
+        self.packets = []
+        for path in self.captures:
+            for ts, channel, offset, skip, packet in iter_packets(read_records(path)):
+                self.packets.append((channel, packet))
+
+        # Synthetic streams from the traffic generator (radar side)
+        clean = SyntheticCapture(TrafficGenerator(seed=seed), synth_size // SYNTH_EXCHANGE_SIZE)
+        self.clean = clean.streams[1]
+        rate = NOISE_RATE / 3
+        noisy = SyntheticCapture(TrafficGenerator(seed=seed), synth_size // SYNTH_EXCHANGE_SIZE,
+                                 Corruptor(rate, rate, rate, seed=seed))
+        self.noisy = noisy.streams[1]
+        self.xmodem = b"".join(xmodem_blocks(rng.randbytes(synth_size)))
+
+def chunked(data, size=CHUNK_SIZE):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def _time(fn, number):
+    gc.disable()
+    try:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - t0
+    finally:
+        gc.enable()
+
+def measure(fn, min_time=MIN_TIME):
+    """Best seconds per call of fn, timeit style.
+
+    Calls are batched so each sample takes at least SAMPLE_TIME, and
+    samples are repeated for at least min_time (and at least 3 of them).
+    """
+    number = 1
+    while True:
+        dt = _time(fn, number)
+        if dt >= SAMPLE_TIME:
+            break
+        number *= 2 if dt * 10 > SAMPLE_TIME else 10
+    best = dt / number
+    total = dt
+    samples = 1
+    while total < min_time or samples < 3:
+        gc.collect()
+        dt = _time(fn, number)
+        best = min(best, dt / number)
+        total += dt
+        samples += 1
+    return best, number * samples
+
+def measure_allocations(fn):
+    """(peak traced bytes, allocated blocks) of one call of fn."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(s.count_diff for s in after.compare_to(before, "filename") if s.count_diff > 0)
+    return peak, blocks
+
+def run_benchmark(name, fn, nbytes=0, npackets=0, min_time=MIN_TIME, allocations=True):
+    seconds, runs = measure(fn, min_time)
+    result = {
+        "seconds": seconds,
+        "runs": runs,
+        "bytes": nbytes,
+        "packets": npackets,
+        "bytes_per_s": nbytes / seconds if nbytes else None,
+        "packets_per_s": npackets / seconds if npackets else None,
+    }
+    if allocations:
+        result["peak_bytes"], result["alloc_blocks"] = measure_allocations(fn)
+    return result
+
+def framer_bench(chunks):
+    # XMODEM blocks count as packets
+    blocks = [0]
+
+    def on_xmodem_block(*args):
+        blocks[0] += 1
+
+    def run():
+        framer = Framer(1, on_xmodem_block=on_xmodem_block)
+        blocks[0] = 0
+        count = 0
+        for data in chunks:
+            framer.add(data)
+            count += len(framer.packets)
+            framer.packets.clear()
+        return count + blocks[0]
+    return run
+
+def count_packets(chunks):
+    return framer_bench(chunks)()
+
+def benchmarks(w):
+    """Yield (name, fn, bytes, packets) for every benchmark."""
+    frames = [bytes(p.raw[:-2]) for _, p in w.packets]
+    crc_bytes = sum(len(f) for f in frames)
+
+    def crc_run():
+        for f in frames:
+            calc_crc(f)
+    yield "crc.calc_crc", crc_run, crc_bytes, len(frames)
+
+    streams = [
+        ("framer.real", [c for ch in w.chunks for c in ch]),
+        ("framer.clean", chunked(w.clean)),
+        ("framer.noisy", chunked(w.noisy)),
+        ("framer.xmodem", chunked(w.xmodem)),
+    ]
+    for name, chunks in streams:
+        if chunks:
+            yield name, framer_bench(chunks), sum(len(c) for c in chunks), count_packets(chunks)
+
+    by_attr = defaultdict(list)
+    for channel, packet in w.packets:
+        data = packet.data
+        sub_id = data[0] << 8 | data[1] if len(data) >= 2 else None
+        by_attr[sub_id].append((channel, packet))
+    from .schema import sub_id_map
+    for sub_id, packets in sorted(by_attr.items(), key=lambda item: -len(item[1])):
+        name = sub_id_map.get(sub_id, f"0x{sub_id:04x}" if sub_id is not None else "none")
+
+        def decode_run(packets=packets):
+            for channel, packet in packets:
+                decode_packet(channel, packet)
+        yield f"decode_packet.{name}", decode_run, sum(len(p.raw) for _, p in packets), len(packets)
+
+    from .cli import parse_line_generator
+    for path in w.captures:
+        size = os.path.getsize(path)
+        records = sum(1 for _ in parse_line_generator(path))
+
+        def parse_run(path=path):
+            for _ in parse_line_generator(path):
+                pass
+        yield f"parse_line_generator.{os.path.basename(path)}", parse_run, size, records
+
+def synthetic_capture(w, fmt):
+    """Write the clean synthetic stream as a capture file; returns its path."""
+    ext = ".fp2cap" if fmt == "bin" else ".txt"
+    fd, path = tempfile.mkstemp(prefix="bench_", suffix=ext)
+    os.close(fd)
+    writer = open_writer(path, fmt)
+    t = 0.0
+    for data in chunked(w.clean):
+        writer.write(t, 1, data)
+        t += 0.001
+    writer.close()
+    return path
+
+def run_all(captures=DEFAULT_CAPTURES, only=None, min_time=MIN_TIME, allocations=True, log=sys.stderr):
+    w = Workload(captures)
+    results = {}
+    temp_paths = [synthetic_capture(w, "text"), synthetic_capture(w, "bin")]
+    try:
+        items = list(benchmarks(w))
+        from .cli import parse_line_generator
+        for path in temp_paths:
+            size = os.path.getsize(path)
+            records = sum(1 for _ in parse_line_generator(path))
+            kind = "bin" if path.endswith(".fp2cap") else "text"
+
+            def parse_run(path=path):
+                for _ in parse_line_generator(path):
+                    pass
+            items.append((f"parse_line_generator.synthetic_{kind}", parse_run, size, records))
+
+        for name, fn, nbytes, npackets in items:
+            if only and not any(s in name for s in only):
+                continue
+            results[name] = run_benchmark(name, fn, nbytes, npackets, min_time, allocations)
+            print(format_result(name, results[name]), file=log)
+    finally:
+        for path in temp_paths:
+            os.unlink(path)
+    return {
+        "meta": {
+            "time": time.time(),
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "captures": w.captures,
+        },
+        "results": results,
+    }
+
+def format_rate(value, unit):
+    if value is None:
+        return "-"
+    for prefix in ("", "K", "M", "G"):
+        if value < 1000:
+            return f"{value:.1f} {prefix}{unit}"
+        value /= 1000
+    return f"{value:.1f} T{unit}"
+
+def format_result(name, r):
+    line = f"{name:60s} {format_rate(r['bytes_per_s'], 'B/s'):>12s} {format_rate(r['packets_per_s'], 'pkt/s'):>14s}"
+    if "peak_bytes" in r:
+        line += f"  peak {r['peak_bytes'] / 1024:8.1f} KiB  {r['alloc_blocks']:8d} blocks"
+    return line
+
+def compare(old, new, log=sys.stdout):
+    """Print the speed ratio new/old of every benchmark present in both."""
+    for name, r in new["results"].items():
+        base = old["results"].get(name)
+        if base is None:
+            continue
+        ratio = base["seconds"] / r["seconds"] if r["seconds"] else float("inf")
+        marker = "faster" if ratio > 1.05 else "slower" if ratio < 0.95 else ""
+        print(f"{name:60s} {ratio:6.2f}x {marker}", file=log)
+
+def run_bench(args):
+    data = run_all(args.captures, only=args.only, min_time=args.min_time, allocations=not args.no_alloc)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(data, f, indent=1)
+        print(f"Wrote {args.out}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), data)
@@ -0,0 +1,518 @@
+"""Raw UART capture files.
+
+Two formats are understood:
+
+* Text (the original sniffer format): one chunk per line,
+  ``t<timestamp> <channel> <hex bytes>``. The timestamp is optional.
+* Binary: an 8 byte file header followed by length-prefixed records,
+  ``<f64 timestamp> <u8 channel> <u16 length> <data>`` (little endian).
+  A NaN timestamp stands for a text line without one.
+
+Either format may be gzip or xz compressed (``.gz``/``.xz``), and long
+sniffing sessions may be rotated into numbered parts
+(``sniff_data_<timestamp>.0000.txt.gz``, ``.0001.txt.gz``, ...). Naming the
+set or its first part reads all parts in order as one stream.
+
+Readers yield ``(timestamp, channel, data)`` tuples, with timestamp None when
+the capture has none. Given a filter.RecordFilter, they skip records it
+doesn't want before parsing their data.
+"""
+import glob
+import gzip
+import io
+import lzma
+import math
+import os
+import queue
+import re
+import struct
+import threading
+import time
+
+MAGIC = b"FP2CAP"
+VERSION = 1
+FILE_HEADER = MAGIC + bytes([VERSION, 0])
+RECORD_HEADER = struct.Struct("<dBH")
+MAX_RECORD_LEN = 0xFFFF
+
+BINARY_EXT = ".fp2cap"
+TEXT_EXT = ".txt"
+
+READ_BLOCK_SIZE = 1024 * 1024
+FLUSH_INTERVAL = 1.0  # seconds
+
+COMPRESS_EXTS = {"gz": ".gz", "xz": ".xz"}
+GZIP_MAGIC = b"\x1f\x8b"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+PART_RE = re.compile(r"^(?P<stem>.*)\.(?P<part>\d{4})(?P<ext>\.[^.]+)(?P<comp>\.gz|\.xz)?$")
+
+class TextCaptureWriter:
+    """Writes chunks in the sniffer's text line format."""
+
+    def __init__(self, f, flush_interval=FLUSH_INTERVAL):
+        self.f = f
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        # CaptureFile owning f, when opened by open_writer
+        self.file = None
+
+    def write(self, ts, channel, data):
+        if ts is None:
+            line = f"{channel} {data.hex(' ')}"
+        else:
+            line = f"t{ts:.3f} {channel} {data.hex(' ')}"
+        self.f.write(line.rstrip(" ") + "\n")
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        # Flushing every chunk costs a syscall per few bytes; flush on a timer
+        # instead so a crash loses at most flush_interval of data.
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.f.flush()
+            self.last_flush = now
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        # Writers from open_writer also own the raw file under any compressor
+        if self.file is not None:
+            self.file.close()
+        else:
+            self.f.close()
+
+class BinaryCaptureWriter(TextCaptureWriter):
+    """Writes chunks as binary capture records."""
+
+    def __init__(self, f, flush_interval=FLUSH_INTERVAL):
+        super().__init__(f, flush_interval)
+        if f.tell() == 0:
+            f.write(FILE_HEADER)
+
+    def write(self, ts, channel, data):
+        if ts is None:
+            ts = math.nan
+        pack = RECORD_HEADER.pack
+        for i in range(0, max(len(data), 1), MAX_RECORD_LEN):
+            part = data[i:i + MAX_RECORD_LEN]
+            self.f.write(pack(ts, channel, len(part)))
+            self.f.write(part)
+        self._maybe_flush()
+
+def split_compress_ext(filename):
+    """Split a trailing .gz/.xz off a filename: (name, compression or None)."""
+    for compress, ext in COMPRESS_EXTS.items():
+        if filename.endswith(ext):
+            return filename[:-len(ext)], compress
+    return filename, None
+
+class CaptureFile:
+    """Output file, optionally compressed, that knows its size on disk."""
+
+    def __init__(self, filename, text, compress=None):
+        self.raw = open(filename, "wb")
+        if compress == "gz":
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode="wb")
+        elif compress == "xz":
+            self.stream = lzma.LZMAFile(self.raw, "wb")
+        else:
+            self.stream = self.raw
+        self.f = io.TextIOWrapper(self.stream, encoding="ascii", newline="\n") if text else self.stream
+
+    def disk_size(self):
+        return self.raw.tell()
+
+    def close(self):
+        self.f.close()
+        if not self.raw.closed:
+            self.raw.close()
+
+def open_writer(filename, fmt=None, compress=None, flush_interval=FLUSH_INTERVAL):
+    """Open a capture writer.
+
+    fmt is "text" or "bin" and compress None, "gz" or "xz"; both default from
+    the extension (e.g. capture.fp2cap.gz).
+    """
+    name, ext_compress = split_compress_ext(filename)
+    if compress is None:
+        compress = ext_compress
+    if fmt is None:
+        fmt = "bin" if name.endswith(BINARY_EXT) else "text"
+    out = CaptureFile(filename, fmt != "bin", compress)
+    cls = BinaryCaptureWriter if fmt == "bin" else TextCaptureWriter
+    writer = cls(out.f, flush_interval)
+    writer.file = out
+    return writer
+
+def part_path(filename, part):
+    """Filename of one part of a rotated set: name.txt.gz -> name.0003.txt.gz"""
+    name, compress = split_compress_ext(filename)
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{part:04d}{ext}{COMPRESS_EXTS.get(compress, '')}"
+
+class ThreadedCaptureWriter:
+    """Capture writer that does all file I/O on a background thread.
+
+    write() only appends to a queue. The thread wakes every flush_interval,
+    writes everything queued as one batch, flushes, and rotates to a new
+    part when the current one reaches rotate_bytes (on disk, i.e. after
+    compression; xz buffers a lot internally, so parts may overshoot) or
+    has been open rotate_seconds. Without rotation the capture goes to
+    filename itself, otherwise to part_path(filename, n).
+    """
+
+    def __init__(self, filename, fmt=None, compress=None, flush_interval=FLUSH_INTERVAL,
+                 rotate_bytes=None, rotate_seconds=None):
+        if compress is not None and split_compress_ext(filename)[1] is None:
+            filename += COMPRESS_EXTS[compress]
+        self.filename = filename
+        self.fmt = fmt
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.rotating = bool(rotate_bytes or rotate_seconds)
+        self.part = -1
+        self.paths = []
+        self.writer = None
+        self.opened = 0.0
+        self.records = 0
+        self.error = None
+        self.pending = queue.SimpleQueue()
+        self.stop = threading.Event()
+        self._open_next()
+        self.thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self.thread.start()
+
+    def _open_next(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.part += 1
+        path = part_path(self.filename, self.part) if self.rotating else self.filename
+        # The thread flushes explicitly, so the writer's own timer is off
+        self.writer = open_writer(path, self.fmt, self.compress, flush_interval=math.inf)
+        self.paths.append(path)
+        self.opened = time.monotonic()
+        self.part_records = 0
+
+    def _should_rotate(self):
+        if not self.part_records:
+            return False
+        if self.rotate_bytes and self.writer.file.disk_size() >= self.rotate_bytes:
+            return True
+        if self.rotate_seconds and time.monotonic() - self.opened >= self.rotate_seconds:
+            return True
+        return False
+
+    def _write_pending(self):
+        get = self.pending.get_nowait
+        write = self.writer.write
+        while True:
+            try:
+                ts, channel, data = get()
+            except queue.Empty:
+                break
+            write(ts, channel, data)
+            self.records += 1
+            self.part_records += 1
+        self.writer.flush()
+        # Once closing, the batch just written is the last one: rotating
+        # would only leave an empty part behind
+        if self.rotating and not self.stop.is_set() and self._should_rotate():
+            self._open_next()
+
+    def _run(self):
+        try:
+            while not self.stop.wait(self.flush_interval):
+                self._write_pending()
+            self._write_pending()
+        except Exception as e:
+            self.error = e
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"capture writer failed: {self.error}") from self.error
+
+    def write(self, ts, channel, data):
+        self._check()
+        self.pending.put((ts, channel, bytes(data)))
+
+    def flush(self):
+        """No-op: the thread flushes every batch within flush_interval."""
+        self._check()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.writer.close()
+        self._check()
+
+def parse_text_line(line, record_filter=None):
+    """Parse one text capture line into (timestamp, channel, data), or None.
+
+    Also None for lines record_filter skips, without decoding their hex.
+    """
+    items = line.split(None, 1)
+    if not items:
+        return None
+    ts = None
+    # Auto-detect timestamp
+    if items[0].startswith("t"):
+        try:
+            ts = float(items[0][1:])
+        except ValueError:
+            pass
+        if len(items) < 2:
+            return None
+        items = items[1].split(None, 1)
+    try:
+        channel = int(items[0])
+        if record_filter is not None and not record_filter.wants(channel, ts):
+            return None
+        data = bytes.fromhex(items[1]) if len(items) > 1 else b""
+    except ValueError:
+        return None
+    return ts, channel, data
+
+def read_text_records(f, record_filter=None):
+    for line in f:
+        record = parse_text_line(line, record_filter)
+        if record is not None:
+            yield record
+
+def read_text_records_with_offsets(f):
+    # f must be opened in binary mode so offsets are byte positions
+    offset = f.tell()
+    for line in f:
+        record = parse_text_line(line.decode("ascii", "replace"))
+        if record is not None:
+            yield (offset,) + record
+        offset += len(line)
+
+def check_file_header(header):
+    if header[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a binary capture file")
+    if header[len(MAGIC)] != VERSION:
+        raise ValueError(f"unsupported capture version {header[len(MAGIC)]}")
+
+def read_binary_records_with_offsets(f, record_filter=None):
+    check_file_header(f.read(len(FILE_HEADER)))
+    wants = record_filter.wants if record_filter is not None else None
+
+    unpack_from = RECORD_HEADER.unpack_from
+    hdr_size = RECORD_HEADER.size
+    isnan = math.isnan
+    buf = b""
+    buf_offset = len(FILE_HEADER)
+    while True:
+        block = f.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+        buf = buf + block if buf else block
+        pos = 0
+        n = len(buf)
+        while pos + hdr_size <= n:
+            ts, channel, length = unpack_from(buf, pos)
+            end = pos + hdr_size + length
+            if end > n:
+                break
+            ts = None if isnan(ts) else ts
+            if wants is None or wants(channel, ts):
+                yield buf_offset + pos, ts, channel, buf[pos + hdr_size:end]
+            pos = end
+        buf = buf[pos:]
+        buf_offset += pos
+    # A truncated final record (sniffer killed mid-write) is ignored
+
+def read_binary_records(f, record_filter=None):
+    for offset, ts, channel, data in read_binary_records_with_offsets(f, record_filter):
+        yield ts, channel, data
+
+def open_input(filename):
+    """Open a capture part for binary reading, decompressing gzip/xz by content."""
+    f = open(filename, "rb")
+    head = f.read(len(XZ_MAGIC))
+    f.seek(0)
+    if head.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    if head == XZ_MAGIC:
+        return lzma.LZMAFile(f, "rb")
+    return f
+
+def is_compressed(filename):
+    with open(filename, "rb") as f:
+        head = f.read(len(XZ_MAGIC))
+    return head.startswith(GZIP_MAGIC) or head == XZ_MAGIC
+
+def capture_parts(filename):
+    """The files making up a capture, in order.
+
+    That is filename itself, unless it is the first part of a rotated set
+    (name.0000.txt.gz) or the name the set was written under (name.txt.gz,
+    which does not exist on disk); then it is every part of the set.
+    """
+    m = PART_RE.match(filename)
+    if os.path.exists(filename) and (m is None or int(m["part"]) != 0):
+        return [filename]
+    if m is not None:
+        stem, ext = m["stem"], m["ext"]
+    else:
+        stem, ext = os.path.splitext(split_compress_ext(filename)[0])
+    parts = []
+    for path in glob.glob(glob.escape(stem) + ".[0-9][0-9][0-9][0-9]" + glob.escape(ext) + "*"):
+        pm = PART_RE.match(path)
+        if pm is not None and pm["stem"] == stem and pm["ext"] == ext:
+            parts.append((int(pm["part"]), path))
+    if not parts:
+        return [filename]
+    return [path for _, path in sorted(parts)]
+
+def check_seekable_capture(filename):
+    """Raise ValueError unless filename is one plain file that can be indexed/mmapped."""
+    parts = capture_parts(filename)
+    if len(parts) != 1 or is_compressed(parts[0]):
+        raise ValueError(f"{filename}: random access needs a single uncompressed capture (see convert)")
+
+def detect_format(filename):
+    with open_input(capture_parts(filename)[0]) as f:
+        head = f.read(len(MAGIC))
+    return "bin" if head == MAGIC else "text"
+
+def _read_part(filename, record_filter=None):
+    with open_input(filename) as f:
+        if f.read(len(MAGIC)) == MAGIC:
+            f.seek(0)
+            yield from read_binary_records(f, record_filter)
+        else:
+            f.seek(0)
+            yield from read_text_records(io.TextIOWrapper(f, encoding="ascii", errors="replace"), record_filter)
+
+def read_records(filename, record_filter=None):
+    """Yield (timestamp, channel, data) from a capture of either format.
+
+    Compressed captures and rotated sets read as one stream.
+    """
+    for path in capture_parts(filename):
+        yield from _read_part(path, record_filter)
+
+def read_records_with_offsets(filename):
+    """Like read_records, but prefixes each record with its file offset.
+
+    Offsets are only meaningful for a single uncompressed file.
+    """
+    check_seekable_capture(filename)
+    with open(filename, "rb") as f:
+        if detect_format(filename) == "bin":
+            yield from read_binary_records_with_offsets(f)
+        else:
+            yield from read_text_records_with_offsets(f)
+
+def records_between(buf, offset, end, fmt):
+    """Yield (offset, ts, channel, data) for the records of an in-memory capture
+    (e.g. an mmap) starting at offset, up to the first one starting at or after end."""
+    n = len(buf)
+    if fmt == "bin":
+        unpack_from = RECORD_HEADER.unpack_from
+        hdr_size = RECORD_HEADER.size
+        while offset < end and offset + hdr_size <= n:
+            ts, channel, length = unpack_from(buf, offset)
+            stop = offset + hdr_size + length
+            if stop > n:
+                return
+            yield offset, (None if math.isnan(ts) else ts), channel, buf[offset + hdr_size:stop]
+            offset = stop
+    else:
+        while offset < end and offset < n:
+            stop = buf.find(b"\n", offset)
+            if stop == -1:
+                stop = n
+            record = parse_text_line(buf[offset:stop].decode("ascii", "replace"))
+            if record is not None:
+                yield (offset,) + record
+            offset = stop + 1
+
+def records_at(buf, offset, fmt):
+    """Yield (ts, channel, data) from an in-memory capture (e.g. an mmap), starting at offset."""
+    for record in records_between(buf, offset, len(buf), fmt):
+        yield record[1:]
+
+def record_boundaries(buf, fmt, targets):
+    """Offset of the first record starting at or after each of the sorted byte targets."""
+    n = len(buf)
+    out = []
+    if fmt == "bin":
+        unpack_from = RECORD_HEADER.unpack_from
+        hdr_size = RECORD_HEADER.size
+        offset = len(FILE_HEADER)
+        for target in targets:
+            # Only the record headers are read while walking; target 0 is the first record
+            while offset < target and offset + hdr_size <= n:
+                offset += hdr_size + unpack_from(buf, offset)[2]
+            out.append(offset if offset + hdr_size <= n else n)
+    else:
+        for target in targets:
+            if target <= 0:
+                out.append(0)
+                continue
+            newline = buf.find(b"\n", target - 1)
+            out.append(n if newline == -1 else newline + 1)
+    return out
+
+def iter_packets(records, framers=None):
+    """Frame a stream of (offset, ts, channel, data) records.
+
+    Yields (ts, channel, offset, skip, packet) for every framed packet, where
+    ts and offset belong to the record holding the packet's first byte and
+    skip is the position of that byte within the record's data. Records may
+    also be plain (ts, channel, data) tuples, in which case offset is None.
+    """
+    from collections import deque
+    from .framer import Framer
+
+    if framers is None:
+        framers = [Framer(0), Framer(1)]
+    # Per channel: (stream offset, file offset, ts) of records that may still
+    # hold the start of a packet
+    pending = [deque() for _ in framers]
+    stream_pos = [0] * len(framers)
+
+    for record in records:
+        if len(record) == 3:
+            offset = None
+            ts, channel, data = record
+        else:
+            offset, ts, channel, data = record
+        framer = framers[channel]
+        chunks = pending[channel]
+        chunks.append((stream_pos[channel], offset, ts))
+        stream_pos[channel] += len(data)
+
+        for packet in framer.feed(data):
+            while len(chunks) > 1 and chunks[1][0] <= packet.offset:
+                chunks.popleft()
+            chunk_pos, chunk_offset, chunk_ts = chunks[0]
+            yield chunk_ts, channel, chunk_offset, packet.offset - chunk_pos, packet
+
+        # Forget records the framer has fully consumed
+        consumed = framer.base + framer.start
+        while len(chunks) > 1 and chunks[1][0] <= consumed:
+            chunks.popleft()
+
+def convert(src, dst, fmt=None):
+    """Convert a capture between text and binary.
+
+    fmt is the output format; by default it is the opposite of the input.
+    Returns the number of records written.
+    """
+    if fmt is None:
+        fmt = "text" if detect_format(src) == "bin" else "bin"
+    writer = open_writer(dst, fmt)
+    count = 0
+    try:
+        for ts, channel, data in read_records(src):
+            writer.write(ts, channel, data)
+            count += 1
+    finally:
+        writer.close()
+    return count
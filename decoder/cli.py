@@ -1,50 +1,299 @@
 import argparse
+import os
 import sys
-from .framer import Framer
-from .protocol import decode_packet
+from .protocol import decode_record, render_record, csv_header, OUTPUT_FORMATS, TYPE_NAMES
+from .capture import read_records, convert, iter_packets, split_compress_ext, PART_RE, TEXT_EXT, BINARY_EXT
+
+# transform.MOUNT_NAMES, kept here so parsing arguments doesn't import NumPy
+MOUNT_CHOICES = ("wall", "left-corner", "right-corner")
 
 def parse_line_generator(filename):
-    """Generator that yields (channel, data_bytes) tuples from a file."""
+    """Generator that yields (channel, data_bytes) tuples from a capture file.
+
+    Both the text and the binary capture formats are accepted.
+    """
     try:
-        with open(filename, "r") as f:
-            for line in f:
-                items = line.strip().split(" ")
-                if not items:
-                    continue
-                # Auto-detect timestamp and ignore it
-                if items[0].startswith("t"):
-                    items.pop(0)
-                    if not items:
-                        continue
-                
-                try:
-                    channel = int(items[0])
-                    # Optimized hex parsing
-                    dps_bytes = bytearray(int(x, 16) for x in items[1:])
-                    yield channel, dps_bytes
-                except ValueError:
-                    continue
+        for ts, channel, data in read_records(filename):
+            yield channel, data
     except FileNotFoundError:
         print(f"File not found: {filename}")
         return
 
+def expand_capture_paths(paths):
+    """Expand directories into the capture files they contain.
+
+    Rotated sets are listed once, by their first part, which reads them all.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                m = PART_RE.match(name)
+                if m is not None and int(m["part"]) != 0:
+                    continue
+                if split_compress_ext(name)[0].endswith((TEXT_EXT, BINARY_EXT)):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
 def handle_decode(args):
-    print(f"\n{'='*20} {args.file} {'='*20}")
-    
-    framers = [Framer(0), Framer(1)]
-    
-    # Callback to print packets as they are framed
-    # Callback to print packets as they are framed
-    def print_packet(channel, packet):
-        lines = decode_packet(channel, packet, exclude_names=args.exclude)
-        for line in lines:
-            print(line)
-
-    for channel, data in parse_line_generator(args.file):
-        framers[channel].add(data)
-        while framers[channel].packets:
-            packet = framers[channel].packets.pop(0)
-            print_packet(channel, packet)
+    files = expand_capture_paths(args.file)
+
+    if args.summary:
+        summarize_files(args, files)
+        return
+
+    if args.format == "csv":
+        print(csv_header())
+
+    shadow = None
+    if args.shadow:
+        from .shadow import DeviceShadow
+        shadow = DeviceShadow.load(args.shadow) if os.path.exists(args.shadow) else DeviceShadow()
+
+    room = None
+    if args.locate:
+        from .transform import make_tracker
+        room = make_tracker(args.mount, shadow)
+
+    if args.jobs != 1 and not uses_index(args) and shadow is None and room is None and args.filter is None:
+        from .parallel import decode_files
+        for path, chunks in decode_files(files, exclude_names=args.exclude, jobs=args.jobs, fmt=args.format):
+            if args.format == "text":
+                print(f"\n{'='*20} {path} {'='*20}")
+            for text in chunks:
+                print(text)
+        return
+
+    for path in files:
+        decode_file(args, path, shadow, room)
+    if shadow is not None:
+        shadow.save(args.shadow)
+
+def uses_index(args):
+    return args.t_from is not None or args.t_to is not None or args.sub is not None
+
+def summarize_files(args, files):
+    """decode --summary: one constant-memory summary of every file, without decoding."""
+    from .summary import Summary
+    from .framer import Framer
+    summary = Summary()
+    flt = args.filter
+    for path in files:
+        try:
+            if uses_index(args):
+                for ts, channel, packet in query_index(args, path):
+                    if flt is None or flt.match_packet(ts, channel, packet):
+                        summary.add_packet(ts, channel, packet)
+                continue
+            if flt is not None:
+                framers = flt.framers()
+                packets = iter_packets(read_records(path, flt.record_filter()), framers)
+            else:
+                framers = [Framer(0), Framer(1)]
+                packets = iter_packets(read_records(path), framers)
+            for ts, channel, offset, skip, packet in packets:
+                if flt is None or not flt.needs_packet_check or flt.match_packet(ts, channel, packet):
+                    summary.add_packet(ts, channel, packet)
+            summary.add_framers(framers)
+        except FileNotFoundError:
+            print(f"File not found: {path}", file=sys.stderr)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+    if args.format == "jsonl":
+        print(summary.to_json())
+    else:
+        print("\n".join(summary.table()))
+
+def decode_file(args, path, shadow=None, room=None):
+    fmt = args.format
+    if fmt == "text":
+        print(f"\n{'='*20} {path} {'='*20}")
+
+    # Print packets as they are framed
+    def print_packet(ts, channel, packet):
+        if shadow is not None or room is not None:
+            # The shadow and the room tracker see excluded attributes too
+            rec = decode_record(channel, packet)
+            if shadow is not None:
+                shadow.update(ts, rec)
+            if room is not None:
+                room.update(ts, rec)
+            if args.exclude and rec.name in args.exclude:
+                return
+        else:
+            rec = decode_record(channel, packet, exclude_names=args.exclude)
+        if rec is not None:
+            print(render_record(rec, ts, fmt))
+            if room is not None and rec.targets and fmt == "text":
+                print("\n".join(room.format_targets(rec.targets)))
+
+    flt = args.filter
+    if uses_index(args):
+        # Jump straight to the matching packets through the index
+        try:
+            for ts, channel, packet in query_index(args, path):
+                if flt is None or flt.match_packet(ts, channel, packet):
+                    print_packet(ts, channel, packet)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+        return
+
+    if flt is not None:
+        # Skip records and frames that can't match before decoding anything.
+        # A shadow still sees only the matching packets.
+        records = read_records(path, flt.record_filter())
+        packets = iter_packets(records, flt.framers())
+        if flt.needs_packet_check:
+            packets = (p for p in packets if flt.match_packet(p[0], p[1], p[4]))
+    else:
+        packets = iter_packets(read_records(path))
+    try:
+        for ts, channel, offset, skip, packet in packets:
+            print_packet(ts, channel, packet)
+    except FileNotFoundError:
+        print(f"File not found: {path}")
+
+def parse_time_arg(s):
+    """Parse --from/--to: absolute Unix time, or "+seconds" from the capture start."""
+    if s.startswith("+"):
+        return float(s[1:]), True
+    return float(s), False
+
+def parse_int_list(s):
+    return [int(x, 0) for x in s.split(",")]
+
+def parse_filter(s):
+    from .filter import compile_filter
+    try:
+        return compile_filter(s)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def query_index(args, path):
+    from .index import open_index, select, CaptureReader
+    import numpy as np
+
+    index = open_index(path, rebuild=args.reindex)
+    start_ts = float(np.nanmin(index["ts"])) if len(index) and not np.isnan(index["ts"]).all() else 0.0
+
+    def resolve(arg):
+        if arg is None:
+            return None
+        value, relative = arg
+        return start_ts + value if relative else value
+
+    rows = select(index, t_from=resolve(args.t_from), t_to=resolve(args.t_to), sub_ids=args.sub)
+    with CaptureReader(path) as reader:
+        yield from reader.packets(rows)
+
+def handle_index(args):
+    from .index import build_index, index_path
+    count = build_index(args.file)
+    print(f"Indexed {count} packets into {index_path(args.file)}")
+
+def handle_convert(args):
+    count = convert(args.src, args.dst, args.format)
+    print(f"Wrote {count} records to {args.dst}")
+
+def handle_tracks(args):
+    from .tracks import extract_tracks_from_file
+    tracks = extract_tracks_from_file(args.file)
+    print(f"{len(tracks)} targets in {len(tracks.frame_times)} reports, tids: {tracks.tids().tolist()}")
+    if args.out:
+        tracks.save(args.out)
+        print(f"Wrote {args.out}")
+
+def handle_series(args):
+    from .series import extract_series_from_file
+    extractor = extract_series_from_file(args.file, args.heatmap_window)
+    print("\n".join(extractor.summary()))
+    if args.out:
+        for path in extractor.save(args.out):
+            print(f"Wrote {path}")
+
+def handle_maps(args):
+    from .gridmap import MapHistory
+    history = MapHistory()
+    names = {}
+    records = read_records(args.file)
+    for ts, channel, offset, skip, packet in iter_packets(records):
+        rec = decode_record(channel, packet)
+        if rec is None or rec.grid is None or rec.typ == 4:
+            continue
+        previous, added, removed = history.update(rec.sub_id, rec.zone_id, rec.grid)
+        if previous is not None and not added and not removed and not args.all:
+            continue
+        where = rec.name if rec.zone_id is None else f"{rec.name} zone {rec.zone_id}"
+        names[rec.sub_id, rec.zone_id] = where
+        when = "" if ts is None else f"t{ts:.3f} "
+        change = "new" if previous is None else f"+{added.count()} -{removed.count()}"
+        print(f"{when}{rec.direction} {TYPE_NAMES.get(rec.typ, rec.typ)} {where}: {rec.grid.count()} cells ({change})")
+        if args.show:
+            for line in rec.grid.render():
+                print(f"    {line}")
+
+    # Cells claimed by more than one configured map
+    latest = [(names[key], grid) for key, grid in history.maps.items()]
+    for i, (name_a, a) in enumerate(latest):
+        for name_b, b in latest[i+1:]:
+            shared = a & b
+            if shared:
+                print(f"overlap {name_a} / {name_b}: {shared.count()} cells")
+
+def handle_shadow(args):
+    from .shadow import run_shadow
+    run_shadow(args)
+
+def handle_firmware(args):
+    from .xmodem import run_firmware
+    run_firmware(args)
+
+def handle_correlate(args):
+    from .correlate import run_correlate
+    run_correlate(args)
+
+def handle_occupancy(args):
+    from .occupancy import run_occupancy
+    run_occupancy(args)
+
+def handle_replay(args):
+    from .replay import run_replay
+    run_replay(args)
+
+def handle_bench(args):
+    from .bench import run_bench
+    run_bench(args)
+
+def parse_weights(s):
+    """Parse "name=weight,name=weight" (weight defaults to 1)."""
+    weights = {}
+    for item in s.split(","):
+        name, _, weight = item.partition("=")
+        weights[name] = float(weight) if weight else 1.0
+    return weights
+
+def handle_synth(args):
+    from .synth import TrafficGenerator, SyntheticCapture, Corruptor
+    generator = TrafficGenerator(mix=args.mix, kinds=args.kinds, acks=not args.no_acks,
+                                 xmodem_bytes=args.xmodem, seed=args.seed)
+    corruptor = None
+    if args.flip or args.drop or args.garbage:
+        corruptor = Corruptor(args.flip, args.drop, args.garbage, seed=args.seed)
+    capture = SyntheticCapture(generator, args.count, corruptor)
+    if corruptor is not None:
+        print(f"Corruption events: {corruptor.events}")
+    if args.out:
+        count = capture.write(args.out, seed=args.seed)
+        print(f"Wrote {count} records to {args.out}")
+    if args.check or not args.out:
+        result = capture.check(seed=args.seed)
+        print(f"Framed {result['bytes']} bytes in {result['seconds']:.2f}s ({result['bytes_per_s'] / 1e6:.2f} MB/s)")
+        for channel, name in ((0, "ESP->Radar"), (1, "Radar->ESP")):
+            r = result[channel]
+            print(f"{name}: sent {r['sent']}, intact {r['intact']}, recovered {r['recovered']}, "
+                  f"lost {r['lost']}, false {r['false']}, xmodem blocks {r['xmodem_blocks']}, resyncs {r['resyncs']}")
 
 def handle_sniff(args):
     from .sniffer import run_sniffer
@@ -55,18 +304,158 @@ def main():
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # Decode subcommand
-    decode_parser = subparsers.add_parser("decode", help="Decode a capture file")
-    decode_parser.add_argument("file", help="Path to the capture file")
+    decode_parser = subparsers.add_parser("decode", help="Decode capture files")
+    decode_parser.add_argument("file", nargs="+", help="Capture files, or directories of them")
+    decode_parser.add_argument("--format", "-f", choices=OUTPUT_FORMATS, default="text", help="Output format (default: text)")
+    decode_parser.add_argument("--jobs", "-j", type=int, default=1, help="Decode on this many worker processes (0 = one per CPU)")
     decode_parser.add_argument("--exclude", "-x", help="Exclude attributes by name (comma separated)", type=lambda s: s.split(","))
+    decode_parser.add_argument("--from", dest="t_from", type=parse_time_arg, help="Only packets at or after this time (Unix time, or +seconds from capture start). Uses the index")
+    decode_parser.add_argument("--to", dest="t_to", type=parse_time_arg, help="Only packets before this time (Unix time, or +seconds from capture start). Uses the index")
+    decode_parser.add_argument("--sub", type=parse_int_list, help="Only these sub_ids (comma separated, e.g. 0x0114,0x0117). Uses the index")
+    decode_parser.add_argument("--filter", "-F", type=parse_filter, help='Only packets matching this expression over ch, typ, seq, sub, len and t, e.g. "sub in {0x0117, 0x0142} and typ == REP and ch == 1"')
+    decode_parser.add_argument("--summary", "-S", help="Print counts, bytes, rates, payload sizes and drops per attribute instead of every packet (as JSON with -f jsonl)", action="store_true")
+    decode_parser.add_argument("--reindex", help="Rebuild the capture index before querying it", action="store_true")
+    decode_parser.add_argument("--shadow", help="Device state snapshot (JSON) to restore from if present, update while decoding and save", default=None)
+    decode_parser.add_argument("--locate", help="Print each target's room position, grid cell and zones (text output)", action="store_true")
+    decode_parser.add_argument("--mount", choices=MOUNT_CHOICES, help="Mounting mode until the capture sets one (default: left-corner, or the --shadow one)")
     decode_parser.set_defaults(func=handle_decode)
 
+    # Index subcommand
+    index_parser = subparsers.add_parser("index", help="Build the sidecar packet index of a capture file")
+    index_parser.add_argument("file", help="Path to the capture file")
+    index_parser.set_defaults(func=handle_index)
+
+    # Convert subcommand
+    convert_parser = subparsers.add_parser("convert", help="Convert a capture between text and binary format")
+    convert_parser.add_argument("src", help="Capture file to read (format is auto-detected)")
+    convert_parser.add_argument("dst", help="Capture file to write")
+    convert_parser.add_argument("--format", "-f", choices=["text", "bin"], help="Output format (default: the other one)")
+    convert_parser.set_defaults(func=handle_convert)
+
+    # Tracks subcommand
+    tracks_parser = subparsers.add_parser("tracks", help="Extract location_track_data targets into columns")
+    tracks_parser.add_argument("file", help="Path to the capture file")
+    tracks_parser.add_argument("--out", "-o", help="Output file (.npz, .parquet or .csv)")
+    tracks_parser.set_defaults(func=handle_tracks)
+
+    # Series subcommand
+    series_parser = subparsers.add_parser("series", help="Extract sleep, people counting, posture and heatmap reports into typed time series")
+    series_parser.add_argument("file", help="Path to the capture file")
+    series_parser.add_argument("--out", "-o", help="Save each series as <out>.<attribute>.<ext> (.npz, .parquet or .csv)")
+    series_parser.add_argument("--heatmap-window", type=int, default=60, help="Heatmap frames in the rolling mean (default: 60)")
+    series_parser.set_defaults(func=handle_series)
+
+    # Maps subcommand
+    maps_parser = subparsers.add_parser("maps", help="Show zone/label map writes and how each changed")
+    maps_parser.add_argument("file", help="Path to the capture file")
+    maps_parser.add_argument("--show", help="Print every changed map", action="store_true")
+    maps_parser.add_argument("--all", help="Also list maps that did not change", action="store_true")
+    maps_parser.set_defaults(func=handle_maps)
+
+    # Correlate subcommand
+    correlate_parser = subparsers.add_parser("correlate", help="Pair requests with their ACKs/answers and report latencies, misses and seq gaps")
+    correlate_parser.add_argument("file", help="Path to the capture file")
+    correlate_parser.add_argument("--timeout", type=float, default=1000, help="Milliseconds before a request counts as unanswered (default: 1000)")
+    correlate_parser.add_argument("--json", help="Print the report as JSON", action="store_true")
+    correlate_parser.set_defaults(func=handle_correlate)
+
+    # Occupancy subcommand
+    occupancy_parser = subparsers.add_parser("occupancy", help="Rebuild zone occupancy from the tracks and check the radar's zone events against it")
+    occupancy_parser.add_argument("file", help="Path to the capture file")
+    occupancy_parser.add_argument("--mount", choices=MOUNT_CHOICES, help="Mounting mode until the capture sets one (default: left-corner)")
+    occupancy_parser.add_argument("--max-latency", type=float, default=30.0, help="Seconds between an event and a transition of its zone for them to match (default: 30)")
+    occupancy_parser.add_argument("--hold", type=float, default=1.0, help="Merge occupancy runs of a zone separated by less than this many seconds (default: 1)")
+    occupancy_parser.add_argument("--json", help="Print the report as JSON", action="store_true")
+    occupancy_parser.add_argument("--out", "-o", help="Save the per-report timeline, tracks and radar state per zone (.npz, .parquet or .csv)")
+    occupancy_parser.set_defaults(func=handle_occupancy)
+
+    # Shadow subcommand
+    shadow_parser = subparsers.add_parser("shadow", help="Show the device state at the end of captures, or every change to it")
+    shadow_parser.add_argument("file", nargs="+", help="Capture files, in order")
+    shadow_parser.add_argument("--changes", "-c", help="Print each change as it happens instead of the final state", action="store_true")
+    shadow_parser.add_argument("--load", help="Start from this snapshot (JSON)", default=None)
+    shadow_parser.add_argument("--save", help="Save the final state as a snapshot (JSON)", default=None)
+    shadow_parser.set_defaults(func=handle_shadow)
+
+    # Firmware subcommand
+    firmware_parser = subparsers.add_parser("firmware", help="Reassemble and check XMODEM firmware transfers (OTA)")
+    firmware_parser.add_argument("file", help="Path to the capture file")
+    firmware_parser.add_argument("--out", "-o", help="Write the image here (later transfers to <out>.N.<ext>)", default=None)
+    firmware_parser.set_defaults(func=handle_firmware)
+
     # Sniff subcommand
     sniff_parser = subparsers.add_parser("sniff", help="Sniff UART in real-time (requires Glasgow)")
     sniff_parser.add_argument("--out", "-o", help="Output file for raw capture", default=None)
+    sniff_parser.add_argument("--format", "-f", choices=["text", "bin"], help="Raw capture format (default: from --out extension, else text)", default=None)
+    sniff_parser.add_argument("--compress", "-z", choices=["gz", "xz"], help="Compress the raw capture (default: from --out extension)", default=None)
+    sniff_parser.add_argument("--rotate-size", type=float, help="Start a new capture part after this many MiB on disk", default=None)
+    sniff_parser.add_argument("--rotate-time", type=float, help="Start a new capture part every this many minutes", default=None)
+    sniff_parser.add_argument("--flush-interval", type=float, help="Seconds between batched capture writes (default: 1)", default=1.0)
     sniff_parser.add_argument("--exclude", "-x", help="Exclude attributes by name (comma separated)", type=lambda s: s.split(","))
     sniff_parser.add_argument("--visualize", "-v", help="Open visualization window for target positions", action="store_true")
+    sniff_parser.add_argument("--trail", type=int, default=0, help="With --visualize, draw fading trails of this many positions per target")
+    sniff_parser.add_argument("--queue-size", type=int, help="Decoded packets buffered for decoding/printing before dropping (default: 4096)")
+    sniff_parser.add_argument("--stats-interval", type=float, default=10.0, help="Seconds between link stats lines on stderr (0 = off, default: 10)")
+    sniff_parser.add_argument("--metrics-port", type=int, help="Serve Prometheus text metrics on this local port", default=None)
+    sniff_parser.add_argument("--firmware-out", help="Save firmware images sent over XMODEM (OTA) to this file", default=None)
+    sniff_parser.add_argument("--shadow", help="Device state snapshot (JSON) to restore from if present, keep updated and save on exit", default=None)
+    sniff_parser.add_argument("--filter", "-F", type=parse_filter, help="Only decode packets matching this expression (see decode --filter); the raw capture keeps everything")
+    sniff_parser.add_argument("--summary-window", type=float, help="Print a per-attribute summary of the last this many seconds with every stats line", default=None)
+    sniff_parser.add_argument("--locate", help="Print each target's room position, grid cell and zones", action="store_true")
+    sniff_parser.add_argument("--mount", choices=MOUNT_CHOICES, help="Mounting mode for --locate and --visualize until one is seen (default: left-corner, or the --shadow one)")
+    sniff_parser.add_argument("--correlate", help="Pair requests with their answers and print ACK latencies on exit", action="store_true")
     # Add Glasgow args if needed, or pass them through
     sniff_parser.set_defaults(func=handle_sniff)
 
+    # Replay subcommand
+    replay_parser = subparsers.add_parser("replay", help="Feed a capture through the live sniffer pipeline, for load testing")
+    replay_parser.add_argument("file", help="Path to the capture file")
+    replay_parser.add_argument("--speed", "-s", type=float, default=1.0, help="Replay speed relative to the recording (0 = as fast as possible, default: 1)")
+    replay_parser.add_argument("--sweep", help="Double the speed until the pipeline falls behind and report the highest sustained packet rate", action="store_true")
+    replay_parser.add_argument("--quiet", "-q", help="Decode and format as usual but discard the printed output", action="store_true")
+    replay_parser.add_argument("--out", "-o", help="Also write the replayed chunks to this raw capture", default=None)
+    replay_parser.add_argument("--exclude", "-x", help="Exclude attributes by name (comma separated)", type=lambda s: s.split(","))
+    replay_parser.add_argument("--visualize", "-v", help="Open visualization window for target positions", action="store_true")
+    replay_parser.add_argument("--trail", type=int, default=0, help="With --visualize, draw fading trails of this many positions per target")
+    replay_parser.add_argument("--stats-interval", type=float, default=0, help="Seconds between link stats lines on stderr (default: off)")
+    replay_parser.add_argument("--metrics-port", type=int, help="Serve Prometheus text metrics on this local port", default=None)
+    replay_parser.add_argument("--firmware-out", help="Save firmware images sent over XMODEM (OTA) to this file", default=None)
+    replay_parser.add_argument("--filter", "-F", type=parse_filter, help="Only decode packets matching this expression (see decode --filter)")
+    replay_parser.add_argument("--summary-window", type=float, help="Print a per-attribute summary of the last this many seconds with every stats line", default=None)
+    replay_parser.add_argument("--locate", help="Print each target's room position, grid cell and zones", action="store_true")
+    replay_parser.add_argument("--mount", choices=MOUNT_CHOICES, help="Mounting mode for --locate and --visualize until the capture sets one (default: left-corner)")
+    replay_parser.add_argument("--correlate", help="Pair requests with their answers and print ACK latencies at the end", action="store_true")
+    replay_parser.set_defaults(func=handle_replay)
+
+    # Synth subcommand
+    synth_parser = subparsers.add_parser("synth", help="Generate synthetic traffic, optionally corrupted, and check the framer against it")
+    synth_parser.add_argument("--out", "-o", help="Write the traffic as a capture file (.txt or .fp2cap, optionally .gz/.xz)")
+    synth_parser.add_argument("--count", "-n", type=int, default=10000, help="Number of exchanges to generate (default: 10000)")
+    synth_parser.add_argument("--mix", type=parse_weights, help="Attribute weights, e.g. location_track_data=10,temperature=1")
+    synth_parser.add_argument("--kinds", type=parse_weights, help="Exchange kind weights: report, write, request (e.g. report=5,write=1)")
+    synth_parser.add_argument("--no-acks", help="Leave out ACKs and answers", action="store_true")
+    synth_parser.add_argument("--xmodem", type=int, default=0, help="Interleave an XMODEM firmware transfer of this many bytes on the ESP side")
+    synth_parser.add_argument("--flip", type=float, default=0.0, help="Bit flips per byte")
+    synth_parser.add_argument("--drop", type=float, default=0.0, help="Dropped bytes per byte")
+    synth_parser.add_argument("--garbage", type=float, default=0.0, help="Garbage insertions per byte")
+    synth_parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    synth_parser.add_argument("--check", help="Frame the result and compare against what was sent (default without --out)", action="store_true")
+    synth_parser.set_defaults(func=handle_synth)
+
+    # Bench subcommand
+    bench_parser = subparsers.add_parser("bench", help="Run the CRC/framer/decoder microbenchmarks")
+    bench_parser.add_argument("--captures", default="test_decode", help="Directory of real captures to benchmark on (default: test_decode)")
+    bench_parser.add_argument("--only", type=lambda s: s.split(","), help="Only benchmarks whose name contains one of these (comma separated)")
+    bench_parser.add_argument("--min-time", type=float, default=0.5, help="Seconds to spend timing each benchmark (default: 0.5)")
+    bench_parser.add_argument("--no-alloc", help="Skip the tracemalloc allocation pass", action="store_true")
+    bench_parser.add_argument("--out", "-o", help="Save results as JSON")
+    bench_parser.add_argument("--compare", "-c", help="Compare against results saved earlier with --out")
+    bench_parser.set_defaults(func=handle_bench)
+
     args = parser.parse_args()
+    if args.func is handle_decode and args.summary:
+        if args.format == "csv":
+            decode_parser.error("--summary prints a table, or JSON with -f jsonl, not CSV")
+        if args.shadow:
+            decode_parser.error("--summary doesn't decode records, so it can't update --shadow")
     args.func(args)
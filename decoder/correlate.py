@@ -0,0 +1,302 @@
+"""Request/response correlation across the two UART channels.
+
+Every frame that expects an answer (REP and WRT expect an ACK, RSP expects
+the REQ carrying the value) is kept in a pending table until the answer
+shows up on the other channel or it times out. Answers usually echo the
+seq of the frame they answer (the ESP ACKing a radar REP, the ESP REQ
+answering a radar RSP), so the table is a dict keyed on (channel, seq).
+The radar answers with its own counter instead (its ACK of an ESP WRT,
+its REQ answering an ESP RSP), so every pending frame is also queued per
+(channel, sub_id, expected answer type), which radar answers and ESP
+answers without a seq match are looked up in. Both lookups are constant
+time, and pending frames expire in arrival order.
+The live pipeline frames each channel separately, so an answer can be
+decoded just before its request; unmatched answers wait in a small orphan
+table for the request to show up before they count as unsolicited.
+
+Some answers are never sent: the ESP doesn't ACK the radar's periodic
+REPs of radar_sw_version, work_mode and the like. An exchange (request
+type and attribute) that is never answered in the whole capture is
+reported as unanswered rather than as missing its answer every time;
+only exchanges answered at least once count their misses.
+
+Per channel the frames numbered from the sender's own counter (requests
+and the radar's ACKs) are checked for gaps in that counter. REQs are left
+out: the radar numbers its REQ answers with the current counter value
+without advancing it.
+"""
+import json
+import sys
+from array import array
+from collections import Counter, defaultdict, deque
+
+from .protocol import TYPE_NAMES, decode_record, direction_name
+
+RSP, WRT, ACK, REQ, REP = 1, 2, 3, 4, 5
+ESP, RADAR = 0, 1
+# Channels whose answers echo the seq of the frame they answer
+ECHO_CHANNELS = {ESP}
+# Answer type expected for each request type
+ANSWERS = {REP: ACK, WRT: ACK, RSP: REQ, REQ: ACK}
+# Answers that are only sometimes sent don't count as missing
+OPTIONAL = {REQ}
+
+# Pending frames older than this are reported as missing their answer
+TIMEOUT = 1.0  # seconds
+# Bound on pending frames when the capture has no timestamps
+MAX_PENDING = 1024
+PERCENTILES = (50, 90, 99)
+
+class Exchange:
+    __slots__ = ("channel", "seq", "typ", "sub_id", "name", "ts", "tick", "done")
+
+    def __init__(self, rec, ts, tick):
+        self.channel = rec.channel
+        self.seq = rec.seq
+        self.typ = rec.typ
+        self.sub_id = rec.sub_id
+        self.name = rec.name
+        self.ts = ts
+        self.tick = tick
+        self.done = False
+
+    @property
+    def kind(self):
+        return f"{TYPE_NAMES[self.typ]}/{TYPE_NAMES[ANSWERS[self.typ]]}"
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, -(-len(values) * p // 100) - 1))
+    return values[int(k)]
+
+class Correlator:
+    def __init__(self, timeout=TIMEOUT):
+        self.timeout = timeout
+        self.pending_seq = {}
+        self.pending_sub = defaultdict(deque)
+        self.order = deque()
+        # Answers seen before their request, keyed like pending_sub
+        self.orphans = defaultdict(deque)
+        self.orphan_order = deque()
+        self.tick = 0
+        # Keyed by (kind, attribute name)
+        self.latencies = defaultdict(lambda: array("d"))
+        self.matched = Counter()
+        self.missing = Counter()
+        self.retransmits = Counter()
+        # Answers nothing was pending for, keyed by (type name, attribute name)
+        self.unsolicited = Counter()
+        # Per channel sender counter tracking
+        self.last_seq = [None, None]
+        self.gaps = [0, 0]
+        self.skipped = [0, 0]
+        self.resets = [0, 0]
+
+    def add(self, ts, rec):
+        """Feed one decoded record (in capture order) with its timestamp."""
+        self.tick += 1
+        self._expire(ts)
+        typ = rec.typ
+        own_counter = typ != REQ
+        if typ in (ACK, REQ):
+            ex, echoed = self._answer(ts, rec)
+            if ex is None:
+                # Its seq is checked once its request shows up
+                self._orphan(ts, rec)
+                own_counter = False
+            elif echoed or rec.channel in ECHO_CHANNELS:
+                own_counter = False
+        if typ in ANSWERS:
+            self._request(ts, rec)
+        if own_counter:
+            self._check_seq(rec.channel, rec.seq)
+
+    def _request(self, ts, rec):
+        key = (rec.channel, rec.seq)
+        old = self.pending_seq.get(key)
+        ex = Exchange(rec, ts, self.tick)
+        if old is not None and not old.done and old.sub_id == rec.sub_id and old.typ == rec.typ:
+            # Same frame again before it was answered: the answer is
+            # measured from the retransmission
+            self.retransmits[ex.kind, ex.name] += 1
+            old.done = True
+        orphans = self.orphans.get((rec.channel, rec.sub_id, ANSWERS[rec.typ]))
+        while orphans and orphans[0].done:
+            orphans.popleft()
+        if orphans:
+            answer = orphans.popleft()
+            answer.done = True
+            self._matched(ex, answer.ts)
+            if answer.channel not in ECHO_CHANNELS and answer.typ != REQ:
+                self._check_seq(answer.channel, answer.seq)
+            return
+        self.pending_seq[key] = ex
+        self.pending_sub[rec.channel, rec.sub_id, ANSWERS[rec.typ]].append(ex)
+        self.order.append(ex)
+
+    def _orphan(self, ts, rec):
+        answer = Exchange(rec, ts, self.tick)
+        self.orphans[1 - rec.channel, rec.sub_id, rec.typ].append(answer)
+        self.orphan_order.append(answer)
+
+    def _matched(self, ex, ts):
+        ex.done = True
+        key = (ex.kind, ex.name)
+        self.matched[key] += 1
+        if ts is not None and ex.ts is not None:
+            # Never negative, for answers decoded before their request
+            self.latencies[key].append(max(ts - ex.ts, 0.0))
+
+    def _answer(self, ts, rec):
+        """Match an answer to its pending request; returns (exchange, echoed seq)."""
+        peer = 1 - rec.channel
+        ex = self.pending_seq.get((peer, rec.seq)) if rec.channel in ECHO_CHANNELS else None
+        echoed = (ex is not None and not ex.done and ex.sub_id == rec.sub_id
+                  and ANSWERS[ex.typ] == rec.typ)
+        if not echoed:
+            ex = None
+            q = self.pending_sub.get((peer, rec.sub_id, rec.typ))
+            while q and q[0].done:
+                q.popleft()
+            if q:
+                ex = q.popleft()
+        if ex is None:
+            return None, False
+        if self.pending_seq.get((ex.channel, ex.seq)) is ex:
+            del self.pending_seq[ex.channel, ex.seq]
+        self._matched(ex, ts)
+        return ex, echoed
+
+    def _expired(self, ex, ts):
+        if ts is not None and ex.ts is not None:
+            return ts - ex.ts > self.timeout
+        return self.tick - ex.tick > MAX_PENDING
+
+    def _expire(self, ts):
+        order = self.order
+        while order:
+            ex = order[0]
+            if not ex.done:
+                if not self._expired(ex, ts):
+                    break
+                self._give_up(ex)
+            order.popleft()
+        order = self.orphan_order
+        while order:
+            answer = order[0]
+            if not answer.done:
+                if not self._expired(answer, ts):
+                    break
+                self._unsolicited(answer)
+            order.popleft()
+
+    def _unsolicited(self, answer):
+        answer.done = True
+        # REQs may also be plain reads nobody asked for
+        if answer.typ == ACK:
+            self.unsolicited[TYPE_NAMES[answer.typ], answer.name] += 1
+        q = self.orphans[1 - answer.channel, answer.sub_id, answer.typ]
+        while q and q[0].done:
+            q.popleft()
+
+    def _give_up(self, ex):
+        ex.done = True
+        if ex.typ not in OPTIONAL:
+            self.missing[ex.kind, ex.name] += 1
+        if self.pending_seq.get((ex.channel, ex.seq)) is ex:
+            del self.pending_seq[ex.channel, ex.seq]
+        q = self.pending_sub[ex.channel, ex.sub_id, ANSWERS[ex.typ]]
+        while q and q[0].done:
+            q.popleft()
+
+    def _check_seq(self, channel, seq):
+        last = self.last_seq[channel]
+        if last is not None and seq != 0 and 0 < (last - seq) & 0xFF < 128:
+            # Behind the counter: a resend of an older frame
+            return
+        self.last_seq[channel] = seq
+        if last is None or seq == last or seq == (last + 1) & 0xFF:
+            return
+        if seq == 0:
+            # Counter restarted (device reboot)
+            self.resets[channel] += 1
+            return
+        self.gaps[channel] += 1
+        self.skipped[channel] += (seq - last - 1) & 0xFF
+
+    def finish(self):
+        """Give up on everything still pending (end of a capture)."""
+        while self.order:
+            ex = self.order.popleft()
+            if not ex.done:
+                self._give_up(ex)
+        while self.orphan_order:
+            answer = self.orphan_order.popleft()
+            if not answer.done:
+                self._unsolicited(answer)
+
+    def rows(self):
+        """One dict per (kind, attribute) seen."""
+        keys = set(self.matched) | set(self.missing) | set(self.retransmits)
+        rows = []
+        for kind, name in sorted(keys):
+            values = sorted(self.latencies.get((kind, name), ()))
+            answered = self.matched[kind, name] > 0
+            row = {
+                "kind": kind,
+                "name": name,
+                "matched": self.matched[kind, name],
+                "missing": self.missing[kind, name] if answered else 0,
+                "unanswered": 0 if answered else self.missing[kind, name],
+                "retransmits": self.retransmits[kind, name],
+            }
+            for p in PERCENTILES:
+                row[f"p{p}_ms"] = None if not values else percentile(values, p) * 1000
+            row["max_ms"] = values[-1] * 1000 if values else None
+            rows.append(row)
+        return rows
+
+    def to_dict(self):
+        return {
+            "exchanges": self.rows(),
+            "unsolicited": [{"type": typ, "name": name, "count": n}
+                            for (typ, name), n in sorted(self.unsolicited.items())],
+            "channels": [{"channel": ch, "direction": direction_name(ch), "seq_gaps": self.gaps[ch],
+                          "seq_skipped": self.skipped[ch], "seq_resets": self.resets[ch]} for ch in (0, 1)],
+        }
+
+    def report(self):
+        def ms(v):
+            return "-" if v is None else f"{v:.1f}"
+
+        lines = [f"{'exchange':8s} {'attribute':40s} {'ok':>6s} {'miss':>5s} {'unans':>5s} {'retx':>5s} "
+                 + " ".join(f"{'p' + str(p):>7s}" for p in PERCENTILES) + f" {'max':>7s}  (ms)"]
+        for row in self.rows():
+            lines.append(f"{row['kind']:8s} {row['name']:40s} {row['matched']:6d} {row['missing']:5d} {row['unanswered']:5d} {row['retransmits']:5d} "
+                         + " ".join(f"{ms(row[f'p{p}_ms']):>7s}" for p in PERCENTILES) + f" {ms(row['max_ms']):>7s}")
+        for (typ, name), n in sorted(self.unsolicited.items()):
+            lines.append(f"unsolicited {typ} {name}: {n}")
+        for ch in (0, 1):
+            lines.append(f"{direction_name(ch)}: seq gaps {self.gaps[ch]} ({self.skipped[ch]} frames skipped), "
+                         f"resets {self.resets[ch]}")
+        return lines
+
+def correlate_records(records, timeout=TIMEOUT):
+    """Correlate a capture's (ts, channel, data) records."""
+    from .capture import iter_packets
+    correlator = Correlator(timeout)
+    for ts, channel, offset, skip, packet in iter_packets(records):
+        correlator.add(ts, decode_record(channel, packet))
+    correlator.finish()
+    return correlator
+
+def run_correlate(args):
+    from .capture import read_records
+    correlator = correlate_records(read_records(args.file), args.timeout / 1000)
+    if args.json:
+        json.dump(correlator.to_dict(), sys.stdout, indent=1)
+        print()
+    else:
+        print("\n".join(correlator.report()))
@@ -0,0 +1,205 @@
+"""Packet filter expressions, pushed down to the reader and the framer.
+
+A filter is a Python-style boolean expression over:
+
+* ``ch``: channel (0 = ESP->Radar, 1 = Radar->ESP)
+* ``typ``: frame type, also as the names RSP, WRT, ACK, REQ, REP
+* ``seq``: frame seq
+* ``sub``: sub_id (-1 for frames too short to have one); attribute names
+  may stand for their sub_id (``sub == "location_track_data"``)
+* ``len``: payload length
+* ``t``: timestamp of the record holding the frame's first byte (NaN,
+  which fails every comparison but !=, when the capture has none)
+
+for example ``sub in {0x0117, 0x0142} and typ == REP and ch == 1``. Only
+comparisons (including ``in``/``not in`` literal sets), ``and``, ``or`` and
+``not`` are allowed.
+
+The expression is compiled three ways:
+
+* per record, on (ch, t): capture readers and the live reader skip records
+  (before even parsing their hex) that cannot hold a matching frame;
+* per frame, on (typ, seq, sub, len) for one channel: the framer drops
+  non-matching frames as soon as their header and sub_id are in, without
+  building a FramedPacket or, when the next frame header follows directly,
+  checking their CRC;
+* per packet, on every field, for expressions using t: records let
+  through after a kept one (see TAIL_RECORDS) may start frames of their
+  own, so neither level above decides t exactly.
+
+The first two are relaxations: every comparison they can't evaluate is
+replaced by whichever constant keeps a possibly matching frame.
+"""
+import ast
+
+from .schema import ATTRIBUTES_BY_NAME
+
+FRAME_FIELDS = ("typ", "seq", "sub", "len")
+RECORD_FIELDS = ("ch", "t")
+FIELDS = ("ch",) + FRAME_FIELDS + ("t",)
+TYPE_CONSTANTS = {"RSP": 1, "WRT": 2, "ACK": 3, "REQ": 4, "REP": 5}
+NAN = float("nan")
+
+ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+    ast.Name, ast.Load, ast.Constant, ast.Set, ast.Tuple, ast.List,
+)
+# Records after one that was kept still go to the framer, so a frame
+# started in a kept record can complete
+TAIL_RECORDS = 8
+
+class _Resolve(ast.NodeTransformer):
+    """Type names to numbers, attribute names compared with sub to sub_ids."""
+
+    def visit_Name(self, node):
+        if node.id in TYPE_CONSTANTS:
+            return ast.copy_location(ast.Constant(TYPE_CONSTANTS[node.id]), node)
+        if node.id not in FIELDS:
+            raise ValueError(f"unknown name {node.id!r} (fields: {', '.join(FIELDS)})")
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        operands = [node.left] + node.comparators
+        if any(isinstance(n, ast.Name) and n.id == "sub" for n in operands):
+            for n in ast.walk(node):
+                if isinstance(n, ast.Constant) and isinstance(n.value, str):
+                    attr = ATTRIBUTES_BY_NAME.get(n.value)
+                    if attr is None:
+                        raise ValueError(f"unknown attribute {n.value!r}")
+                    n.value = attr.sub_id
+        return node
+
+class _Relax(ast.NodeTransformer):
+    """Replace comparisons on fields outside known with a non-excluding constant.
+
+    Under an even number of nots that is True, under an odd number False,
+    so the result is implied by the original expression.
+    """
+
+    def __init__(self, known, constants):
+        self.known = set(known)
+        self.constants = constants
+        self.negated = False
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            self.negated = not self.negated
+            node.operand = self.visit(node.operand)
+            self.negated = not self.negated
+            return node
+        return self.generic_visit(node)
+
+    def visit_BoolOp(self, node):
+        node.values = [self.visit(v) for v in node.values]
+        return node
+
+    def visit_Compare(self, node):
+        names = {n.id for n in ast.walk(node) if isinstance(n, ast.Name)}
+        if names - self.known - set(self.constants):
+            return ast.copy_location(ast.Constant(not self.negated), node)
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id in self.constants:
+            return ast.copy_location(ast.Constant(self.constants[node.id]), node)
+        return node
+
+def _names(tree):
+    return {n.id for n in ast.walk(tree) if isinstance(n, ast.Name)}
+
+def _is_constant(tree):
+    """True/False if the expression no longer depends on any field, else None."""
+    if _names(tree):
+        return None
+    return bool(eval(compile(tree, "<filter>", "eval"), {"__builtins__": {}}))
+
+def _lambda(tree, args):
+    fn = ast.Expression(ast.Lambda(
+        args=ast.arguments(posonlyargs=[], args=[ast.arg(a) for a in args], kwonlyargs=[],
+                           kw_defaults=[], defaults=[]),
+        body=tree.body,
+    ))
+    ast.fix_missing_locations(fn)
+    return eval(compile(fn, "<filter>", "eval"), {"__builtins__": {}})
+
+def _copy(tree):
+    return ast.parse(ast.unparse(tree), mode="eval")
+
+class RecordFilter:
+    """Per-record keep/skip decisions, letting a few records through after a kept one."""
+
+    def __init__(self, keep, tail=TAIL_RECORDS):
+        self.keep = keep
+        self.tail = tail
+        self.remaining = [0, 0]
+        self.skipped = 0
+
+    def wants(self, channel, ts):
+        if self.keep(channel, NAN if ts is None else ts):
+            self.remaining[channel] = self.tail
+            return True
+        if self.remaining[channel]:
+            self.remaining[channel] -= 1
+            return True
+        self.skipped += 1
+        return False
+
+class PacketFilter:
+    def __init__(self, expr):
+        self.expr = expr
+        try:
+            tree = ast.parse(expr.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"bad filter expression: {e.msg}") from None
+        for node in ast.walk(tree):
+            if not isinstance(node, ALLOWED_NODES):
+                raise ValueError(f"not allowed in a filter: {ast.unparse(node) if isinstance(node, ast.expr) else type(node).__name__}")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, str)):
+                raise ValueError(f"not allowed in a filter: {node.value!r}")
+        self.tree = _Resolve().visit(tree)
+        self.names = _names(self.tree)
+        self.match = _lambda(self.tree, FIELDS)
+
+        # Record level: frame fields unknown
+        record_tree = _Relax(RECORD_FIELDS, {}).visit(_copy(self.tree))
+        self._record_constant = _is_constant(record_tree)
+        self.keep_record = _lambda(record_tree, RECORD_FIELDS)
+
+        # Frame level, per channel: t unknown
+        self._frame_trees = [_Relax(FRAME_FIELDS, {"ch": ch}).visit(_copy(self.tree)) for ch in (0, 1)]
+
+        # Packet level only when neither level above is exact
+        self.needs_packet_check = "t" in self.names
+
+    def __repr__(self):
+        return f"<PacketFilter {self.expr!r}>"
+
+    def record_filter(self):
+        """A RecordFilter for readers, or None if every record may hold a match."""
+        if self._record_constant is True:
+            return None
+        return RecordFilter(self.keep_record)
+
+    def frame_predicate(self, channel):
+        """accept(typ, seq, sub, len) for the channel's framer, or None to accept everything."""
+        tree = self._frame_trees[channel]
+        constant = _is_constant(tree)
+        if constant is True:
+            return None
+        if constant is False:
+            return lambda typ, seq, sub, length: False
+        return _lambda(tree, FRAME_FIELDS)
+
+    def framers(self, **kwargs):
+        from .framer import Framer
+        return [Framer(ch, accept=self.frame_predicate(ch), **kwargs) for ch in (0, 1)]
+
+    def match_packet(self, ts, channel, packet):
+        data = packet.data
+        sub = data[0] << 8 | data[1] if len(data) >= 2 else -1
+        return self.match(channel, packet.typ, packet.seq, sub, len(data), NAN if ts is None else ts)
+
+def compile_filter(expr):
+    return PacketFilter(expr)
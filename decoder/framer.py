@@ -1,3 +1,6 @@
+import re
+from binascii import crc_hqx
+from collections import Counter
 from dataclasses import dataclass
 from .crc import calc_crc
 
@@ -5,10 +8,16 @@ from .crc import calc_crc
 class FramedPacket:
     seq: int
     typ: int
-    data: bytearray
-    raw: bytearray
+    # Both are memoryviews into the framer's buffer. They stay valid after
+    # the framer moves on, since the buffer is never rewritten in place; use
+    # bytes() on them if you need an independent copy.
+    data: memoryview
+    raw: memoryview
+    # Position of raw[0] in the channel's byte stream
+    offset: int = 0
 
 MAX_BUF_SIZE = 128 * 1024  # 128KB buffer limit
+BUF_CAPACITY = 256 * 1024  # Initial size of the preallocated receive buffer
 XMODEM_SOH = 0x01
 XMODEM_STX = 0x02
 XMODEM_EOT = 0x04
@@ -16,13 +25,39 @@ XMODEM_ACK = 0x06
 XMODEM_NAK = 0x15
 XMODEM_CAN = 0x18
 
+# Every frame candidate in one pattern: the standard 55 00 01 header, or an
+# XMODEM SOH/STX followed by a Seq/~Seq pair (one alternative per Seq value,
+# so the regex engine rejects bad pairs without coming back to Python).
+HEADER_RE = re.compile(
+    b"\x55\x00\x01|[\x01\x02](?:"
+    + b"|".join(re.escape(bytes([seq, seq ^ 0xFF])) for seq in range(256))
+    + b")"
+)
+
 class Framer:
-    def __init__(self, channel, on_drop=None, on_xmodem_block=None):
+    def __init__(self, channel, on_drop=None, on_xmodem_block=None, capacity=BUF_CAPACITY, accept=None):
         self.channel = channel
-        self.acc = bytearray()
+        # accept(typ, seq, sub_id, data_len) -> bool, from filter.PacketFilter;
+        # frames it rejects are skipped without building a FramedPacket
+        self.accept = accept
+        self.filtered = 0
+        # Preallocated buffer with read (start) and write (end) offsets.
+        # Consuming data only moves start; the unconsumed tail is copied into
+        # a fresh buffer when the write offset reaches the end.
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.start = 0
+        self.end = 0
+        # Stream offset of buf[0], i.e. bytes discarded by compaction so far
+        self.base = 0
+        # Everything in [start, scan) is known not to start a frame
+        self.scan = 0
+        # Resync events and dropped byte counts, keyed by reason
+        self.resyncs = Counter()
+        self.dropped_bytes = Counter()
+        # Most bytes ever pending in the buffer
+        self.high_water = 0
         self.packets = []
-        self.in_xmodem = False
-        self.last_xmodem_seq = None
         self.on_drop_cb = on_drop
         self.on_xmodem_block_cb = on_xmodem_block
 
@@ -30,142 +65,172 @@ class Framer:
         if self.on_drop_cb:
             self.on_drop_cb(self.channel, data, reason)
 
-    def add(self, data):
+    def _resync(self, kind, end, reason):
+        # Drop buf[start:end] and move the read offset past it
+        self.resyncs[kind] += 1
+        self.dropped_bytes[kind] += end - self.start
+        self.on_drop(self.view[self.start:end], reason)
+        self.start = end
+        if self.scan < end:
+            self.scan = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def _compact(self, extra):
+        # Never rewrite the current buffer: packets handed out earlier still
+        # hold memoryviews into it. Copy the pending bytes into a new one.
+        pending = self.end - self.start
+        capacity = max(len(self.buf), 2 * (pending + extra))
+        buf = bytearray(capacity)
+        buf[:pending] = self.view[self.start:self.end]
+        self.buf = buf
+        self.view = memoryview(buf)
+        self.scan -= self.start
+        self.base += self.start
+        self.start = 0
+        self.end = pending
+
+    def _append(self, data):
         # Prevent unbounded growth
-        if len(self.acc) > MAX_BUF_SIZE:
+        if self.end - self.start > MAX_BUF_SIZE:
              # Drop old data if buffer is too full to prevent OOM/slowdown
              # Keep last 4KB to maintain context
-             drop_len = len(self.acc) - 4096
-             self.on_drop(self.acc[:drop_len], "buffer_overflow")
-             self.acc = self.acc[-4096:]
-        
-        self.acc.extend(data)
+             self._resync("buffer_overflow", self.end - 4096, "buffer_overflow")
+
+        n = len(data)
+        if self.end + n > len(self.buf):
+            self._compact(n)
+        self.buf[self.end:self.end + n] = data
+        self.end += n
+        if self.end - self.start > self.high_water:
+            self.high_water = self.end - self.start
+
+    def add(self, data):
+        self._append(data)
         self.decode_all()
 
+    def feed(self, data):
+        """Add data and return an iterator over the packets it completes.
+
+        The framing is done before returning, so the iterator may be
+        abandoned early or outlive the next feed() without losing packets.
+        """
+        self._append(data)
+        return iter(list(self._decode()))
+
+    async def stream(self, chunks):
+        """Async iterator over the packets framed from an async iterable of chunks."""
+        async for data in chunks:
+            self._append(data)
+            for packet in self._decode():
+                yield packet
+
     def decode_all(self):
+        self.packets.extend(self._decode())
+
+    def _decode(self):
+        buf = self.buf
+        view = self.view
+        end = self.end
+        search = HEADER_RE.search
         while True:
-            # Find earliest Standard Header
-            idx_55 = self.acc.find(b"\x55\x00\x01")
-            
-            # Find earliest XMODEM Header (SOH/STX) with valid Seq structure
-            idx_xm = -1
-            xm_type = 0
-            
-            # Helper to find valid XMODEM start
-            def find_valid_xm(start_byte_val, byte_type):
-                offset = 0
-                while True:
-                    idx = self.acc.find(bytes([start_byte_val]), offset)
-                    if idx == -1: return -1, None
-                    
-                    # Check XMODEM Header structure: [Type] [Seq] [~Seq]
-                    if idx + 3 <= len(self.acc):
-                        seq = self.acc[idx+1]
-                        seq_inv = self.acc[idx+2]
-                        if (seq + seq_inv) & 0xFF == 0xFF:
-                             return idx, byte_type
-                    offset = idx + 1
-                return -1, None
-
-            # Search for SOH and STX
-            idx_soh, _ = find_valid_xm(XMODEM_SOH, XMODEM_SOH)
-            idx_stx, _ = find_valid_xm(XMODEM_STX, XMODEM_STX)
-            
-            # Pick best XMODEM candidate (earliest)
-            if idx_soh != -1 and (idx_stx == -1 or idx_soh < idx_stx):
-                idx_xm = idx_soh
-                xm_type = XMODEM_SOH
-            elif idx_stx != -1:
-                idx_xm = idx_stx
-                xm_type = XMODEM_STX
-                
-            # Determine which header comes first (Standard vs XMODEM)
-            # Use a large number for "not found" to simplify min() logic
-            pos_55 = idx_55 if idx_55 != -1 else float('inf')
-            pos_xm = idx_xm if idx_xm != -1 else float('inf')
-            
-            best_start = min(pos_55, pos_xm)
-            
-            if best_start == float('inf'):
-                # No headers found
+            start = self.start
+
+            # Earliest Standard or XMODEM header, resuming where the last
+            # search stopped rather than from the read offset
+            m = search(buf, self.scan, end)
+            if m is None:
+                # Nothing found. The last two bytes may still turn into a
+                # header once more data arrives, so keep them in the window.
+                self.scan = max(start, end - 2)
                 break
-                
-            # If we found something, but it's not at 0, drop garbage
-            if best_start > 0:
-                self.on_drop(self.acc[:best_start], "garbage_before_header")
-                self.acc = self.acc[best_start:]
-                # Re-evaluate from 0
-                continue
-                
-            # Now self.acc[0] is a valid header candidate
-            
+
+            pos = m.start()
+            self.scan = pos
+
+            # If we found something, but it's not at the read offset, drop garbage
+            if pos > start:
+                self._resync("garbage_before_header", pos, "garbage_before_header")
+                start = pos
+
+            # Now buf[start] is a valid header candidate
+            avail = end - start
+            head = buf[start]
+
             # Case 1: XMODEM
-            if pos_xm == 0:
-                 # Re-validate to be sure (since we might have just shifted)
-                 # Structure: [Type] [Seq] [~Seq] ...
-                 # Check length
-                 block_len = 128 if xm_type == XMODEM_SOH else 1024
+            if head != 0x55:
+                 # Structure: [Type] [Seq] [~Seq] [Data] [CRC-16/XMODEM BE]
+                 block_len = 128 if head == XMODEM_SOH else 1024
                  overhead = 3 # Head, Seq, ~Seq
                  total_len = overhead + block_len + 2 # +2 for CRC
                  
-                 if len(self.acc) < total_len:
+                 if avail < total_len:
                      # Wait for more data
                      break
                  
-                 # Verify Seq again just in case
-                 seq = self.acc[1]
+                 payload = view[start+3:start+3+block_len]
+                 data_crc = buf[start+3+block_len] << 8 | buf[start+4+block_len]
+                 calced_crc = crc_hqx(payload, 0)
+                 if data_crc != calced_crc:
+                     # Also what a stray 01/02 byte followed by a matching
+                     # pair looks like, so only skip the header byte
+                     self._resync("bad_xmodem_crc", start + 1, "bad xmodem crc ({:04x} != {:04x})".format(data_crc, calced_crc))
+                     continue
                  
-                 # Check for gaps
-                 if self.last_xmodem_seq is not None:
-                     expected_seq = (self.last_xmodem_seq + 1) & 0xFF
-                     if seq != expected_seq and seq != self.last_xmodem_seq: # Ignore duplicates if any
-                         pass # Warning is handled by the caller/logger if needed, or we can add a callback
-                 
-                 self.last_xmodem_seq = seq
-                 
-                 # Consume
+                 # Consume; sequence and gap tracking is up to the
+                 # callback (see xmodem.XmodemReassembler)
                  if self.on_xmodem_block_cb:
-                     self.on_xmodem_block_cb(self.channel, seq, block_len)
+                     self.on_xmodem_block_cb(self.channel, buf[start+1], payload)
                  
-                 self.acc = self.acc[total_len:]
+                 self.start = self.scan = start + total_len
                  continue
             # Case 2: Standard Protocol (0x55 0x01...)
-            # We already know acc[0:3] == 55 00 01 because of the find + shift logic
-            if len(self.acc) < 8:
+            if avail < 8:
                 break
 
-            bsum = -1
-            for d in self.acc[:7]:
-                bsum += d
-            bsum = bsum & 0xff
+            bsum = (sum(view[start:start+7]) - 1) & 0xff
             calc_hdr_chk = bsum ^ 0xff 
-            data_hdr_chk = self.acc[7]
+            data_hdr_chk = buf[start+7]
             if calc_hdr_chk != data_hdr_chk:
-                self.on_drop(self.acc[:3], "bad header parity digit ({} != {})".format(data_hdr_chk, calc_hdr_chk))
-                self.acc = self.acc[3:]
+                self._resync("bad_header_parity", start + 3, "bad header parity digit ({} != {})".format(data_hdr_chk, calc_hdr_chk))
                 continue # Retry from new start
 
-            dlen = self.acc[5] << 8 | self.acc[6]
-            if len(self.acc) < 8 + dlen + 2:
+            dlen = buf[start+5] << 8 | buf[start+6]
+            frame_end = start + 8 + dlen + 2
+            if frame_end > end:
                 break
 
-            data_crc = self.acc[8+dlen:8+dlen+2]
-            calced_crc = calc_crc(self.acc[:8 + dlen])
+            rejected = False
+            if self.accept is not None:
+                sub = buf[start+8] << 8 | buf[start+9] if dlen >= 2 else -1
+                rejected = not self.accept(buf[start+4], buf[start+3], sub, dlen)
+                if rejected and buf.startswith(b"\x55\x00\x01", frame_end, end):
+                    # The next header right where this frame ends confirms
+                    # its length, so a rejected frame can skip the CRC
+                    self.filtered += 1
+                    self.start = self.scan = frame_end
+                    continue
+
+            data_crc = view[frame_end-2:frame_end]
+            calced_crc = calc_crc(view[start:frame_end-2])
             if data_crc != calced_crc:
-                self.on_drop(self.acc[:3], "bad crc ({} != {})".format(data_crc.hex(), calced_crc.hex()))
-                self.acc = self.acc[3:]
+                self._resync("bad_crc", start + 3, "bad crc ({} != {})".format(data_crc.hex(), calced_crc.hex()))
+                continue
+
+            if rejected:
+                self.filtered += 1
+                self.start = self.scan = frame_end
                 continue
 
-            seq = self.acc[3]
-            typ = self.acc[4]
-            data = self.acc[8:8+dlen]
             packet = FramedPacket(
-                raw=self.acc[:8+dlen+2],
-                seq=seq,
-                typ=typ,
-                data=data,
+                raw=view[start:frame_end],
+                seq=buf[start+3],
+                typ=buf[start+4],
+                data=view[start+8:frame_end-2],
+                offset=self.base + start,
             )
 
-            self.acc = self.acc[8+dlen+2:]
+            self.start = self.scan = frame_end
 
-            self.packets.append(packet)
+            yield packet
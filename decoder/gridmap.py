@@ -0,0 +1,158 @@
+"""The 20x16 grid map used by zone configuration attributes (PROTOCOL.md 4.2.1).
+
+A GridMap holds the 40 byte bitmap as one 320-bit integer, so union,
+intersection, difference and popcount are single integer operations.
+Cell (row, col) is bit 319 - (row * 16 + col), which is exactly the
+big-endian reading of the wire bytes (bit 15 of each row = column 0).
+"""
+from functools import lru_cache
+
+ROWS = 20
+COLS = 16
+CELLS = ROWS * COLS
+SIZE = CELLS // 8
+FULL = (1 << CELLS) - 1
+
+@lru_cache(maxsize=4096)
+def _row_text(row_val):
+    return "".join("##" if (row_val >> (15 - col)) & 1 else ".." for col in range(COLS))
+
+class GridMap:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits=0):
+        self.bits = bits & FULL
+
+    @classmethod
+    def from_bytes(cls, data):
+        if len(data) != SIZE:
+            raise ValueError(f"grid map must be {SIZE} bytes, got {len(data)}")
+        return cls(int.from_bytes(data, "big"))
+
+    @classmethod
+    def from_cells(cls, cells):
+        bits = 0
+        for row, col in cells:
+            bits |= 1 << (CELLS - 1 - (row * COLS + col))
+        return cls(bits)
+
+    @classmethod
+    def from_array(cls, array):
+        """From a (20, 16) array of truthy cells."""
+        import numpy as np
+        packed = np.packbits(np.asarray(array, dtype=bool).reshape(CELLS))
+        return cls.from_bytes(packed.tobytes())
+
+    def to_bytes(self):
+        return self.bits.to_bytes(SIZE, "big")
+
+    __bytes__ = to_bytes
+
+    def to_array(self):
+        """(20, 16) bool array, row-major as on the wire."""
+        import numpy as np
+        return np.unpackbits(np.frombuffer(self.to_bytes(), dtype=np.uint8)).reshape(ROWS, COLS).astype(bool)
+
+    def row(self, row):
+        return (self.bits >> ((ROWS - 1 - row) * COLS)) & 0xFFFF
+
+    def __contains__(self, cell):
+        row, col = cell
+        return (self.bits >> (CELLS - 1 - (row * COLS + col))) & 1 == 1
+
+    def cells(self):
+        """List of (row, col) of set cells, in row-major order."""
+        out = []
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            index = CELLS - low.bit_length()
+            out.append(divmod(index, COLS))
+            bits ^= low
+        out.reverse()
+        return out
+
+    def count(self):
+        return self.bits.bit_count()
+
+    def __len__(self):
+        return self.count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __or__(self, other):
+        return GridMap(self.bits | other.bits)
+
+    def __and__(self, other):
+        return GridMap(self.bits & other.bits)
+
+    def __sub__(self, other):
+        return GridMap(self.bits & ~other.bits)
+
+    def __xor__(self, other):
+        return GridMap(self.bits ^ other.bits)
+
+    def __invert__(self):
+        return GridMap(~self.bits)
+
+    def __eq__(self, other):
+        return isinstance(other, GridMap) and self.bits == other.bits
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def overlaps(self, other):
+        return self.bits & other.bits != 0
+
+    def diff(self, previous):
+        """(added, removed) cells relative to an earlier map."""
+        return self - previous, previous - self
+
+    def render(self):
+        """Text rows, '##' for a set cell and '..' for a clear one."""
+        return [f"{row:02d}: {_row_text(self.row(row))}" for row in range(ROWS)]
+
+    def __str__(self):
+        return "\n".join(self.render())
+
+    def __repr__(self):
+        return f"<GridMap {self.count()} cells>"
+
+def stack(maps):
+    """(N, 20, 16) bool array of many maps, unpacked in one call."""
+    import numpy as np
+    if not maps:
+        return np.zeros((0, ROWS, COLS), dtype=bool)
+    raw = np.frombuffer(b"".join(m.to_bytes() for m in maps), dtype=np.uint8)
+    return np.unpackbits(raw).reshape(len(maps), ROWS, COLS).astype(bool)
+
+def overlap_matrix(maps_a, maps_b):
+    """Shared cell counts between every map in maps_a and every map in maps_b."""
+    import numpy as np
+    a = stack(maps_a).reshape(len(maps_a), CELLS).astype(np.int32)
+    b = stack(maps_b).reshape(len(maps_b), CELLS).astype(np.int32)
+    return a @ b.T
+
+class MapHistory:
+    """Latest map per (sub_id, zone_id), with diffs of successive writes."""
+
+    def __init__(self):
+        self.maps = {}
+
+    def update(self, sub_id, zone_id, grid):
+        """Store a map; returns (previous, added, removed), previous None if first."""
+        key = (sub_id, zone_id)
+        previous = self.maps.get(key)
+        self.maps[key] = grid
+        if previous is None:
+            return None, grid, GridMap()
+        added, removed = grid.diff(previous)
+        return previous, added, removed
+
+    def get(self, sub_id, zone_id=None):
+        return self.maps.get((sub_id, zone_id))
+
+    def zones(self, sub_id):
+        """{zone_id: map} of one attribute."""
+        return {zone: grid for (sid, zone), grid in self.maps.items() if sid == sub_id}
@@ -0,0 +1,166 @@
+"""Sidecar packet index for random access into large captures.
+
+The index (``<capture>.idx``) holds one fixed-size row per framed packet:
+timestamp, file offset of the capture record holding the packet's first
+byte, position of that byte within the record, frame length, channel, seq,
+type and sub_id. It is memory-mapped with NumPy for queries, and matching
+packets are read back straight from the memory-mapped capture without
+framing anything before them.
+"""
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from .capture import check_seekable_capture, detect_format, read_records_with_offsets, records_at, iter_packets
+from .framer import FramedPacket
+
+INDEX_MAGIC = b"FP2IDX"
+INDEX_VERSION = 1
+# magic, version, pad, capture size, capture mtime (ns)
+INDEX_HEADER = struct.Struct("<6sBxQq")
+INDEX_EXT = ".idx"
+
+INDEX_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("offset", "<u8"),
+    ("skip", "<u4"),
+    ("length", "<u4"),
+    ("sub_id", "<u2"),
+    ("channel", "u1"),
+    ("seq", "u1"),
+    ("typ", "u1"),
+    ("pad", "u1", (3,)),
+])
+INDEX_ROW = struct.Struct("<dQIIHBBB3x")
+NO_SUB_ID = 0xFFFF
+
+def index_path(capture_path):
+    return capture_path + INDEX_EXT
+
+def _capture_stamp(capture_path):
+    st = os.stat(capture_path)
+    return st.st_size, st.st_mtime_ns
+
+def build_index(capture_path, path=None):
+    """Frame the whole capture once and write its index. Returns the row count."""
+    check_seekable_capture(capture_path)
+    if path is None:
+        path = index_path(capture_path)
+    size, mtime = _capture_stamp(capture_path)
+    pack = INDEX_ROW.pack
+    nan = float("nan")
+    count = 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, size, mtime))
+        for ts, channel, offset, skip, packet in iter_packets(read_records_with_offsets(capture_path)):
+            data = packet.data
+            sub_id = data[0] << 8 | data[1] if len(data) >= 2 else NO_SUB_ID
+            f.write(pack(
+                nan if ts is None else ts, offset, skip, len(packet.raw),
+                sub_id, channel, packet.seq, packet.typ,
+            ))
+            count += 1
+    os.replace(tmp_path, path)
+    return count
+
+def load_index(capture_path, path=None):
+    """Memory-map the index of a capture, or None if missing or stale."""
+    if path is None:
+        path = index_path(capture_path)
+    try:
+        with open(path, "rb") as f:
+            header = f.read(INDEX_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < INDEX_HEADER.size:
+        return None
+    magic, version, size, mtime = INDEX_HEADER.unpack(header)
+    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+        return None
+    if (size, mtime) != _capture_stamp(capture_path):
+        return None
+    if os.path.getsize(path) == INDEX_HEADER.size:
+        return np.zeros(0, dtype=INDEX_DTYPE)
+    return np.memmap(path, dtype=INDEX_DTYPE, mode="r", offset=INDEX_HEADER.size)
+
+def open_index(capture_path, rebuild=False):
+    """Load the capture's index, (re)building it first if needed."""
+    index = None if rebuild else load_index(capture_path)
+    if index is None:
+        build_index(capture_path)
+        index = load_index(capture_path)
+    return index
+
+def select(index, t_from=None, t_to=None, sub_ids=None, channels=None, types=None):
+    """Return the index rows matching every given condition, in capture order.
+
+    Times are inclusive at t_from and exclusive at t_to.
+    """
+    mask = np.ones(len(index), dtype=bool)
+    if t_from is not None:
+        mask &= index["ts"] >= t_from
+    if t_to is not None:
+        mask &= index["ts"] < t_to
+    if sub_ids is not None:
+        mask &= np.isin(index["sub_id"], list(sub_ids))
+    if channels is not None:
+        mask &= np.isin(index["channel"], list(channels))
+    if types is not None:
+        mask &= np.isin(index["typ"], list(types))
+    return index[mask]
+
+class CaptureReader:
+    """Reads indexed packets back from a memory-mapped capture."""
+
+    def __init__(self, capture_path):
+        self.fmt = detect_format(capture_path)
+        self.file = open(capture_path, "rb")
+        if os.path.getsize(capture_path) == 0:
+            self.buf = b""
+        else:
+            self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def read_raw(self, row):
+        """Collect the raw frame bytes described by an index row."""
+        channel = int(row["channel"])
+        need = int(row["skip"]) + int(row["length"])
+        parts = []
+        got = 0
+        for ts, ch, data in records_at(self.buf, int(row["offset"]), self.fmt):
+            if ch != channel:
+                continue
+            parts.append(data)
+            got += len(data)
+            if got >= need:
+                break
+        raw = b"".join(parts)
+        return raw[int(row["skip"]):need]
+
+    def packet(self, row):
+        raw = memoryview(self.read_raw(row))
+        return FramedPacket(
+            seq=int(row["seq"]),
+            typ=int(row["typ"]),
+            data=raw[8:-2],
+            raw=raw,
+        )
+
+    def packets(self, rows):
+        """Yield (ts, channel, packet) for each index row."""
+        for row in rows:
+            ts = float(row["ts"])
+            yield (None if ts != ts else ts), int(row["channel"]), self.packet(row)
@@ -0,0 +1,191 @@
+"""Link quality and processing metrics for the sniffer.
+
+Per channel: bytes and chunks in, packets by type and by sub_id, framer
+resyncs and dropped bytes by reason, XMODEM blocks, buffer fill and
+high-water mark, and a histogram of decode latency (chunk arrival to
+decoded record). Pipeline queue depths and drops are included when a
+pipeline is attached. Metrics render as a one-line summary for periodic
+printing and in the Prometheus text exposition format, optionally served
+over HTTP from a background thread.
+"""
+import bisect
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .protocol import TYPE_NAMES, direction_name
+from .schema import sub_id_map
+
+# Decode latency buckets, seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+STATS_INTERVAL = 10.0  # seconds
+
+class Histogram:
+    """Fixed-bucket histogram, Prometheus style (upper bounds, +Inf last)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q (None when empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class ChannelMetrics:
+    def __init__(self, channel):
+        self.channel = channel
+        self.bytes = 0
+        self.chunks = 0
+        self.packets = Counter()
+        self.sub_ids = Counter()
+        self.xmodem_blocks = 0
+        self.latency = Histogram()
+        self.framer = None
+
+    def on_xmodem_block(self, channel, seq, payload):
+        self.xmodem_blocks += 1
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+class Metrics:
+    """Counters for both channels, plus the pipeline queues once attached."""
+
+    def __init__(self):
+        self.channels = [ChannelMetrics(0), ChannelMetrics(1)]
+        self.queues = []
+        self.started = time.monotonic()
+        self._last = None
+
+    def attach(self, framers, queues=()):
+        for framer in framers:
+            self.channels[framer.channel].framer = framer
+        self.queues = list(queues)
+
+    def on_chunk(self, channel, data):
+        ch = self.channels[channel]
+        ch.bytes += len(data)
+        ch.chunks += 1
+
+    def on_record(self, channel, rec, latency):
+        ch = self.channels[channel]
+        ch.packets[rec.typ] += 1
+        ch.sub_ids[rec.sub_id] += 1
+        ch.latency.observe(latency)
+
+    def _snapshot(self):
+        return time.monotonic(), [(ch.bytes, sum(ch.packets.values())) for ch in self.channels]
+
+    def stats_line(self):
+        """Summary with rates since the previous call."""
+        now, totals = self._snapshot()
+        last_time, last_totals = self._last or (self.started, [(0, 0), (0, 0)])
+        self._last = now, totals
+        dt = max(now - last_time, 1e-9)
+        parts = []
+        for ch, (nbytes, npackets), (last_bytes, last_packets) in zip(self.channels, totals, last_totals):
+            framer = ch.framer
+            drops = sum(framer.resyncs.values()) if framer is not None else 0
+            high_water = framer.high_water if framer is not None else 0
+            p99 = ch.latency.quantile(0.99)
+            latency = f" p99<{p99 * 1000:g}ms" if p99 is not None else ""
+            parts.append(f"{direction_name(ch.channel)} {(nbytes - last_bytes) / dt / 1024:.1f} KiB/s "
+                         f"{(npackets - last_packets) / dt:.0f} pkt/s resyncs {drops} buf {high_water}B{latency}")
+        queue_drops = sum(q.dropped for q in self.queues)
+        return "[stats] " + " | ".join(parts) + f" | queue drops {queue_drops}"
+
+    def render_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{labels} {value}")
+
+        chans = self.channels
+        metric("fp2_uptime_seconds", "gauge", "Seconds since the metrics were created",
+               [("", f"{time.monotonic() - self.started:.3f}")])
+        metric("fp2_bytes_total", "counter", "Bytes received per channel",
+               [(_labels(channel=ch.channel), ch.bytes) for ch in chans])
+        metric("fp2_chunks_total", "counter", "UART reads per channel",
+               [(_labels(channel=ch.channel), ch.chunks) for ch in chans])
+        metric("fp2_packets_total", "counter", "Framed packets by type",
+               [(_labels(channel=ch.channel, type=TYPE_NAMES.get(typ, typ)), n)
+                for ch in chans for typ, n in sorted(dict(ch.packets).items())])
+        metric("fp2_packets_by_sub_id_total", "counter", "Framed packets by sub_id",
+               [(_labels(channel=ch.channel, sub_id=f"0x{sub_id:04x}", name=sub_id_map.get(sub_id, "unknown")), n)
+                for ch in chans for sub_id, n in sorted(dict(ch.sub_ids).items())])
+        metric("fp2_xmodem_blocks_total", "counter", "XMODEM blocks framed",
+               [(_labels(channel=ch.channel), ch.xmodem_blocks) for ch in chans])
+
+        framed = [ch for ch in chans if ch.framer is not None]
+        metric("fp2_resyncs_total", "counter", "Framer resyncs by reason",
+               [(_labels(channel=ch.channel, reason=reason), n)
+                for ch in framed for reason, n in sorted(dict(ch.framer.resyncs).items())])
+        metric("fp2_dropped_bytes_total", "counter", "Bytes discarded by the framer by reason",
+               [(_labels(channel=ch.channel, reason=reason), n)
+                for ch in framed for reason, n in sorted(dict(ch.framer.dropped_bytes).items())])
+        metric("fp2_buffer_bytes", "gauge", "Bytes waiting in the framer buffer",
+               [(_labels(channel=ch.channel), len(ch.framer)) for ch in framed])
+        metric("fp2_buffer_high_water_bytes", "gauge", "Most bytes ever waiting in the framer buffer",
+               [(_labels(channel=ch.channel), ch.framer.high_water) for ch in framed])
+
+        lines.append("# HELP fp2_decode_latency_seconds Chunk arrival to decoded record")
+        lines.append("# TYPE fp2_decode_latency_seconds histogram")
+        for ch in chans:
+            h = ch.latency
+            cumulative = 0
+            for bound, n in zip(h.buckets + ("+Inf",), h.counts):
+                cumulative += n
+                lines.append(f"fp2_decode_latency_seconds_bucket{_labels(channel=ch.channel, le=bound)} {cumulative}")
+            lines.append(f"fp2_decode_latency_seconds_sum{_labels(channel=ch.channel)} {h.sum:.6f}")
+            lines.append(f"fp2_decode_latency_seconds_count{_labels(channel=ch.channel)} {h.count}")
+
+        if self.queues:
+            metric("fp2_queue_depth", "gauge", "Items waiting in a pipeline queue",
+                   [(_labels(queue=q.name), q.qsize()) for q in self.queues])
+            metric("fp2_queue_high_water", "gauge", "Most items ever waiting in a pipeline queue",
+                   [(_labels(queue=q.name), q.high_water) for q in self.queues])
+            metric("fp2_queue_dropped_total", "counter", "Items dropped because a pipeline queue was full",
+                   [(_labels(queue=q.name), q.dropped) for q in self.queues])
+        return "\n".join(lines) + "\n"
+
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    """Serve metrics.render_prometheus() at /metrics on a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = metrics.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
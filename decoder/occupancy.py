@@ -0,0 +1,324 @@
+"""Zone occupancy rebuilt from the tracks, checked against the radar's zone events.
+
+One pass over the capture collects the target reports (location_track_data,
+0x0117), the mounting mode and zone maps in effect at each report, and the
+radar's own zone events (detect_zone_presence 0x0142, detect_zone_motion
+0x0115). Everything after that works on whole arrays: every target of a
+stretch of reports sharing a configuration goes through one
+transform.Transform and one ZoneLookup gather, giving a (reports, zones)
+bool occupancy matrix. The radar's presence events are expanded to the same
+matrix by searchsorted, so disagreements are elementwise comparisons, and
+each event is matched to the nearest reconstructed transition of its zone
+to measure how late it fired.
+
+Reports and events are placed by their position in the stream (how many
+reports came before), so configuration changes and event order hold even
+without timestamps. Captures without them get latencies counted in reports,
+and no durations.
+"""
+import json
+import sys
+
+import numpy as np
+
+from .capture import read_records, iter_packets
+from .filter import compile_filter
+from .protocol import decode_record
+from .tracks import LOCATION_TRACK_DATA, TrackExtractor, save_columns
+from .transform import (RoomTracker, ZoneLookup, MOUNT_NAMES, WALL_CORNER_MOUNT_POSITION,
+                        LEFT_RIGHT_REVERSE, ZONE_DETECT_SETTING)
+
+DETECT_ZONE_MOTION = 0x0115
+DETECT_ZONE_PRESENCE = 0x0142
+CONFIG_SUB_IDS = (WALL_CORNER_MOUNT_POSITION, LEFT_RIGHT_REVERSE, ZONE_DETECT_SETTING)
+EMPTY, OCCUPIED = 0, 1
+# detect_zone_motion types (PROTOCOL.md 6); only Enter has a clear counterpart in the tracks
+MOTION_ENTER = 1
+MOTION_NAMES = {1: "enter", 2: "move", 4: "exit", 8: "l/r", 16: "interference"}
+REPORT = 5
+
+# Events further than this from any transition of their zone are unexplained
+MAX_LATENCY = 30.0  # seconds
+# Reconstructed gaps shorter than this don't end an occupancy run
+HOLD = 1.0  # seconds
+PERCENTILES = (50, 90, 99)
+UNKNOWN = -1
+
+class CaptureScan:
+    """What the reconstruction needs from a capture, gathered in one pass."""
+
+    def __init__(self, room=None):
+        self.tracks = TrackExtractor()
+        self.room = room if room is not None else RoomTracker()
+        # (first report, Transform, {zone_id: GridMap}) from each configuration change on
+        self.epochs = [(0, self.room.transform, dict(self.room.zone_maps))]
+        # (report position, ts, sub_id, zone_id, state)
+        self.events = []
+
+    @property
+    def position(self):
+        return len(self.tracks.counts)
+
+    def add(self, ts, channel, packet):
+        data = packet.data
+        if len(data) < 2:
+            return
+        sub_id = data[0] << 8 | data[1]
+        if sub_id == LOCATION_TRACK_DATA:
+            if channel == 1:
+                self.tracks.add(ts, packet)
+            return
+        rec = decode_record(channel, packet)
+        if sub_id in CONFIG_SUB_IDS:
+            room = self.room
+            transform, zones = room.transform, dict(room.zone_maps)
+            room.update(ts, rec)
+            if room.transform != transform or room.zone_maps != zones:
+                if self.epochs[-1][0] == self.position:
+                    self.epochs.pop()
+                self.epochs.append((self.position, room.transform, dict(room.zone_maps)))
+        elif channel == 1 and rec.typ == REPORT and rec.zone_id is not None:
+            self.events.append((self.position, np.nan if ts is None else ts, sub_id, rec.zone_id, rec.state))
+
+def scan_file(path, room=None):
+    """CaptureScan of a capture, framing and decoding only the packets it needs."""
+    subs = ", ".join(str(s) for s in (LOCATION_TRACK_DATA, DETECT_ZONE_MOTION, DETECT_ZONE_PRESENCE) + CONFIG_SUB_IDS)
+    flt = compile_filter(f"sub in {{{subs}}} and typ != ACK")
+    scan = CaptureScan(room)
+    for ts, channel, offset, skip, packet in iter_packets(read_records(path, flt.record_filter()), flt.framers()):
+        scan.add(ts, channel, packet)
+    return scan
+
+def _runs(column, times, hold):
+    """(onset, offset) report indices of the True runs of a bool column.
+
+    offset is the first report after the run (len(column) for a run still
+    going at the end). Runs separated by less than hold seconds are merged.
+    """
+    step = np.diff(column.astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+    onsets = np.flatnonzero(step == 1)
+    offsets = np.flatnonzero(step == -1)
+    if hold and len(onsets) > 1:
+        end_times = times[np.minimum(offsets[:-1], len(times) - 1)]
+        keep = ~(times[onsets[1:]] - end_times < hold)
+        onsets = np.concatenate((onsets[:1], onsets[1:][keep]))
+        offsets = np.concatenate((offsets[:-1][keep], offsets[-1:]))
+    return onsets, offsets
+
+def _match(event_times, transition_times, max_latency):
+    """Latency of each event to the nearest transition (NaN if none within max_latency),
+    and which transitions no event was matched to."""
+    latency = np.full(len(event_times), np.nan)
+    matched = np.zeros(len(transition_times), dtype=bool)
+    if not len(event_times) or not len(transition_times):
+        return latency, matched
+    j = np.searchsorted(transition_times, event_times)
+    before = np.clip(j - 1, 0, len(transition_times) - 1)
+    after = np.clip(j, 0, len(transition_times) - 1)
+    d_before = event_times - transition_times[before]
+    d_after = event_times - transition_times[after]
+    use_after = np.abs(d_after) < np.abs(d_before)
+    nearest = np.where(use_after, after, before)
+    d = np.where(use_after, d_after, d_before)
+    ok = np.abs(d) <= max_latency
+    latency[ok] = d[ok]
+    matched[nearest[ok]] = True
+    return latency, matched
+
+class Occupancy:
+    """Per-report zone occupancy from the tracks next to the radar's presence state.
+
+    occupied[i, k] is True when a target of report i was in zone zone_ids[k];
+    radar[i, k] is the last detect_zone_presence state of that zone at
+    report i (UNKNOWN before its first event).
+    """
+
+    def __init__(self, scan, max_latency=MAX_LATENCY, hold=HOLD):
+        self.max_latency = max_latency
+        self.hold = hold
+        tracks = scan.tracks.tracks()
+        self.times = tracks.frame_times
+        self.epochs = []
+        previous = None
+        for start, transform, zones in scan.epochs:
+            # Most changes only touch the mounting mode, so lookups are shared
+            if previous is None or zones != previous[0]:
+                previous = zones, ZoneLookup(zones)
+            self.epochs.append((start, transform, previous[1]))
+
+        events = scan.events
+        self.event_pos = np.array([e[0] for e in events], dtype=np.int64)
+        self.event_ts = np.array([e[1] for e in events], dtype=np.float64)
+        self.event_sub = np.array([e[2] for e in events], dtype=np.int64)
+        self.event_zone = np.array([e[3] for e in events], dtype=np.int64)
+        self.event_state = np.array([e[4] for e in events], dtype=np.int64)
+        # Without timestamps events are matched to transitions by position,
+        # latencies (and max_latency and hold) counting reports instead of seconds
+        self.timed = not np.isnan(self.times).all() if len(self.times) else False
+        self.clock = self.times if self.timed else np.arange(len(self.times), dtype=np.float64)
+        self.event_clock = self.event_ts if self.timed else self.event_pos.astype(np.float64)
+
+        configured = [lookup.zone_ids for _, _, lookup in self.epochs]
+        self.zone_ids = np.unique(np.concatenate(configured + [self.event_zone]))
+        self.occupied = self._reconstruct(tracks)
+        self.radar = self._radar_state()
+
+    def _reconstruct(self, tracks):
+        n = len(self.times)
+        occupied = np.zeros((n, len(self.zone_ids)), dtype=bool)
+        frame = tracks["frame"]
+        x, y = tracks["x"], tracks["y"]
+        starts = np.array([start for start, _, _ in self.epochs], dtype=np.int64)
+        # Target rows are in report order, so each epoch's rows are one slice
+        bounds = np.append(np.searchsorted(frame, starts), len(frame))
+        for (start, transform, lookup), lo, hi in zip(self.epochs, bounds[:-1], bounds[1:]):
+            if lo == hi or not len(lookup):
+                continue
+            row, col = transform.to_cells(x[lo:hi], y[lo:hi])
+            hits, zones = np.nonzero(lookup.matrix(lookup.masks(row, col)))
+            columns = np.searchsorted(self.zone_ids, lookup.zone_ids)
+            occupied[frame[lo:hi][hits], columns[zones]] = True
+        return occupied
+
+    def _radar_state(self):
+        n = len(self.times)
+        radar = np.full((n, len(self.zone_ids)), UNKNOWN, dtype=np.int8)
+        presence = self.event_sub == DETECT_ZONE_PRESENCE
+        reports = np.arange(n)
+        for k, zone in enumerate(self.zone_ids):
+            mine = presence & (self.event_zone == zone)
+            if not mine.any():
+                continue
+            # An event seen before report i applies from report i on
+            i = np.searchsorted(self.event_pos[mine], reports, side="right") - 1
+            radar[:, k] = np.where(i >= 0, (self.event_state[mine] != EMPTY)[np.maximum(i, 0)], UNKNOWN)
+        return radar
+
+    def _durations(self):
+        """Seconds each report's state lasted (until the next report)."""
+        times = self.times
+        if len(times) < 2:
+            return np.zeros(len(times))
+        dt = np.diff(times)
+        return np.nan_to_num(np.append(dt, np.nanmedian(dt) if not np.isnan(dt).all() else 0.0))
+
+    def disagreements(self):
+        """(reports, zones) bool: the radar's state is known and differs from the tracks."""
+        return (self.radar != UNKNOWN) & (self.radar.astype(bool) != self.occupied)
+
+    def zone_rows(self):
+        """Per zone: occupancy, disagreement and event latencies."""
+        durations = self._durations()
+        disagree = self.disagreements()
+        known = self.radar != UNKNOWN
+        total = durations.sum()
+        rows = []
+        for k, zone in enumerate(self.zone_ids):
+            onsets, offsets = _runs(self.occupied[:, k], self.clock, self.hold)
+            onset_times = self.clock[onsets]
+            offset_times = self.clock[np.minimum(offsets, len(self.times) - 1)]
+            # A run still going at the end has no offset
+            if len(offsets) and offsets[-1] == len(self.times):
+                offset_times = offset_times[:-1]
+            in_zone = self.event_zone == zone
+            presence = in_zone & (self.event_sub == DETECT_ZONE_PRESENCE)
+            motion = in_zone & (self.event_sub == DETECT_ZONE_MOTION)
+            kinds = {
+                "occupied": (presence & (self.event_state == OCCUPIED), onset_times),
+                "empty": (presence & (self.event_state == EMPTY), offset_times),
+                "enter": (motion & (self.event_state == MOTION_ENTER), onset_times),
+            }
+            events = {}
+            for kind, (mask, transitions) in kinds.items():
+                latency, matched = _match(self.event_clock[mask], transitions, self.max_latency)
+                events[kind] = _latency_row(latency, matched)
+
+            runs = np.diff(disagree[:, k].astype(np.int8), prepend=np.int8(0), append=np.int8(0))
+            starts, ends = np.flatnonzero(runs == 1), np.flatnonzero(runs == -1)
+            spans = [durations[s:e].sum() for s, e in zip(starts, ends)]
+            rows.append({
+                "zone_id": int(zone),
+                "occupied_s": float(durations[self.occupied[:, k]].sum()),
+                "occupied_share": float(durations[self.occupied[:, k]].sum() / total) if total else None,
+                "radar_known_s": float(durations[known[:, k]].sum()),
+                "disagree_s": float(durations[disagree[:, k]].sum()),
+                "disagree_reports": int(disagree[:, k].sum()),
+                "disagree_spans": len(starts),
+                "longest_disagree_s": float(max(spans)) if spans else 0.0,
+                "runs": len(onsets),
+                "motion_types": {MOTION_NAMES.get(int(t), str(int(t))): int(n) for t, n in
+                                 zip(*np.unique(self.event_state[motion], return_counts=True))},
+                "events": events,
+            })
+        return rows
+
+    def to_dict(self):
+        return {
+            "reports": len(self.times),
+            "configurations": len(self.epochs),
+            "latency_unit": "s" if self.timed else "reports",
+            "max_latency_s": self.max_latency,
+            "hold_s": self.hold,
+            "zones": self.zone_rows(),
+        }
+
+    def report(self):
+        def sec(v):
+            return "-" if v is None else f"{v:.2f}"
+
+        rows = self.zone_rows()
+        lines = [f"{len(self.times)} location reports, {len(self.epochs)} configurations, "
+                 f"{len(self.event_ts)} zone events, zones {self.zone_ids.tolist()}"]
+        if not rows:
+            return lines + ["no zones configured or reported"]
+        lines.append(f"{'zone':>4s} {'event':8s} {'events':>6s} {'match':>6s} {'unexp':>6s} {'missed':>6s} "
+                     + " ".join(f"{'p' + str(p):>7s}" for p in PERCENTILES) + f" {'max':>7s}  ({'s' if self.timed else 'reports'}, + = radar later)")
+        for row in rows:
+            for kind, e in row["events"].items():
+                lines.append(f"{row['zone_id']:4d} {kind:8s} {e['events']:6d} {e['matched']:6d} {e['unexplained']:6d} "
+                             f"{e['missed']:6d} " + " ".join(f"{sec(e[f'p{p}_s']):>7s}" for p in PERCENTILES)
+                             + f" {sec(e['max_s']):>7s}")
+        for row in rows:
+            share = "" if row["occupied_share"] is None else f" ({row['occupied_share']:.0%})"
+            motion = ", ".join(f"{name} {n}" for name, n in row["motion_types"].items()) or "none"
+            lines.append(f"zone {row['zone_id']}: occupied {row['occupied_s']:.1f}s{share} in {row['runs']} runs, "
+                         f"disagrees with the radar for {row['disagree_s']:.1f}s of {row['radar_known_s']:.1f}s "
+                         f"({row['disagree_reports']} reports, {row['disagree_spans']} spans, "
+                         f"longest {row['longest_disagree_s']:.1f}s), motion events: {motion}")
+        return lines
+
+    def columns(self):
+        """Per-report timeline: timestamp, then zone<id>_tracks and zone<id>_radar per zone."""
+        columns = {"timestamp": self.times, "frame": np.arange(len(self.times), dtype=np.int64)}
+        for k, zone in enumerate(self.zone_ids):
+            columns[f"zone{zone}_tracks"] = self.occupied[:, k]
+            columns[f"zone{zone}_radar"] = self.radar[:, k]
+        return columns
+
+    def save(self, path):
+        save_columns(path, self.columns())
+
+def _latency_row(latency, matched):
+    found = np.sort(latency[~np.isnan(latency)])
+    row = {
+        "events": len(latency),
+        "matched": len(found),
+        "unexplained": int(np.isnan(latency).sum()),
+        "missed": int((~matched).sum()),
+    }
+    for p in PERCENTILES:
+        row[f"p{p}_s"] = float(np.percentile(found, p)) if len(found) else None
+    row["max_s"] = float(found[-1]) if len(found) else None
+    return row
+
+def run_occupancy(args):
+    room = RoomTracker(MOUNT_NAMES[args.mount]) if args.mount else None
+    occupancy = Occupancy(scan_file(args.file, room), args.max_latency, args.hold)
+    if args.json:
+        json.dump(occupancy.to_dict(), sys.stdout, indent=1)
+        print()
+    else:
+        print("\n".join(occupancy.report()))
+    if args.out:
+        occupancy.save(args.out)
+        print(f"Wrote {args.out}", file=sys.stderr)
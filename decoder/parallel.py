@@ -0,0 +1,176 @@
+"""Decode several captures, or byte ranges of one big capture, in parallel.
+
+A big uncompressed capture is cut into ranges of about SPLIT_SIZE bytes on
+record boundaries, and each range is one job that reads (through mmap) and
+parses only its own records. Packets belong to the range holding the
+record that completed them. A frame can start before its range, so each
+job starts framing WARMUP bytes early and drops what completes there: by
+the range start its framers are in sync with a serial decode's, and the
+ranges concatenated in order give exactly the output of a serial decode.
+Each job reports the bytes its framers hold at both ends of its range; a
+range whose framers did not hold what the previous range's held at its end
+(a false header swallowing the warm-up, say) is decoded again from further
+back, so that guarantee doesn't rest on WARMUP being big enough.
+
+Results come back one range at a time and at most a few jobs per worker
+are in flight, so memory stays flat however big the captures are.
+Compressed and rotated captures can't be cut up; small ones are one job,
+big ones are decoded in the main process, streaming, while the pool keeps
+working on the others (convert them to a plain capture to split them).
+"""
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .capture import (read_records, iter_packets, capture_parts, is_compressed, detect_format,
+                      records_between, record_boundaries)
+from .framer import Framer
+from .protocol import decode_record, render_record
+
+# Captures at least this big are split into ranges of about this size
+SPLIT_SIZE = 4 * 1024 * 1024
+# Bytes framed before a range so frames crossing its start are complete
+WARMUP = 64 * 1024
+# Jobs submitted per worker ahead of the one being printed
+JOBS_AHEAD = 2
+
+# Lines per chunk when a capture is decoded in the main process
+INLINE_CHUNK = 4096
+
+def _render(packets, exclude_names, fmt, keep=None):
+    """Rendered text of every packet that produces output (and passes keep())."""
+    for ts, channel, offset, skip, packet in packets:
+        if keep is not None and not keep():
+            continue
+        rec = decode_record(channel, packet, exclude_names=exclude_names)
+        if rec is not None:
+            yield render_record(rec, ts, fmt)
+
+def decode_capture(path, exclude_names=None, fmt="text"):
+    """Decode a whole capture (any format); returns the output text."""
+    try:
+        return "\n".join(_render(iter_packets(read_records(path)), exclude_names, fmt))
+    except FileNotFoundError:
+        return f"File not found: {path}"
+
+def _pending(framers):
+    # A framer's future output depends only on the bytes it still holds
+    return tuple(bytes(framer.view[framer.start:framer.end]) for framer in framers)
+
+def decode_range(path, start, end, warmup_start, exclude_names=None, fmt="text"):
+    """Decode the packets completed by records starting in [start, end) of an
+    uncompressed capture, framing from warmup_start (a record boundary).
+
+    Returns (text, entry, exit), entry and exit being the bytes pending in
+    the framers at start and at end.
+    """
+    framers = [Framer(0), Framer(1)]
+    current = -1
+    entry = None
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        def ranged():
+            nonlocal current, entry
+            for current, ts, channel, data in records_between(buf, warmup_start, end, detect_format(path)):
+                if entry is None and current >= start:
+                    entry = _pending(framers)
+                yield ts, channel, data
+
+        packets = iter_packets(ranged(), framers)
+        text = "\n".join(_render(packets, exclude_names, fmt, keep=lambda: current >= start))
+    pending = _pending(framers)
+    return text, pending if entry is None else entry, pending
+
+def split_ranges(path, split_size=SPLIT_SIZE, warmup=WARMUP):
+    """(start, end, warmup_start) record-aligned byte ranges covering a capture."""
+    size = os.path.getsize(path)
+    cuts = [k * split_size for k in range(-(-size // split_size))]
+    targets = sorted({t for cut in cuts for t in (max(cut - warmup, 0), cut)})
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        aligned = dict(zip(targets, record_boundaries(buf, detect_format(path), targets)))
+    starts = [aligned[cut] for cut in cuts]
+    warmups = [aligned[max(cut - warmup, 0)] for cut in cuts]
+    ends = starts[1:] + [size]
+    return [(s, e, w) for s, e, w in zip(starts, ends, warmups) if s < e]
+
+def _plan(path, split_size):
+    """Work for one capture: a list of job argument tuples, or None to decode it inline."""
+    try:
+        parts = capture_parts(path)
+        seekable = len(parts) == 1 and not is_compressed(parts[0])
+        size = sum(os.path.getsize(p) for p in parts)
+    except OSError:
+        return [(decode_capture, path)]
+    if size < split_size:
+        return [(decode_capture, path)]
+    if not seekable:
+        return None
+    return [(decode_range, path, start, end, warmup) for start, end, warmup in split_ranges(path, split_size)]
+
+def decode_files(paths, exclude_names=None, jobs=None, split_size=SPLIT_SIZE, fmt="text"):
+    """Decode many captures on a process pool.
+
+    Yields (path, chunks) for each capture in the order given, chunks being
+    an iterator over its output text, one chunk per range as soon as it and
+    everything before it is done. Consume chunks before the next capture.
+    """
+    if jobs is None or jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        plans = deque((i, path, _plan(path, split_size)) for i, path in enumerate(paths))
+        # (capture number, future, job) in output order; no future for a capture decoded inline
+        submitted = deque()
+
+        def submit(fn, *args):
+            return pool.submit(fn, *args, exclude_names=exclude_names, fmt=fmt)
+
+        def submit_ahead():
+            while plans and len(submitted) < jobs * JOBS_AHEAD:
+                i, path, plan = plans[0]
+                if plan is None:
+                    submitted.append((i, None, None))
+                    plans.popleft()
+                    continue
+                job = plan.pop(0)
+                submitted.append((i, submit(*job), job))
+                if not plan:
+                    plans.popleft()
+
+        def chunks(i, path):
+            # Framer bytes pending at the end of the last range, and the
+            # warm-up starts of the ranges before, to go back to
+            pending = None
+            earlier = []
+            while submitted and submitted[0][0] == i:
+                _, future, job = submitted.popleft()
+                submit_ahead()
+                if future is None:
+                    # Big compressed or rotated capture: decode here, streaming
+                    lines = []
+                    for line in _render(iter_packets(read_records(path)), exclude_names, fmt):
+                        lines.append(line)
+                        if len(lines) >= INLINE_CHUNK:
+                            yield "\n".join(lines)
+                            lines = []
+                    if lines:
+                        yield "\n".join(lines)
+                    continue
+                if job[0] is not decode_range:
+                    text = future.result()
+                else:
+                    fn, path, start, end, warmup = job
+                    text, entry, at_end = future.result()
+                    for retry in reversed(earlier):
+                        if entry == pending:
+                            break
+                        text, entry, at_end = submit(fn, path, start, end, retry).result()
+                    earlier.append(warmup)
+                    pending = at_end
+                if text:
+                    yield text
+
+        submit_ahead()
+        for i, path in enumerate(paths):
+            yield path, chunks(i, path)
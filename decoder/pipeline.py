@@ -0,0 +1,284 @@
+"""Staged sniffer pipeline: reader -> framer -> decoder -> sinks.
+
+Every stage runs in its own task and hands work to the next one through a
+bounded queue. Readers never wait on a downstream stage: when a queue is
+full the item is dropped and counted, so a slow terminal or plot can only
+lose decoded output, never stall draining the UARTs. Readers hand raw
+chunks straight to the capture writer (a capture.ThreadedCaptureWriter,
+whose write() only queues them for its thread), so the raw capture is
+never dropped and no disk I/O runs on the event loop. The print sink
+writes from a worker thread too, so a slow terminal only backs up (and
+drops from) the print queue. Every queue keeps a high-water mark and drop
+counter for the stats printed on exit. With a metrics.Metrics attached,
+readers and the decoder also feed its counters and a stats task prints a
+summary line every stats_interval seconds.
+Consumers (callables taking (ts, rec)) get every decoded record with the
+arrival time of the chunk that completed it, and an xmodem.XmodemReassembler
+passed as firmware collects OTA blocks as they are framed. A
+filter.PacketFilter is applied as early as it can be: chunks are still
+captured, but readers don't queue chunks it rules out, and framers skip
+non-matching frames before building packets. A summary.RollingSummary gets
+every record too and is printed with the stats.
+"""
+import asyncio
+import sys
+import time
+
+from .framer import Framer
+from .protocol import decode_record, format_record
+
+CHUNK_QUEUE_SIZE = 4096
+RECORD_QUEUE_SIZE = 4096
+# CPU-bound stages yield to the event loop after this many items so the
+# readers get to run even when a stage always has work queued
+YIELD_EVERY = 64
+
+class StageQueue(asyncio.Queue):
+    """asyncio.Queue with a non-blocking offer() that counts drops.
+
+    With latest=True a full queue discards its oldest item instead, for
+    consumers that only care about the newest value (the visualizer).
+    """
+
+    def __init__(self, name, maxsize, latest=False):
+        super().__init__(maxsize)
+        self.name = name
+        self.latest = latest
+        self.offered = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def offer(self, item):
+        self.offered += 1
+        if self.full():
+            self.dropped += 1
+            if not self.latest:
+                return False
+            self.get_nowait()
+            self.task_done()
+        self.put_nowait(item)
+        if self.qsize() > self.high_water:
+            self.high_water = self.qsize()
+        return True
+
+    def drain(self):
+        """Take everything queued right now without waiting."""
+        items = []
+        while not self.empty():
+            items.append(self.get_nowait())
+        return items
+
+    def done(self, count):
+        for _ in range(count):
+            self.task_done()
+
+    def stats(self):
+        return f"{self.name}: {self.offered} in, high-water {self.high_water}/{self.maxsize}, dropped {self.dropped}"
+
+class Pipeline:
+    """Wires UART readers to the capture writer, framers, decoder and sinks.
+
+    outfile needs a write(ts, channel, data) that doesn't block, like
+    capture.ThreadedCaptureWriter's.
+    """
+
+    def __init__(self, outfile=None, exclude_names=None, visualizer=None, out=sys.stdout,
+                 queue_size=RECORD_QUEUE_SIZE, metrics=None, stats_interval=None, log=sys.stderr,
+                 consumers=(), firmware=None, packet_filter=None, summary=None, room=None, locate=False):
+        self.outfile = outfile
+        self.exclude_names = exclude_names
+        self.visualizer = visualizer
+        self.out = out
+        self.metrics = metrics
+        self.stats_interval = stats_interval
+        self.log = log
+        self.consumers = list(consumers)
+        self.summary = summary
+        if summary is not None:
+            self.consumers.append(summary.add_record)
+        # transform.RoomTracker: mounting mode for the visualizer and, with
+        # locate, room positions and zones printed under each target list
+        self.room = room
+        self.locate = locate and room is not None
+        if room is not None:
+            self.consumers.append(room.update)
+        self.firmware = firmware
+        self.packet_filter = packet_filter
+        self.record_filter = packet_filter.record_filter() if packet_filter is not None else None
+        self.framers = [Framer(idx, on_xmodem_block=self._xmodem_callback(idx),
+                               accept=packet_filter.frame_predicate(idx) if packet_filter is not None else None)
+                        for idx in (0, 1)]
+        self.queues = []
+        self.chunk_queues = [self._queue(f"frame{idx}", CHUNK_QUEUE_SIZE) for idx in (0, 1)]
+        self.record_queue = self._queue("decode", queue_size)
+        self.print_queue = self._queue("print", queue_size)
+        self.visual_queue = self._queue("visualize", 1, latest=True) if visualizer else None
+        if metrics is not None:
+            metrics.attach(self.framers, self.queues)
+        if summary is not None:
+            summary.attach(self.framers)
+
+    def _xmodem_callback(self, idx):
+        callbacks = []
+        if self.metrics is not None:
+            callbacks.append(self.metrics.channels[idx].on_xmodem_block)
+        if self.firmware is not None:
+            callbacks.append(self.firmware.on_xmodem_block)
+        if not callbacks:
+            return None
+        if len(callbacks) == 1:
+            return callbacks[0]
+
+        def on_xmodem_block(channel, seq, payload):
+            for callback in callbacks:
+                callback(channel, seq, payload)
+        return on_xmodem_block
+
+    def _queue(self, name, maxsize, latest=False):
+        q = StageQueue(name, maxsize, latest)
+        self.queues.append(q)
+        return q
+
+    async def read(self, idx, uart):
+        """Reader stage: pull chunks off one UART and fan them out.
+
+        Returns when the source raises EOFError (end of a replay).
+        """
+        chunk_queue = self.chunk_queues[idx]
+        metrics = self.metrics
+        record_filter = self.record_filter
+        while True:
+            try:
+                data = await uart.read_all()
+            except EOFError:
+                return
+            if len(data) == 0:
+                continue
+            now = time.time()
+            if self.outfile is not None:
+                self.outfile.write(now, idx, data)
+            if metrics is not None:
+                metrics.on_chunk(idx, data)
+            if record_filter is not None and not record_filter.wants(idx, now):
+                continue
+            chunk_queue.offer((now, data))
+
+    async def frame(self, idx):
+        """Framer stage for one channel."""
+        q = self.chunk_queues[idx]
+        framer = self.framers[idx]
+        record_queue = self.record_queue
+        while True:
+            arrived, data = await q.get()
+            for packet in framer.feed(data):
+                # Packets hold views into the framer buffer, which stays
+                # valid after compaction, so they can be queued as-is
+                record_queue.offer((idx, arrived, packet))
+            q.task_done()
+            await asyncio.sleep(0)
+
+    async def decode(self):
+        """Decoder stage: decode packets and hand records to the sinks."""
+        q = self.record_queue
+        exclude_names = self.exclude_names
+        metrics = self.metrics
+        consumers = self.consumers
+        packet_filter = self.packet_filter
+        if packet_filter is not None and not packet_filter.needs_packet_check:
+            packet_filter = None
+        count = 0
+        while True:
+            idx, arrived, packet = await q.get()
+            if packet_filter is not None and not packet_filter.match_packet(arrived, idx, packet):
+                q.task_done()
+                continue
+            rec = decode_record(idx, packet)
+            if metrics is not None:
+                metrics.on_record(idx, rec, time.time() - arrived)
+            for consumer in consumers:
+                consumer(arrived, rec)
+            if not (exclude_names and rec.name in exclude_names):
+                self.print_queue.offer(rec)
+            if self.visual_queue is not None and rec.targets:
+                self.visual_queue.offer(rec.targets)
+            q.task_done()
+            count += 1
+            if count % YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+
+    async def print_records(self):
+        """Print sink: one write per batch of records, off the event loop."""
+        q = self.print_queue
+        while True:
+            batch = [await q.get()]
+            batch += q.drain()
+            lines = []
+            for rec in batch:
+                lines += format_record(rec)
+                if self.locate and rec.targets:
+                    lines += self.room.format_targets(rec.targets)
+            await asyncio.to_thread(self._write, "\n".join(lines) + "\n")
+            q.done(len(batch))
+
+    def _write(self, text):
+        self.out.write(text)
+        self.out.flush()
+
+    async def visualize(self):
+        q = self.visual_queue
+        while True:
+            targets = await q.get()
+            self.visualizer.update_targets(targets, self.room.transform if self.room is not None else None)
+            q.task_done()
+
+    async def report(self):
+        """Print a metrics summary line (and the rolling summary) every stats_interval seconds."""
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            if self.metrics is not None:
+                print(self.metrics.stats_line(), file=self.log, flush=True)
+            if self.summary is not None:
+                print("\n".join(self.summary.table()), file=self.log, flush=True)
+
+    def stage_coroutines(self):
+        stages = [self.frame(0), self.frame(1), self.decode(), self.print_records()]
+        if self.visual_queue is not None:
+            stages.append(self.visualize())
+        if (self.metrics is not None or self.summary is not None) and self.stats_interval:
+            stages.append(self.report())
+        return stages
+
+    async def run(self, uarts, stop=None):
+        """Run until stop (an awaitable) completes or every reader returns.
+
+        When the readers finish on their own (a replayed capture), queued
+        work is drained before the stages are stopped.
+        """
+        async with asyncio.TaskGroup() as group:
+            stages = [group.create_task(coro) for coro in self.stage_coroutines()]
+            readers = [group.create_task(self.read(idx, uart), name=f"uart{idx + 1}")
+                       for idx, uart in enumerate(uarts)]
+            waiters = list(readers)
+            stop_task = None
+            if stop is not None:
+                stop_task = group.create_task(stop)
+                waiters.append(stop_task)
+
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+            if stop_task not in done:
+                # Readers ended on their own: let every stage catch up first
+                await asyncio.wait(readers)
+                for q in self.queues:
+                    await q.join()
+            for task in waiters + stages:
+                task.cancel()
+
+    def stats_lines(self):
+        lines = [q.stats() for q in self.queues]
+        for framer in self.framers:
+            drops = ", ".join(f"{kind} {count}" for kind, count in framer.resyncs.items()) or "none"
+            filtered = f", filtered {framer.filtered}" if framer.accept is not None else ""
+            lines.append(f"framer{framer.channel}: resyncs {drops}, buffer high-water {framer.high_water}{filtered}")
+        if self.record_filter is not None:
+            lines.append(f"filter: {self.record_filter.skipped} chunks skipped")
+        return lines
@@ -0,0 +1,224 @@
+"""Replay a recorded capture through the live sniffer pipeline.
+
+ReplayUart stands in for a Glasgow UART interface: read_all() hands back the
+capture's chunks for one channel at their recorded times (scaled by speed),
+or as fast as possible with speed None. Chunks that are already due are
+coalesced into one read like a real UART FIFO would, and the lag between a
+chunk's due time and when it is actually read shows whether the pipeline
+keeps up.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from .capture import read_records
+from .pipeline import Pipeline, RECORD_QUEUE_SIZE
+
+# Most bytes one read_all() returns, about what the Glasgow FIFO buffers
+READ_LIMIT = 4096
+# A replay falls behind when chunks are read this much later than due
+MAX_LAG = 0.5  # seconds
+
+class ReplayClock:
+    """Maps capture timestamps to wall-clock deadlines for all channels."""
+
+    def __init__(self, t0, speed=1.0):
+        self.t0 = t0
+        self.speed = speed
+        self.start = None
+
+    def due(self, ts):
+        """Seconds until a chunk stamped ts is due (negative when late)."""
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        if ts is None or self.t0 is None or not self.speed:
+            return 0.0
+        return (ts - self.t0) / self.speed - (now - self.start)
+
+class ReplayUart:
+    """read_all()-compatible source over one channel of a capture."""
+
+    def __init__(self, chunks, clock, read_limit=READ_LIMIT):
+        self.chunks = chunks
+        self.clock = clock
+        self.read_limit = read_limit
+        self.pos = 0
+        self.reads = 0
+        self.bytes = 0
+        self.max_lag = 0.0
+
+    async def read_all(self):
+        if self.pos >= len(self.chunks):
+            raise EOFError
+        ts, data = self.chunks[self.pos]
+        delay = self.clock.due(ts)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            self.max_lag = max(self.max_lag, -delay)
+            # Give the other stages a turn, as awaiting a real UART would
+            await asyncio.sleep(0)
+        self.pos += 1
+        parts = [data]
+        size = len(data)
+        # Everything else already due arrives in the same read
+        while self.pos < len(self.chunks) and size < self.read_limit:
+            ts, data = self.chunks[self.pos]
+            if self.clock.due(ts) > 0:
+                break
+            parts.append(data)
+            size += len(data)
+            self.pos += 1
+        self.reads += 1
+        self.bytes += size
+        return b"".join(parts)
+
+def load_chunks(path):
+    """Split a capture into per-channel [(ts, data)] lists and the first timestamp."""
+    chunks = ([], [])
+    t0 = None
+    for ts, channel, data in read_records(path):
+        if ts is not None and (t0 is None or ts < t0):
+            t0 = ts
+        chunks[channel].append((ts, data))
+    return chunks, t0
+
+class ReplayResult:
+    def __init__(self, speed, elapsed, uarts, pipeline):
+        self.speed = speed
+        self.elapsed = elapsed
+        self.bytes = sum(u.bytes for u in uarts)
+        self.reads = sum(u.reads for u in uarts)
+        self.max_lag = max(u.max_lag for u in uarts)
+        self.packets = pipeline.record_queue.offered
+        self.dropped = sum(q.dropped for q in pipeline.queues if not q.latest)
+        self.stats = pipeline.stats_lines()
+
+    @property
+    def packets_per_second(self):
+        return self.packets / self.elapsed if self.elapsed else 0.0
+
+    def keeps_up(self, max_lag=MAX_LAG):
+        return self.dropped == 0 and self.max_lag <= max_lag
+
+    def summary(self):
+        speed = "max" if not self.speed else f"{self.speed:g}x"
+        return (f"speed {speed}: {self.packets} packets, {self.bytes} bytes in {self.elapsed:.2f}s "
+                f"({self.packets_per_second:.0f} packets/s, {self.bytes / max(self.elapsed, 1e-9) / 1024:.0f} KiB/s), "
+                f"max lag {self.max_lag * 1000:.0f} ms, dropped {self.dropped}")
+
+async def replay(chunks, t0, speed=1.0, outfile=None, exclude_names=None, visualizer=None,
+                 out=sys.stdout, queue_size=RECORD_QUEUE_SIZE, metrics=None, stats_interval=None, consumers=(),
+                 firmware=None, packet_filter=None, summary=None, room=None, locate=False):
+    """Run the sniffer pipeline over pre-loaded chunks; returns a ReplayResult."""
+    clock = ReplayClock(t0, speed)
+    uarts = [ReplayUart(chunks[0], clock), ReplayUart(chunks[1], clock)]
+    pipeline = Pipeline(outfile, exclude_names, visualizer, out=out, queue_size=queue_size,
+                        metrics=metrics, stats_interval=stats_interval, consumers=consumers,
+                        firmware=firmware, packet_filter=packet_filter, summary=summary,
+                        room=room, locate=locate)
+    start = time.monotonic()
+    await pipeline.run(uarts)
+    return ReplayResult(speed, time.monotonic() - start, uarts, pipeline)
+
+def sweep(chunks, t0, speed=1.0, max_lag=MAX_LAG, **kwargs):
+    """Double the speed from speed until the pipeline falls behind.
+
+    Yields the ReplayResult of every run; the last one is the first that
+    did not keep up (or a run at max speed if it always kept up).
+    """
+    while True:
+        result = asyncio.run(replay(chunks, t0, speed, **kwargs))
+        yield result
+        if not result.keeps_up(max_lag) or not speed:
+            return
+        speed *= 2
+        if speed > 1e6:
+            speed = None
+
+def run_replay(args):
+    chunks, t0 = load_chunks(args.file)
+
+    visualizer = None
+    if args.visualize:
+        from .visualizer import TargetVisualizer
+        visualizer = TargetVisualizer(trail_length=args.trail)
+        visualizer.start()
+
+    outfile = None
+    if args.out:
+        from .capture import ThreadedCaptureWriter
+        outfile = ThreadedCaptureWriter(args.out)
+
+    metrics = None
+    server = None
+    if args.stats_interval or args.metrics_port:
+        from .metrics import Metrics, serve_metrics
+        metrics = Metrics()
+        if args.metrics_port:
+            server = serve_metrics(metrics, args.metrics_port)
+            print(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics", file=sys.stderr)
+
+    correlator = None
+    consumers = []
+    if args.correlate:
+        from .correlate import Correlator
+        correlator = Correlator()
+        consumers.append(correlator.add)
+
+    from .xmodem import XmodemReassembler
+    firmware = XmodemReassembler(args.firmware_out)
+
+    out = open(os.devnull, "w") if args.quiet else sys.stdout
+    speed = None if args.speed == 0 else args.speed
+    kwargs = dict(outfile=outfile, exclude_names=args.exclude, visualizer=visualizer, out=out,
+                  metrics=metrics, stats_interval=args.stats_interval, consumers=consumers,
+                  packet_filter=args.filter)
+    if args.locate or visualizer is not None:
+        from .transform import make_tracker
+        kwargs["room"] = make_tracker(args.mount)
+        kwargs["locate"] = args.locate
+    summary = None
+    if args.summary_window:
+        from .summary import RollingSummary
+        summary = RollingSummary(args.summary_window)
+        kwargs["summary"] = summary
+    if not args.sweep:
+        kwargs["firmware"] = firmware
+    try:
+        if args.sweep:
+            best = None
+            for result in sweep(chunks, t0, speed or 1.0, **kwargs):
+                print(result.summary(), file=sys.stderr)
+                if result.keeps_up():
+                    best = result
+            if best is not None:
+                print(f"Keeps up to {best.packets_per_second:.0f} packets/s", file=sys.stderr)
+            else:
+                print("Falls behind even at the starting speed", file=sys.stderr)
+        else:
+            result = asyncio.run(replay(chunks, t0, speed, **kwargs))
+            for line in result.stats:
+                print(line, file=sys.stderr)
+            if metrics is not None:
+                print(metrics.stats_line(), file=sys.stderr)
+            if summary is not None:
+                print("\n".join(summary.table()), file=sys.stderr)
+            if correlator is not None:
+                correlator.finish()
+                print("\n".join(correlator.report()), file=sys.stderr)
+            firmware.close()
+            if firmware.transfers:
+                print("\n".join(firmware.summary()), file=sys.stderr)
+            print(result.summary(), file=sys.stderr)
+    finally:
+        if server:
+            server.shutdown()
+        if outfile:
+            outfile.close()
+        if visualizer:
+            visualizer.stop()
+        if args.quiet:
+            out.close()
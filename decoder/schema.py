@@ -0,0 +1,421 @@
+"""Attribute schema: what every sub_id carries and how to decode/encode it.
+
+Each attribute is declared once in ATTRIBUTE_SPECS (by name, seeded from
+sub_id_map and the attribute tables in PROTOCOL.md) with its wire type,
+permissions, enum labels and custom decode/format/encode hooks.
+At import this is compiled into ATTRIBUTES, a dict keyed by sub_id, so
+decoding a packet is one dict lookup plus the hooks of that attribute.
+"""
+import struct
+from collections import namedtuple
+
+from .gridmap import GridMap
+
+sub_id_map = {
+    0x101: "radar_hw_version",
+    0x102: "radar_sw_version",
+    0x103: "motion_detection",
+    0x104: "presence_detection",
+    0x105: "monitor_mode",
+    0x106: "closing_setting",
+    0x107: "edge_label",
+    0x109: "import_export_label",
+    0x110: "interference_source",
+    0x111: "presence_detection_sensitivity",
+    0x112: "location_report_enable",
+    0x113: "reset_absent_status",
+    0x114: "zone_detect_setting",
+    0x115: "detect_zone_motion",
+    0x116: "work_mode",
+    0x117: "location_track_data",
+    0x120: "angle_sensor_data",
+    0x121: "fall_detection",
+    0x122: "left_right_reverse",
+    0x123: "fall_detection_sensitivity",
+    0x125: "radar_interference_auto_setting",
+    0x127: "ota_set_flag",
+    0x128: "temperature",
+    0x134: "fall_overtime_report_period",
+    0x135: "fall_overtime_detection",
+    0x138: "thermodynamic_chart_enable",
+    0x139: "interference_auto_enable",
+    0x141: "thermodynamic_chart_data",
+    0x142: "detect_zone_presence",
+    0x143: "device_direction",
+    0x149: "edge_auto_setting",
+    0x150: "edge_auto_enable",
+    0x151: "detect_zone_sensitivity",
+    0x152: "detect_zone_type",
+    0x153: "radar_detect_zone_close_away_enable",
+    0x154: "target_posture",
+    0x155: "people_counting",
+    0x156: "sleep_report_enable",
+    0x157: "posture_report_enable",
+    0x158: "people_counting_report_enable",
+    0x159: "sleep_data",
+    0x160: "delete_false_target",
+    0x161: "sleep_state",
+    0x162: "people_number_enable",
+    0x163: "target_type_enable",
+    0x164: "realtime_people_number",
+    0x165: "ontime_people_number",
+    0x166: "realtime_people_counting",
+    0x167: "sleep_presence",
+    0x168: "sleep_zone_mount_position",
+    0x169: "sleep_zone_size",
+    0x170: "wall_corner_mount_position",
+    0x171: "sleep_inout_state",
+    0x172: "dwell_time_enable",
+    0x173: "walking_distance_enable",
+    0x174: "walking_distance_all",
+    0x176: "sleep_event",
+    0x201: "debug_log",
+    0x202: "aux_data",
+}
+
+# Wire (data) types, see PROTOCOL.md 4.1
+UINT8 = 0x00
+UINT16 = 0x01
+UINT32 = 0x02
+VOID = 0x03
+BOOL = 0x04
+BLOB1 = 0x05
+BLOB2 = 0x06
+
+WIRE_TYPE_NAMES = {UINT8: "UINT8", UINT16: "UINT16", UINT32: "UINT32", VOID: "VOID", BOOL: "BOOL", BLOB1: "BLOB1", BLOB2: "BLOB2"}
+
+U8 = struct.Struct(">B")
+U16 = struct.Struct(">H")
+U32 = struct.Struct(">I")
+BLOB_LEN = U16
+
+# Enum Maps
+zone_sensitivity_map = {1: "Low", 2: "Medium", 3: "High"}
+zone_type_map = {
+    2: "Television Area",
+    10: "Others/GreenPlant", 
+    11: "Leisure Area",
+    13: "Dressing Table",
+    14: "Closet", 
+    15: "Desk",
+    23: "Shower",
+    36: "Stairs"
+}
+lr_reverse_map = {0: "Consistent", 1: "Opposite"}
+wall_pos_map = {1: "Wall"}
+zone_presence_map = {1: "Occupied"}
+close_away_map = {1: "ON"}
+
+TARGET_STRUCT = struct.Struct(">BhhhhHBBB")
+Target = namedtuple("Target", "tid x y z velocity snr classifier posture active")
+
+# sleep_data items (PROTOCOL.md 4.2.5); the 9 trailing bytes are not yet understood
+SLEEP_ITEM_STRUCT = struct.Struct(">BBB9s")
+SleepItem = namedtuple("SleepItem", "tid zone_id presence data")
+# people_counting: 7 bytes of ID, ValA, ValB. How the 6 value bytes split
+# is a guess; no capture has one yet
+PEOPLE_COUNT_STRUCT = struct.Struct(">BHI")
+PeopleCount = namedtuple("PeopleCount", "id a b")
+# target_posture: UINT16, assumed [TargetID] [Posture] like the zone attributes
+TargetPosture = namedtuple("TargetPosture", "tid posture")
+
+ZONE_MAP_STRUCT = struct.Struct(">B40s")
+GRID_MAP_SIZE = 40
+
+# Generic value decoders, by wire type. payload is everything after the
+# wire type byte.
+
+def _decode_uint(s):
+    size = s.size
+    unpack_from = s.unpack_from
+    def decode(rec, payload):
+        if len(payload) >= size:
+            rec.value = unpack_from(payload)[0]
+    return decode
+
+def _decode_bool(rec, payload):
+    if len(payload) >= 1:
+        rec.value = payload[0] != 0
+
+def _decode_blob1(rec, payload):
+    if len(payload) >= 2:
+        rec.length = payload[0] << 8 | payload[1]
+        try:
+            rec.value = bytes(payload[2:]).decode('ascii')
+        except UnicodeDecodeError:
+            rec.value = bytes(payload[2:])
+
+def _decode_blob2(rec, payload):
+    if len(payload) >= 2:
+        rec.length = payload[0] << 8 | payload[1]
+        rec.value = bytes(payload[2:])
+
+WIRE_DECODERS = {
+    UINT8: _decode_uint(U8),
+    UINT16: _decode_uint(U16),
+    UINT32: _decode_uint(U32),
+    BOOL: _decode_bool,
+    BLOB1: _decode_blob1,
+    BLOB2: _decode_blob2,
+}
+
+# Custom decoders, run after the generic one. data is the whole attribute
+# payload (SubID onwards).
+
+def decode_targets(rec, data, payload):
+    if rec.typ != 5 or len(data) < 5:
+        return
+    sub_data_len = data[3] << 8 | data[4]
+    sub_data = data[5:5+sub_data_len]
+    if len(sub_data) > 0:
+        count = sub_data[0]
+        items = sub_data[1:1+14*count]
+        rec.count = count
+        rec.targets = [Target._make(t) for t in TARGET_STRUCT.iter_unpack(items[:len(items) - len(items) % 14])]
+
+def _unpack_items(rec, s, cls):
+    body = rec.value
+    if rec.typ == 3 or not isinstance(body, bytes):
+        return
+    rec.items = [cls._make(t) for t in s.iter_unpack(body[:len(body) - len(body) % s.size])]
+
+def split_sleep_count(body):
+    """(count, items) of a sleep_data BLOB; count is None when there is none.
+
+    [Count] [Item 12B]... per PROTOCOL.md; captured reports carry one bare
+    item, so the count is only taken when it matches the length.
+    """
+    size = SLEEP_ITEM_STRUCT.size
+    if len(body) % size == 1 and body[0] == len(body) // size:
+        return body[0], body[1:]
+    return None, body
+
+def decode_sleep_data(rec, data, payload):
+    body = rec.value
+    if rec.typ == 3 or not isinstance(body, bytes):
+        return
+    rec.count, body = split_sleep_count(body)
+    size = SLEEP_ITEM_STRUCT.size
+    rec.items = [SleepItem._make(t) for t in SLEEP_ITEM_STRUCT.iter_unpack(body[:len(body) - len(body) % size])]
+
+def decode_people_counting(rec, data, payload):
+    _unpack_items(rec, PEOPLE_COUNT_STRUCT, PeopleCount)
+
+def decode_target_posture(rec, data, payload):
+    if rec.typ != 3 and isinstance(rec.value, int):
+        rec.items = [TargetPosture(rec.value >> 8, rec.value & 0xFF)]
+
+def decode_zone_state(rec, data, payload):
+    # Structure is [ZoneID] [State], i.e. UINT16 with ZoneID in the MSB
+    if len(payload) >= 2:
+        rec.zone_id = payload[0]
+        rec.state = payload[1]
+
+def decode_zone_value(rec, data, payload):
+    # Val is [ZoneID] [Value]
+    if rec.typ != 3 and isinstance(rec.value, int):
+        rec.zone_id = (rec.value >> 8) & 0xFF
+        rec.state = rec.value & 0xFF
+
+def decode_grid_map(rec, data, payload):
+    # [LenH] [LenL] [Map 40B]
+    if len(payload) >= 42:
+        rec.grid = GridMap.from_bytes(payload[2:42])
+
+def decode_zone_map(rec, data, payload):
+    # [LenH] [LenL] [ZoneID] [Map 40B]
+    if len(payload) >= 43:
+        rec.zone_id, grid = ZONE_MAP_STRUCT.unpack_from(payload, 2)
+        rec.grid = GridMap.from_bytes(grid)
+    else:
+        decode_grid_map(rec, data, payload)
+
+# Custom value formatters. Return None to fall back to the generic text.
+
+def format_zone_state(attr, rec):
+    if rec.zone_id is None:
+        return None
+    val_str = f"Zone:{rec.zone_id} State:{rec.state} (0x{rec.state:02x})"
+    label = attr.label(rec)
+    if label is not None:
+        val_str += f" [{label}]"
+    return val_str
+
+def format_zone_value(tag):
+    def format_value(attr, rec):
+        if rec.state is None:
+            return None
+        label = attr.label(rec)
+        if label is None:
+            label = rec.state
+        return f"{rec.value} (0x{rec.value:04x}) [Zone:{rec.zone_id} {tag}:{label}]"
+    return format_value
+
+# Custom encoders: value -> bytes following the wire type byte
+
+def encode_zone_map(value):
+    zone_id, grid = value
+    return BLOB_LEN.pack(ZONE_MAP_STRUCT.size) + ZONE_MAP_STRUCT.pack(zone_id, bytes(grid))
+
+def encode_targets(targets):
+    body = bytes([len(targets)]) + b"".join(TARGET_STRUCT.pack(*t) for t in targets)
+    return BLOB_LEN.pack(len(body)) + body
+
+class Attribute:
+    """Compiled schema entry for one sub_id."""
+
+    __slots__ = (
+        "sub_id", "name", "wire_type", "rw", "enum", "enum_default",
+        "enum_on", "decode", "format", "encode", "suffix",
+    )
+
+    def __init__(self, sub_id, name, wire_type=None, rw=None, enum=None,
+                 enum_default=None, enum_on="value", decode=None,
+                 format=None, encode=None, suffix=False):
+        self.sub_id = sub_id
+        self.name = name
+        self.wire_type = wire_type
+        self.rw = rw
+        self.enum = enum
+        self.enum_default = enum_default
+        # Whether enum labels the whole value or the low byte of [ZoneID] [Value]
+        self.enum_on = enum_on
+        self.decode = decode
+        self.format = format
+        self.encode = encode
+        # Append the enum label to the generic value text
+        self.suffix = suffix
+
+    def __repr__(self):
+        sub_id = "----" if self.sub_id is None else f"{self.sub_id:04x}"
+        return f"<Attribute {self.name} ({sub_id})>"
+
+    def label(self, rec):
+        """Enum label for a decoded record of this attribute, or None."""
+        if self.enum is None or rec.typ == 3:
+            return None
+        key = rec.state if self.enum_on == "state" else rec.value
+        if key is None or not isinstance(key, int):
+            return None
+        return self.enum.get(key, self.enum_default)
+
+    def encode_value(self, value=None, zone_id=None, wire_type=None):
+        """Encode a value into the bytes that follow the wire type byte."""
+        if wire_type is None:
+            wire_type = self.wire_type
+        if self.encode is not None and wire_type == self.wire_type:
+            return self.encode(value)
+        if zone_id is not None:
+            value = (zone_id << 8) | (value & 0xFF)
+        if wire_type == UINT8:
+            return U8.pack(value)
+        if wire_type == UINT16:
+            return U16.pack(value)
+        if wire_type == UINT32:
+            return U32.pack(value)
+        if wire_type == VOID:
+            return b""
+        if wire_type == BOOL:
+            return bytes([1 if value else 0])
+        if wire_type in (BLOB1, BLOB2):
+            body = value.encode("ascii") if isinstance(value, str) else bytes(value)
+            return BLOB_LEN.pack(len(body)) + body
+        raise ValueError(f"{self.name}: no wire type to encode with")
+
+    def encode_payload(self, value=None, zone_id=None, wire_type=None):
+        """Full attribute payload: SubID, wire type, value."""
+        if wire_type is None:
+            wire_type = self.wire_type
+        if wire_type is None:
+            raise ValueError(f"{self.name}: wire type unknown, pass wire_type")
+        return U16.pack(self.sub_id) + bytes([wire_type]) + self.encode_value(value, zone_id, wire_type)
+
+    def encode_request(self):
+        """Payload of a reverse read request (SubID only)."""
+        return U16.pack(self.sub_id)
+
+    def encode_ack(self, status=0):
+        return U16.pack(self.sub_id) + U16.pack(status)
+
+# Declarative schema, keyed by name. Wire types and permissions are from
+# PROTOCOL.md section 6 and, where it has none, from captured traffic.
+ATTRIBUTE_SPECS = {
+    "radar_hw_version": dict(wire_type=UINT8, rw="R"),
+    "radar_sw_version": dict(wire_type=UINT8, rw="R"),
+    "motion_detection": dict(wire_type=UINT8, rw="RW"),
+    "presence_detection": dict(wire_type=UINT8, rw="RW"),
+    "monitor_mode": dict(wire_type=UINT8, rw="RW"),
+    "closing_setting": dict(wire_type=UINT8, rw="RW"),
+    "edge_label": dict(wire_type=BLOB2, rw="RW", decode=decode_grid_map),
+    "import_export_label": dict(wire_type=BLOB2, rw="RW", decode=decode_grid_map),
+    "interference_source": dict(wire_type=BLOB2, rw="RW", decode=decode_grid_map),
+    "presence_detection_sensitivity": dict(wire_type=UINT8, rw="RW", enum=zone_sensitivity_map),
+    "location_report_enable": dict(wire_type=BOOL, rw="RW"),
+    "reset_absent_status": dict(wire_type=BOOL),
+    "zone_detect_setting": dict(wire_type=BLOB2, rw="RW", decode=decode_zone_map, encode=encode_zone_map),
+    "detect_zone_motion": dict(wire_type=UINT16, rw="Rep", decode=decode_zone_state, format=format_zone_state),
+    "work_mode": dict(wire_type=UINT8, rw="RW"),
+    "location_track_data": dict(wire_type=BLOB2, rw="Rep", decode=decode_targets, encode=encode_targets),
+    "angle_sensor_data": dict(wire_type=UINT16),
+    "fall_detection": dict(wire_type=UINT8, rw="RW"),
+    "left_right_reverse": dict(wire_type=UINT8, rw="RW", enum=lr_reverse_map, enum_default="Unknown", suffix=True),
+    "fall_detection_sensitivity": dict(wire_type=UINT8, rw="RW"),
+    "radar_interference_auto_setting": dict(wire_type=BLOB2, rw="RW"),
+    "ota_set_flag": dict(wire_type=BOOL, rw="W"),
+    "temperature": dict(wire_type=UINT16, rw="R"),
+    "fall_overtime_report_period": dict(wire_type=UINT32, rw="RW"),
+    "fall_overtime_detection": dict(wire_type=UINT32, rw="RW"),
+    "thermodynamic_chart_enable": dict(wire_type=BOOL, rw="RW"),
+    "interference_auto_enable": dict(wire_type=BOOL, rw="RW"),
+    "thermodynamic_chart_data": dict(wire_type=BLOB2, rw="Rep"),
+    "detect_zone_presence": dict(wire_type=UINT16, rw="Rep", enum=zone_presence_map, enum_default="Empty", enum_on="state", decode=decode_zone_state, format=format_zone_state),
+    "device_direction": dict(wire_type=UINT8, rw="R"),
+    "edge_auto_setting": dict(wire_type=BLOB2, rw="RW"),
+    "edge_auto_enable": dict(wire_type=BOOL, rw="RW"),
+    "detect_zone_sensitivity": dict(wire_type=UINT16, rw="RW", enum=zone_sensitivity_map, enum_on="state", decode=decode_zone_value, format=format_zone_value("Sens")),
+    "detect_zone_type": dict(wire_type=UINT16, rw="RW", enum=zone_type_map, enum_on="state", decode=decode_zone_value, format=format_zone_value("Type")),
+    "radar_detect_zone_close_away_enable": dict(wire_type=UINT16, rw="RW", enum=close_away_map, enum_default="OFF", enum_on="state", decode=decode_zone_value, format=format_zone_value("CloseAway")),
+    "target_posture": dict(wire_type=UINT16, rw="Rep", decode=decode_target_posture),
+    "people_counting": dict(wire_type=BLOB2, rw="Rep", decode=decode_people_counting),
+    "sleep_report_enable": dict(wire_type=BOOL, rw="RW"),
+    "posture_report_enable": dict(wire_type=BOOL, rw="RW"),
+    "people_counting_report_enable": dict(wire_type=BOOL, rw="RW"),
+    "sleep_data": dict(wire_type=BLOB2, rw="Rep", decode=decode_sleep_data),
+    "delete_false_target": dict(wire_type=UINT8, rw="W"),
+    "sleep_state": dict(wire_type=UINT8, rw="Rep"),
+    "people_number_enable": dict(wire_type=BOOL, rw="RW"),
+    "target_type_enable": dict(wire_type=BOOL, rw="RW"),
+    "realtime_people_number": dict(wire_type=UINT32, rw="Rep"),
+    "ontime_people_number": dict(wire_type=UINT32, rw="Rep"),
+    "realtime_people_counting": dict(wire_type=UINT32, rw="Rep"),
+    "sleep_presence": dict(wire_type=UINT8, rw="Rep"),
+    "sleep_zone_mount_position": dict(wire_type=UINT8, rw="RW"),
+    "sleep_zone_size": dict(wire_type=UINT32, rw="RW"),
+    "wall_corner_mount_position": dict(wire_type=UINT8, rw="RW", enum=wall_pos_map, enum_default="Unknown", suffix=True),
+    "sleep_inout_state": dict(wire_type=UINT8, rw="Rep"),
+    "dwell_time_enable": dict(wire_type=BOOL, rw="RW"),
+    "walking_distance_enable": dict(wire_type=BOOL, rw="RW"),
+    "walking_distance_all": dict(wire_type=UINT32, rw="Rep"),
+    "sleep_event": dict(wire_type=UINT8, rw="Rep"),
+    "debug_log": dict(wire_type=BLOB1, rw="Rep"),
+    "aux_data": dict(wire_type=BLOB2),
+}
+
+def compile_schema(sub_ids=sub_id_map, specs=ATTRIBUTE_SPECS):
+    return {sub_id: Attribute(sub_id, name, **specs.get(name, {})) for sub_id, name in sub_ids.items()}
+
+ATTRIBUTES = compile_schema()
+ATTRIBUTES_BY_NAME = {attr.name: attr for attr in ATTRIBUTES.values()}
+# sub_id None: the record carries the sub_id actually seen
+UNKNOWN_ATTRIBUTE = Attribute(None, "UNKNOWN")
+
+def lookup(key):
+    """Find an attribute by sub_id or name."""
+    if isinstance(key, Attribute):
+        return key
+    if isinstance(key, str):
+        return ATTRIBUTES_BY_NAME[key]
+    return ATTRIBUTES[key]
+
+def encode_payload(key, value=None, zone_id=None, wire_type=None):
+    return lookup(key).encode_payload(value, zone_id, wire_type)
@@ -0,0 +1,261 @@
+"""Typed time series of the sleep, people counting and posture reports.
+
+Each attribute's report payload is viewed through a big-endian structured
+dtype (the layouts in schema.py / PROTOCOL.md 4.2.5) and appended to a
+TimeSeries: a growable structured array with a timestamp and a report
+number per row, so a night of reports ends up as a handful of NumPy
+columns instead of hex dumps. thermodynamic_chart_data frames go into a
+HeatmapAccumulator, which keeps a rolling sum of the last few frames.
+"""
+import os
+
+import numpy as np
+
+from .capture import read_records, iter_packets
+from .gridmap import ROWS, COLS
+from .schema import split_sleep_count
+from .tracks import save_columns
+
+REPORT = 5
+INITIAL_CAPACITY = 1024
+HEATMAP_WINDOW = 60  # frames
+
+# Layouts as in schema.SLEEP_ITEM_STRUCT etc.
+SLEEP_DTYPE = np.dtype([("tid", "u1"), ("zone_id", "u1"), ("presence", "u1")]
+                       + [(f"raw{i}", "u1") for i in range(9)])
+PEOPLE_COUNTING_DTYPE = np.dtype([("id", "u1"), ("a", ">u2"), ("b", ">u4")])
+POSTURE_DTYPE = np.dtype([("tid", "u1"), ("posture", "u1")])
+U32_DTYPE = np.dtype([("value", ">u4")])
+U8_DTYPE = np.dtype([("value", "u1")])
+
+class TimeSeries:
+    """Appendable structured array: timestamp, frame (report number) and the item fields."""
+
+    def __init__(self, name, item_dtype, capacity=INITIAL_CAPACITY):
+        self.name = name
+        self.item_dtype = item_dtype
+        fields = [(n, item_dtype[n].newbyteorder("=")) for n in item_dtype.names]
+        self.dtype = np.dtype([("timestamp", "f8"), ("frame", "i8")] + fields)
+        self.data = np.empty(capacity, self.dtype)
+        self.size = 0
+        self.frames = 0
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.data[name][:self.size]
+
+    @property
+    def array(self):
+        return self.data[:self.size]
+
+    def _reserve(self, n):
+        if self.size + n <= len(self.data):
+            return
+        capacity = len(self.data)
+        while capacity < self.size + n:
+            capacity *= 2
+        data = np.empty(capacity, self.dtype)
+        data[:self.size] = self.data[:self.size]
+        self.data = data
+
+    def append(self, ts, items):
+        """Append one report's items, a bytes-like multiple of the item size."""
+        rows = np.frombuffer(items, self.item_dtype)
+        n = len(rows)
+        self._reserve(n)
+        out = self.data[self.size:self.size + n]
+        out["timestamp"] = np.nan if ts is None else ts
+        out["frame"] = self.frames
+        for name in self.item_dtype.names:
+            out[name] = rows[name]
+        self.size += n
+        self.frames += 1
+
+    def columns(self):
+        return {name: self[name] for name in self.dtype.names}
+
+    def save(self, path):
+        save_columns(path, self.columns())
+
+    def span(self):
+        ts = self["timestamp"]
+        if not len(ts) or np.isnan(ts).all():
+            return None
+        return float(np.nanmin(ts)), float(np.nanmax(ts))
+
+class HeatmapAccumulator:
+    """Rolling sum of the last window heatmap frames.
+
+    Frames are taken as one u8 per cell; 320-cell frames are shaped like
+    the 20x16 grid maps. The layout of thermodynamic_chart_data is not
+    documented yet, so frames of another size stay flat, and frames whose
+    size differs from the first one are counted and skipped.
+    """
+
+    def __init__(self, window=HEATMAP_WINDOW):
+        self.window = window
+        self.ring = None
+        self.sum = None
+        self.shape = None
+        self.pos = 0
+        self.count = 0
+        self.frames = 0
+        self.skipped = 0
+        self.last_ts = None
+
+    def add(self, ts, cells):
+        frame = np.frombuffer(cells, np.uint8)
+        if self.ring is None:
+            self.shape = (ROWS, COLS) if len(frame) == ROWS * COLS else (len(frame),)
+            self.ring = np.zeros((self.window, len(frame)), np.uint8)
+            self.sum = np.zeros(len(frame), np.int64)
+        elif len(frame) != self.ring.shape[1]:
+            self.skipped += 1
+            return
+        self.sum -= self.ring[self.pos]
+        self.sum += frame
+        self.ring[self.pos] = frame
+        self.pos = (self.pos + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+        self.frames += 1
+        self.last_ts = ts
+
+    def mean(self):
+        """Mean of the frames in the window, shaped like a frame (None before the first)."""
+        if not self.count:
+            return None
+        return (self.sum / self.count).reshape(self.shape)
+
+    def latest(self):
+        if not self.count:
+            return None
+        return self.ring[(self.pos - 1) % self.window].reshape(self.shape)
+
+def _blob(data):
+    # BLOB2 value after SubID, wire type and length
+    if len(data) < 5:
+        return None
+    return data[5:5 + (data[3] << 8 | data[4])]
+
+def _whole(body, dtype):
+    return body[:len(body) - len(body) % dtype.itemsize]
+
+class SeriesExtractor:
+    """Routes radar reports into typed series by sub_id."""
+
+    def __init__(self, heatmap_window=HEATMAP_WINDOW):
+        self.series = {
+            "sleep_data": TimeSeries("sleep_data", SLEEP_DTYPE),
+            "people_counting": TimeSeries("people_counting", PEOPLE_COUNTING_DTYPE),
+            "target_posture": TimeSeries("target_posture", POSTURE_DTYPE),
+            "realtime_people_number": TimeSeries("realtime_people_number", U32_DTYPE),
+            "ontime_people_number": TimeSeries("ontime_people_number", U32_DTYPE),
+            "realtime_people_counting": TimeSeries("realtime_people_counting", U32_DTYPE),
+            "sleep_state": TimeSeries("sleep_state", U8_DTYPE),
+            "sleep_presence": TimeSeries("sleep_presence", U8_DTYPE),
+        }
+        self.heatmap = HeatmapAccumulator(heatmap_window)
+        s = self.series
+        self.handlers = {
+            0x0159: self._sleep_data,
+            0x0155: self._blob(s["people_counting"]),
+            0x0154: self._value(s["target_posture"]),
+            0x0164: self._value(s["realtime_people_number"]),
+            0x0165: self._value(s["ontime_people_number"]),
+            0x0166: self._value(s["realtime_people_counting"]),
+            0x0161: self._value(s["sleep_state"]),
+            0x0167: self._value(s["sleep_presence"]),
+            0x0141: self._heatmap,
+        }
+
+    def _sleep_data(self, ts, data):
+        body = _blob(data)
+        if body is None:
+            return
+        _, body = split_sleep_count(body)
+        self.series["sleep_data"].append(ts, _whole(body, SLEEP_DTYPE))
+
+    def _blob(self, series):
+        def add(ts, data):
+            body = _blob(data)
+            if body is not None:
+                series.append(ts, _whole(body, series.item_dtype))
+        return add
+
+    def _value(self, series):
+        size = series.item_dtype.itemsize
+        def add(ts, data):
+            if len(data) >= 3 + size:
+                series.append(ts, data[3:3 + size])
+        return add
+
+    def _heatmap(self, ts, data):
+        body = _blob(data)
+        if body:
+            self.heatmap.add(ts, body)
+
+    def add(self, ts, channel, typ, data):
+        if channel != 1 or typ != REPORT or len(data) < 2:
+            return
+        handler = self.handlers.get(data[0] << 8 | data[1])
+        if handler is not None:
+            handler(ts, data)
+
+    def add_record(self, ts, rec):
+        """Consumer for the sniffer pipeline."""
+        self.add(ts, rec.channel, rec.typ, rec.data)
+
+    def summary(self):
+        lines = []
+        for name, series in self.series.items():
+            if not len(series):
+                continue
+            span = series.span()
+            when = f" over {span[1] - span[0]:.0f}s" if span else ""
+            lines.append(f"{name}: {series.frames} reports, {len(series)} rows{when}")
+            if name == "sleep_data":
+                for zone in np.unique(series["zone_id"]):
+                    in_zone = series["zone_id"] == zone
+                    lines.append(f"  zone {zone}: {in_zone.sum()} rows, presence {series['presence'][in_zone].mean():.0%}, "
+                                 f"targets {np.unique(series['tid'][in_zone]).tolist()}")
+            elif "value" in series.dtype.names:
+                values = series["value"]
+                lines.append(f"  min {values.min()} max {values.max()} last {values[-1]}")
+        heatmap = self.heatmap
+        if heatmap.frames:
+            lines.append(f"thermodynamic_chart_data: {heatmap.frames} frames of shape {heatmap.shape}"
+                         + (f", {heatmap.skipped} of another size skipped" if heatmap.skipped else "")
+                         + f", mean of the last {heatmap.count} peaks at {heatmap.mean().max():.1f}")
+        return lines or ["no sleep, people counting, posture or heatmap reports"]
+
+    def save(self, out):
+        """Save every non-empty series as <out stem>.<name><ext>, and the heatmap as .npz."""
+        stem, ext = os.path.splitext(out)
+        paths = []
+        for name, series in self.series.items():
+            if len(series):
+                path = f"{stem}.{name}{ext}"
+                series.save(path)
+                paths.append(path)
+        if self.heatmap.frames:
+            path = f"{stem}.thermodynamic_chart_data.npz"
+            np.savez_compressed(path, mean=self.heatmap.mean(), latest=self.heatmap.latest())
+            paths.append(path)
+        return paths
+
+def extract_series(packets, heatmap_window=HEATMAP_WINDOW):
+    """Build a SeriesExtractor from (ts, channel, packet) tuples."""
+    extractor = SeriesExtractor(heatmap_window)
+    for ts, channel, packet in packets:
+        extractor.add(ts, channel, packet.typ, packet.data)
+    return extractor
+
+def extract_series_from_file(path, heatmap_window=HEATMAP_WINDOW):
+    def radar_packets():
+        # Only the radar reports these, so skip the ESP side
+        records = (r for r in read_records(path) if r[1] == 1)
+        for ts, channel, offset, skip, packet in iter_packets(records):
+            yield ts, channel, packet
+    return extract_series(radar_packets(), heatmap_window)
@@ -0,0 +1,206 @@
+"""Device shadow: the radar's current state, updated packet by packet.
+
+Every decoded record carrying a value (WRT from the ESP, REP from either
+side, and the REQ answering a value request) updates one entry keyed by
+(sub_id, zone_id), zone_id being None for attributes without zones. An
+entry holds the latest value, when it was seen, and where it came from.
+Lookups are dict gets, and subscribers are only called when a value
+actually changes. Snapshots round-trip through JSON.
+"""
+import json
+import time
+
+from .gridmap import GridMap
+from .protocol import direction_name
+from .schema import ATTRIBUTES, Target, lookup
+
+WRT, REQ, REP = 2, 4, 5
+ORIGINS = {WRT: "write", REP: "report", REQ: "response"}
+
+class Entry:
+    __slots__ = ("sub_id", "zone_id", "value", "label", "ts", "origin", "channel", "seq")
+
+    def __init__(self, sub_id, zone_id, value, label, ts, origin, channel, seq):
+        self.sub_id = sub_id
+        self.zone_id = zone_id
+        self.value = value
+        self.label = label
+        self.ts = ts
+        self.origin = origin
+        self.channel = channel
+        self.seq = seq
+
+    @property
+    def name(self):
+        attr = ATTRIBUTES.get(self.sub_id)
+        return attr.name if attr is not None else f"0x{self.sub_id:04x}"
+
+    def __repr__(self):
+        zone = "" if self.zone_id is None else f" zone {self.zone_id}"
+        return f"<Entry {self.name}{zone} = {self.value!r} ({self.origin})>"
+
+    def to_dict(self):
+        return {
+            "sub_id": self.sub_id,
+            "name": self.name,
+            "zone_id": self.zone_id,
+            "value": encode_value(self.value),
+            "label": self.label,
+            "ts": self.ts,
+            "origin": self.origin,
+            "channel": self.channel,
+            "seq": self.seq,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["sub_id"], d["zone_id"], decode_value(d["value"]), d["label"], d["ts"],
+                   d["origin"], d["channel"], d["seq"])
+
+def record_value(rec):
+    """The state a record carries, comparable with ==, or None."""
+    if rec.grid is not None:
+        return rec.grid
+    if rec.targets is not None:
+        return tuple(rec.targets)
+    if rec.zone_id is not None:
+        return rec.state
+    return rec.value
+
+def encode_value(value):
+    # Tagged so snapshots restore the same types
+    if isinstance(value, GridMap):
+        return {"map": bytes(value).hex()}
+    if isinstance(value, tuple):
+        return {"targets": [list(t) for t in value]}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"bytes": bytes(value).hex()}
+    return value
+
+def decode_value(value):
+    if isinstance(value, dict):
+        if "map" in value:
+            return GridMap.from_bytes(bytes.fromhex(value["map"]))
+        if "targets" in value:
+            return tuple(Target._make(t) for t in value["targets"])
+        if "bytes" in value:
+            return bytes.fromhex(value["bytes"])
+    return value
+
+class DeviceShadow:
+    def __init__(self):
+        self.entries = {}
+        # sub_id (None = everything) -> [callback(entry, previous)]
+        self.subscribers = {}
+        self.updates = 0
+        self.changes = 0
+
+    def update(self, ts, rec):
+        """Apply one decoded record; returns the new Entry if the value changed."""
+        origin = ORIGINS.get(rec.typ)
+        if origin is None or rec.request:
+            return None
+        value = record_value(rec)
+        if value is None:
+            return None
+        self.updates += 1
+        key = (rec.sub_id, rec.zone_id)
+        previous = self.entries.get(key)
+        entry = Entry(rec.sub_id, rec.zone_id, value, rec.label(), ts, origin, rec.channel, rec.seq)
+        self.entries[key] = entry
+        if previous is not None and previous.value == value:
+            return None
+        self.changes += 1
+        for sub_id in (rec.sub_id, None):
+            for callback in self.subscribers.get(sub_id, ()):
+                callback(entry, previous)
+        return entry
+
+    def subscribe(self, callback, key=None):
+        """Call callback(entry, previous) when an attribute (sub_id or name; None = any) changes."""
+        sub_id = None if key is None else lookup(key).sub_id
+        self.subscribers.setdefault(sub_id, []).append(callback)
+
+    def unsubscribe(self, callback, key=None):
+        sub_id = None if key is None else lookup(key).sub_id
+        self.subscribers.get(sub_id, []).remove(callback)
+
+    def get(self, key, zone_id=None):
+        """Latest Entry of an attribute (sub_id or name), or None."""
+        return self.entries.get((lookup(key).sub_id, zone_id))
+
+    def value(self, key, zone_id=None, default=None):
+        entry = self.get(key, zone_id)
+        return default if entry is None else entry.value
+
+    def zones(self, key):
+        """{zone_id: Entry} of a per-zone attribute."""
+        sub_id = lookup(key).sub_id
+        return {zone_id: entry for (s, zone_id), entry in self.entries.items() if s == sub_id and zone_id is not None}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(sorted(self.entries.values(), key=lambda e: (e.sub_id, -1 if e.zone_id is None else e.zone_id)))
+
+    def to_dict(self):
+        return {"time": time.time(), "entries": [entry.to_dict() for entry in self]}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        shadow = cls()
+        with open(path) as f:
+            for d in json.load(f)["entries"]:
+                entry = Entry.from_dict(d)
+                shadow.entries[entry.sub_id, entry.zone_id] = entry
+        return shadow
+
+    def lines(self):
+        lines = []
+        for entry in self:
+            zone = "" if entry.zone_id is None else f"[{entry.zone_id}]"
+            lines.append(f"{entry.name + zone:40s} {format_value(entry):40s} {entry.origin:8s} "
+                         f"{direction_name(entry.channel)}" + ("" if entry.ts is None else f" t{entry.ts:.3f}"))
+        return lines
+
+def format_value(entry):
+    value = entry.value
+    if isinstance(value, GridMap):
+        text = f"map, {value.count()} cells"
+    elif isinstance(value, tuple):
+        text = f"{len(value)} targets"
+    elif isinstance(value, (bytes, bytearray)):
+        text = value.hex() if len(value) <= 16 else f"{value[:16].hex()}... ({len(value)} bytes)"
+    else:
+        text = repr(value)
+    if entry.label is not None:
+        text += f" [{entry.label}]"
+    return text
+
+def format_change(entry, previous):
+    zone = "" if entry.zone_id is None else f"[{entry.zone_id}]"
+    when = "" if entry.ts is None else f"t{entry.ts:.3f} "
+    old = "unset" if previous is None else format_value(previous)
+    return f"{when}{entry.name}{zone}: {old} -> {format_value(entry)} ({entry.origin})"
+
+def run_shadow(args):
+    from .capture import read_records, iter_packets
+    from .protocol import decode_record
+
+    shadow = DeviceShadow.load(args.load) if args.load else DeviceShadow()
+    if args.changes:
+        def print_change(entry, previous):
+            print(format_change(entry, previous))
+        shadow.subscribe(print_change)
+    for path in args.file:
+        for ts, channel, offset, skip, packet in iter_packets(read_records(path)):
+            shadow.update(ts, decode_record(channel, packet))
+    if not args.changes:
+        print("\n".join(shadow.lines()))
+    if args.save:
+        shadow.save(args.save)
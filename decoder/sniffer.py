@@ -1,9 +1,8 @@
+import os
 import sys
 import logging
 import argparse
 import asyncio
-import time
-import struct
 from datetime import datetime
 
 from glasgow.cli import TerminalFormatter, wait_for_sigint
@@ -11,8 +10,11 @@ from glasgow.hardware.device import GlasgowDevice
 from glasgow.hardware.assembly import HardwareAssembly
 from glasgow.applet import GlasgowAppletMetadata, GlasgowAppletArguments
 
-from .framer import Framer
-from .protocol import decode_packet
+from .protocol import decode_record
+from .pipeline import Pipeline, RECORD_QUEUE_SIZE
+from .metrics import Metrics, serve_metrics
+from .xmodem import XmodemReassembler
+from .capture import ThreadedCaptureWriter, COMPRESS_EXTS, BINARY_EXT, TEXT_EXT
 
 def parse_args(applet_cls, args):
     applet_parser = argparse.ArgumentParser()
@@ -60,75 +62,10 @@ def extract_targets_from_packet(packet):
     if sub_id != 0x0117 or packet.typ != 5:
         return None
 
-    # Parse the target data
-    if len(packet.data) < 5:
-        return None
-
-    sub_data_len = packet.data[3] << 8 | packet.data[4]
-    sub_data = packet.data[5:5+sub_data_len]
-
-    if len(sub_data) == 0:
-        return None
+    return decode_record(1, packet).targets or None
 
-    count = sub_data[0]
-    targets = []
-
-    for n in range(count):
-        item_data = sub_data[1+(14*n):1+(14*(n+1))]
-        if len(item_data) == 14:
-            tid, x, y, z, velocity, snr, classifier, posture, active = struct.unpack(">BhhhhHBBB", item_data)
-            targets.append((tid, x, y, z, velocity, snr, classifier, posture, active))
-
-    return targets if targets else None
-
-async def applet_task(idx, uart, outfile, framer, exclude_names=None, visualizer=None):
-    while True:
-        data = await uart.read_all()
-        if len(data) > 0:
-            ts = time.time()
-            hex_data = " ".join("{:02x}".format(c) for c in data)
-            line = f"t{ts:.3f} {idx} {hex_data}"
-
-            # Write raw log
-            if outfile:
-                outfile.write(line + "\n")
-                outfile.flush()
-
-            # Feed framer
-            framer.add(data)
-
-            # Process packets immediately
-            while framer.packets:
-                packet = framer.packets.pop(0)
-                lines = decode_packet(idx, packet, exclude_names=exclude_names)
-                for l in lines:
-                    print(l)
-
-                # Update visualizer if enabled
-                if visualizer:
-                    targets = extract_targets_from_packet(packet)
-                    if targets:
-                        visualizer.update_targets(targets)
-
-async def inner(uart1, uart2, outfile, exclude_names=None, visualizer=None):
-    framers = [Framer(0), Framer(1)]
-
-    async with asyncio.TaskGroup() as group:
-        uart1_task = group.create_task(
-            applet_task(0, uart1.uart_iface, outfile, framers[0], exclude_names, visualizer),
-            name="uart1"
-        )
-        uart2_task = group.create_task(
-            applet_task(1, uart2.uart_iface, outfile, framers[1], exclude_names, visualizer),
-            name="uart2"
-        )
-        sigint_task = group.create_task(wait_for_sigint())
-        await asyncio.wait([
-            uart1_task,
-            uart2_task,
-            sigint_task
-        ])
-        sigint_task.cancel()
+async def inner(uart1, uart2, pipeline):
+    await pipeline.run([uart1.uart_iface, uart2.uart_iface], stop=wait_for_sigint())
 
 async def main(args):
     term_handler = create_logger()
@@ -138,7 +75,7 @@ async def main(args):
     visualizer = None
     if args.visualize:
         from .visualizer import TargetVisualizer
-        visualizer = TargetVisualizer()
+        visualizer = TargetVisualizer(trail_length=args.trail)
         visualizer.start()
         print("Visualization window started")
 
@@ -156,29 +93,82 @@ async def main(args):
     uart2.build(uart2_args)
 
     filename = args.out
-    outfile = None
-
-    if filename:
-        print(f"Writing raw capture to: {filename}")
-        outfile = open(filename, "w")
-    else:
-        # Auto-generate if not desired? Or strictly follow arg?
-        # Original script auto-generated. Let's start with auto-generate if not provided?
-        # Actually CLI default is None. Let's auto-generate if None to be safe.
+    if not filename:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"sniff_data_{timestamp}.txt"
-        print(f"Writing raw capture to: {filename}")
-        outfile = open(filename, "w")
+        ext = BINARY_EXT if args.format == "bin" else TEXT_EXT
+        filename = f"sniff_data_{timestamp}{ext}{COMPRESS_EXTS.get(args.compress, '')}"
+
+    outfile = ThreadedCaptureWriter(
+        filename, args.format, args.compress,
+        flush_interval=args.flush_interval,
+        rotate_bytes=args.rotate_size and int(args.rotate_size * 1024 * 1024),
+        rotate_seconds=args.rotate_time and args.rotate_time * 60,
+    )
+    print(f"Writing raw capture to: {outfile.paths[0]}")
+
+    metrics = Metrics()
+    server = None
+    if args.metrics_port:
+        server = serve_metrics(metrics, args.metrics_port)
+        print(f"Serving metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+
+    firmware = XmodemReassembler(args.firmware_out)
+
+    correlator = None
+    consumers = []
+    if args.correlate:
+        from .correlate import Correlator
+        correlator = Correlator()
+        consumers.append(correlator.add)
+
+    summary = None
+    if args.summary_window:
+        from .summary import RollingSummary
+        summary = RollingSummary(args.summary_window)
+
+    shadow = None
+    if args.shadow:
+        from .shadow import DeviceShadow
+        shadow = DeviceShadow.load(args.shadow) if os.path.exists(args.shadow) else DeviceShadow()
+        consumers.append(shadow.update)
+
+    room = None
+    if args.locate or visualizer is not None:
+        from .transform import make_tracker
+        room = make_tracker(args.mount, shadow)
 
     try:
         async with assembly:
             await uart1.setup(uart1_args)
             await uart2.setup(uart2_args)
 
-            await inner(uart1, uart2, outfile, args.exclude, visualizer)
+            pipeline = Pipeline(outfile, args.exclude, visualizer, queue_size=args.queue_size or RECORD_QUEUE_SIZE,
+                                metrics=metrics, stats_interval=args.stats_interval, consumers=consumers,
+                                firmware=firmware, packet_filter=args.filter, summary=summary,
+                                room=room, locate=args.locate)
+            try:
+                await inner(uart1, uart2, pipeline)
+            finally:
+                for line in pipeline.stats_lines():
+                    print(line, file=sys.stderr)
+                print(metrics.stats_line(), file=sys.stderr)
+                if summary is not None:
+                    print("\n".join(summary.table()), file=sys.stderr)
+                if correlator is not None:
+                    correlator.finish()
+                    print("\n".join(correlator.report()), file=sys.stderr)
+                firmware.close()
+                if firmware.transfers:
+                    print("\n".join(firmware.summary()), file=sys.stderr)
+                if shadow is not None:
+                    shadow.save(args.shadow)
+                    print(f"Saved device state ({len(shadow)} entries) to {args.shadow}", file=sys.stderr)
     finally:
-        if outfile:
-            outfile.close()
+        if server:
+            server.shutdown()
+        outfile.close()
+        if len(outfile.paths) > 1:
+            print(f"Capture rotated into {len(outfile.paths)} parts: {outfile.paths[0]} .. {outfile.paths[-1]}")
         if visualizer:
             visualizer.stop()
 
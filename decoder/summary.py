@@ -0,0 +1,308 @@
+"""Constant-memory capture summaries.
+
+Instead of one line per packet, a Summary counts packets and bytes per
+(direction, type, sub_id), keeps a payload-size histogram for each, a
+packet-rate timeline and the framers' drop reasons. Everything is keyed by
+values the protocol bounds (two channels, five types, the sub_ids in use),
+and the timeline keeps at most TIMELINE_BUCKETS buckets by doubling their
+width as the capture grows, so memory stays flat however long the capture
+is. Packets are counted from their frame header and sub_id without being
+decoded.
+
+RollingSummary keeps the same aggregations over the last few seconds of
+live traffic, as one Summary per second merged on demand.
+"""
+import json
+import math
+import time
+from collections import Counter, deque
+
+from .metrics import Histogram
+from .protocol import TYPE_NAMES, direction_name
+from .schema import sub_id_map
+
+# Payload size buckets, bytes (upper bounds)
+SIZE_BUCKETS = (2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+TIMELINE_BUCKETS = 120
+# Header (55 00 01 seq typ lenH lenL parity) plus CRC
+FRAME_OVERHEAD = 10
+ROLLING_WINDOW = 60.0  # seconds
+SPARK = " ▁▂▃▄▅▆▇█"
+
+class KeyStats:
+    __slots__ = ("count", "bytes", "sizes", "min_size", "max_size")
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.sizes = Histogram(SIZE_BUCKETS)
+        self.min_size = None
+        self.max_size = 0
+
+    def add(self, size):
+        self.count += 1
+        self.bytes += size + FRAME_OVERHEAD
+        self.sizes.observe(size)
+        if self.min_size is None or size < self.min_size:
+            self.min_size = size
+        if size > self.max_size:
+            self.max_size = size
+
+    def merge(self, other):
+        self.count += other.count
+        self.bytes += other.bytes
+        for i, n in enumerate(other.sizes.counts):
+            self.sizes.counts[i] += n
+        self.sizes.sum += other.sizes.sum
+        self.sizes.count += other.sizes.count
+        if other.min_size is not None and (self.min_size is None or other.min_size < self.min_size):
+            self.min_size = other.min_size
+        self.max_size = max(self.max_size, other.max_size)
+
+class Timeline:
+    """Packets per channel in fixed-width time buckets, at most max_buckets of them."""
+
+    def __init__(self, max_buckets=TIMELINE_BUCKETS, width=1.0):
+        self.max_buckets = max_buckets
+        self.width = width
+        self.start = None
+        self.counts = []
+        # Busiest whole second so far
+        self.second = None
+        self.second_counts = [0, 0]
+        self.peak = [0, 0]
+
+    def add(self, ts, channel, n=1):
+        if self.start is None:
+            self.start = math.floor(ts)
+        i = max(int((ts - self.start) // self.width), 0)
+        while i >= self.max_buckets:
+            # Halve the resolution
+            self.counts = [[a[0] + b[0], a[1] + b[1]] for a, b in
+                           zip(self.counts[0::2], self.counts[1::2] + [[0, 0]])]
+            self.width *= 2
+            i = max(int((ts - self.start) // self.width), 0)
+        while len(self.counts) <= i:
+            self.counts.append([0, 0])
+        self.counts[i][channel] += n
+
+        second = math.floor(ts)
+        if second != self.second:
+            self.second = second
+            self.second_counts = [0, 0]
+        self.second_counts[channel] += n
+        if self.second_counts[channel] > self.peak[channel]:
+            self.peak[channel] = self.second_counts[channel]
+
+    def rates(self, channel):
+        return [c[channel] / self.width for c in self.counts]
+
+def sparkline(values):
+    top = max(values, default=0)
+    if not top:
+        return SPARK[0] * len(values)
+    return "".join(SPARK[math.ceil(v / top * (len(SPARK) - 1))] for v in values)
+
+def _size(n):
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GiB"
+
+class Summary:
+    def __init__(self, timeline_buckets=TIMELINE_BUCKETS):
+        # (channel, typ, sub_id) -> KeyStats
+        self.keys = {}
+        self.timeline = Timeline(timeline_buckets)
+        self.first_ts = None
+        self.last_ts = None
+        self.resyncs = [Counter(), Counter()]
+        self.dropped_bytes = [Counter(), Counter()]
+        self.filtered = [0, 0]
+
+    def add(self, ts, channel, typ, sub_id, size):
+        stats = self.keys.get((channel, typ, sub_id))
+        if stats is None:
+            stats = self.keys[channel, typ, sub_id] = KeyStats()
+        stats.add(size)
+        if ts is not None:
+            if self.first_ts is None:
+                self.first_ts = ts
+            self.last_ts = ts
+            self.timeline.add(ts, channel)
+
+    def add_packet(self, ts, channel, packet):
+        data = packet.data
+        self.add(ts, channel, packet.typ, data[0] << 8 | data[1] if len(data) >= 2 else -1, len(data))
+
+    def add_record(self, ts, rec):
+        """Consumer for the sniffer pipeline."""
+        self.add(ts, rec.channel, rec.typ, rec.sub_id, len(rec.data))
+
+    def add_framers(self, framers):
+        """Add the drop counters of framers that have finished a capture."""
+        for framer in framers:
+            ch = framer.channel
+            self.resyncs[ch].update(framer.resyncs)
+            self.dropped_bytes[ch].update(framer.dropped_bytes)
+            self.filtered[ch] += framer.filtered
+
+    def merge(self, other):
+        for key, stats in other.keys.items():
+            mine = self.keys.get(key)
+            if mine is None:
+                mine = self.keys[key] = KeyStats()
+            mine.merge(stats)
+        if other.first_ts is not None:
+            if self.first_ts is None or other.first_ts < self.first_ts:
+                self.first_ts = other.first_ts
+            if self.last_ts is None or other.last_ts > self.last_ts:
+                self.last_ts = other.last_ts
+
+    @property
+    def duration(self):
+        if self.first_ts is None:
+            return None
+        return self.last_ts - self.first_ts
+
+    def _per_second(self, count):
+        duration = self.duration
+        return count / duration if duration else None
+
+    def rows(self):
+        """One dict per (direction, type, sub_id), busiest first."""
+        rows = []
+        for (channel, typ, sub_id), s in sorted(self.keys.items(), key=lambda kv: (-kv[1].count, kv[0])):
+            rows.append({
+                "channel": channel,
+                "direction": direction_name(channel),
+                "op": TYPE_NAMES.get(typ, str(typ)),
+                "sub_id": sub_id,
+                "name": sub_id_map.get(sub_id, "unknown"),
+                "count": s.count,
+                "bytes": s.bytes,
+                "rate": self._per_second(s.count),
+                "size_min": s.min_size,
+                "size_mean": s.sizes.sum / s.count,
+                "size_max": s.max_size,
+                "size_histogram": {str(bound): n for bound, n in zip(SIZE_BUCKETS + ("+Inf",), s.sizes.counts) if n},
+            })
+        return rows
+
+    def channel_totals(self, channel):
+        stats = [s for (ch, _, _), s in self.keys.items() if ch == channel]
+        count = sum(s.count for s in stats)
+        return {
+            "channel": channel,
+            "direction": direction_name(channel),
+            "count": count,
+            "bytes": sum(s.bytes for s in stats),
+            "rate": self._per_second(count),
+            "peak_rate": self.timeline.peak[channel],
+            "resyncs": dict(self.resyncs[channel]),
+            "dropped_bytes": dict(self.dropped_bytes[channel]),
+            "filtered": self.filtered[channel],
+        }
+
+    def to_dict(self):
+        timeline = self.timeline
+        return {
+            "start": self.first_ts,
+            "end": self.last_ts,
+            "duration": self.duration,
+            "channels": [self.channel_totals(ch) for ch in (0, 1)],
+            "timeline": {
+                "start": timeline.start,
+                "bucket_seconds": timeline.width,
+                "rates": [timeline.rates(ch) for ch in (0, 1)],
+            },
+            "attributes": self.rows(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=1)
+
+    def table(self):
+        lines = []
+        duration = self.duration
+        total = sum(s.count for s in self.keys.values())
+        span = f" over {duration:.1f}s" if duration is not None else " (no timestamps)"
+        lines.append(f"{total} packets, {_size(sum(s.bytes for s in self.keys.values()))}{span}")
+        for ch in (0, 1):
+            t = self.channel_totals(ch)
+            rate = f", {t['rate']:.1f} pkt/s (peak {t['peak_rate']}/s)" if t["rate"] is not None else ""
+            drops = ", ".join(f"{reason} {n} ({self.dropped_bytes[ch][reason]}B)" for reason, n in sorted(self.resyncs[ch].items()))
+            filtered = f", filtered {t['filtered']}" if t["filtered"] else ""
+            lines.append(f"  {t['direction']}: {t['count']} packets, {_size(t['bytes'])}{rate}, "
+                         f"drops: {drops or 'none'}{filtered}")
+        if self.timeline.counts:
+            lines.append(f"  rate per {self.timeline.width:g}s from t{self.timeline.start:.0f}:")
+            for ch in (0, 1):
+                rates = self.timeline.rates(ch)
+                lines.append(f"  {direction_name(ch):10s} |{sparkline(rates)}| max {max(rates):.1f}/s")
+        lines.append(f"{'direction':10s} {'op':3s} {'attribute':38s} {'sub_id':>6s} {'count':>8s} {'bytes':>9s} "
+                     f"{'pkt/s':>7s} {'size min/mean/max':>17s}")
+        for row in self.rows():
+            rate = "-" if row["rate"] is None else f"{row['rate']:.2f}"
+            sizes = f"{row['size_min']}/{row['size_mean']:.0f}/{row['size_max']}"
+            sub_id = f"{row['sub_id']:04x}" if row["sub_id"] >= 0 else "-"
+            lines.append(f"{row['direction']:10s} {row['op']:3s} {row['name']:38s} {sub_id:>6s} {row['count']:8d} "
+                         f"{_size(row['bytes']):>9s} {rate:>7s} {sizes:>17s}")
+        return lines
+
+class RollingSummary:
+    """Summary of the last window seconds of live traffic."""
+
+    def __init__(self, window=ROLLING_WINDOW, clock=time.time):
+        self.window = window
+        self.clock = clock
+        self.started = clock()
+        # (second, Summary, framer drop counters when the second started)
+        self.slots = deque()
+        self.framers = []
+
+    def attach(self, framers):
+        self.framers = list(framers)
+
+    def _drops(self):
+        return [(Counter(f.resyncs), Counter(f.dropped_bytes), f.filtered) for f in self.framers]
+
+    def _expire(self, now):
+        while self.slots and self.slots[0][0] <= now - self.window:
+            self.slots.popleft()
+
+    def add_record(self, ts, rec):
+        if ts is None:
+            ts = self.clock()
+        second = math.floor(ts)
+        if not self.slots or self.slots[-1][0] != second:
+            self._expire(second)
+            self.slots.append((second, Summary(), self._drops()))
+        self.slots[-1][1].add_record(ts, rec)
+
+    def summary(self):
+        """The window merged into one Summary."""
+        self._expire(math.floor(self.clock()))
+        merged = Summary()
+        for second, summary, _ in self.slots:
+            merged.merge(summary)
+            for ch in (0, 1):
+                n = sum(s.count for (c, _, _), s in summary.keys.items() if c == ch)
+                if n:
+                    merged.timeline.add(second, ch, n)
+        if self.slots:
+            # Drops since the oldest second in the window
+            for framer, (resyncs, dropped, filtered) in zip(self.framers, self.slots[0][2]):
+                ch = framer.channel
+                merged.resyncs[ch] = Counter(framer.resyncs) - resyncs
+                merged.dropped_bytes[ch] = Counter(framer.dropped_bytes) - dropped
+                merged.filtered[ch] = framer.filtered - filtered
+            # Rates over the whole window, not just the seconds with traffic
+            now = self.clock()
+            merged.first_ts = min(merged.first_ts, max(now - self.window, self.started))
+            merged.last_ts = max(merged.last_ts, now)
+        return merged
+
+    def table(self):
+        return [f"[summary, last {self.window:g}s]"] + self.summary().table()
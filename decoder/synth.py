@@ -0,0 +1,370 @@
+"""Synthetic FP2 UART traffic for framer stress testing.
+
+TrafficGenerator builds valid exchanges (standard frames with header
+parity and calc_crc trailer, encoded through the attribute schema) for a
+weighted mix of attributes and exchange kinds, optionally interleaved with
+an XMODEM-1K firmware transfer on the ESP->Radar channel. Corruptor then
+flips bits, drops bytes and inserts garbage at given per-byte rates while
+remembering which frames it touched, so framing the result can be checked
+against ground truth: every untouched frame must come out, and nothing
+that was never sent may.
+"""
+import binascii
+import heapq
+import random
+import time
+
+from .crc import calc_crc
+from .schema import (
+    ATTRIBUTES_BY_NAME, Target, UINT8, UINT16, UINT32, BOOL, BLOB1, BLOB2,
+    decode_grid_map, decode_zone_state, decode_zone_value,
+)
+
+RSP, WRT, ACK, REQ, REP = 1, 2, 3, 4, 5
+ESP, RADAR = 0, 1
+
+XMODEM_SOH = 0x01
+XMODEM_STX = 0x02
+XMODEM_EOT = 0x04
+
+BAUD = 890000
+BYTE_TIME = 10.0 / BAUD  # 8N1
+GAP = 0.0002  # seconds between frames
+# Mostly a few bytes per UART read, with the odd long one (as recorded)
+CHUNK_SIZES = (1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 32, 64, 128)
+CHUNK_WEIGHTS = (20, 16, 12, 10, 8, 7, 6, 6, 5, 4, 3, 2, 1)
+
+# Roughly the attribute mix of a busy capture
+DEFAULT_MIX = {
+    "location_track_data": 40,
+    "detect_zone_presence": 8,
+    "detect_zone_motion": 8,
+    "temperature": 4,
+    "radar_sw_version": 3,
+    "angle_sensor_data": 3,
+    "device_direction": 3,
+    "sleep_data": 3,
+    "zone_detect_setting": 2,
+    "edge_label": 1,
+    "interference_source": 1,
+    "monitor_mode": 1,
+    "left_right_reverse": 1,
+    "detect_zone_type": 1,
+    "location_report_enable": 1,
+    "debug_log": 1,
+}
+# report: Radar REP, ESP ACK. write: ESP WRT, Radar ACK.
+# request: Radar RSP (value request), ESP REQ with the value.
+DEFAULT_KINDS = {"report": 10, "write": 2, "request": 1}
+
+def build_frame(seq, typ, data):
+    """A standard frame: 55 00 01, seq, type, length, parity, data, CRC."""
+    head = bytearray((0x55, 0x00, 0x01, seq & 0xFF, typ, len(data) >> 8, len(data) & 0xFF))
+    head.append(((sum(head) - 1) & 0xFF) ^ 0xFF)
+    frame = head + data
+    return bytes(frame + calc_crc(frame))
+
+def build_xmodem_block(seq, payload):
+    """An XMODEM-CRC block; 128 byte payloads use SOH, 1024 byte ones STX."""
+    head = XMODEM_SOH if len(payload) == 128 else XMODEM_STX
+    return (bytes((head, seq & 0xFF, (seq & 0xFF) ^ 0xFF)) + payload
+            + binascii.crc_hqx(payload, 0).to_bytes(2, "big"))
+
+def xmodem_blocks(firmware, block_size=1024):
+    """Blocks of a whole transfer (seq from 1, last block padded with 0x1A)."""
+    for i, pos in enumerate(range(0, len(firmware), block_size)):
+        payload = firmware[pos:pos + block_size].ljust(block_size, b"\x1a")
+        yield build_xmodem_block(i + 1, payload)
+
+def random_value(attr, rng):
+    """(value, zone_id) for an attribute, shaped like real traffic."""
+    wire_type = attr.wire_type
+    if attr.name == "location_track_data":
+        return [Target(tid, rng.randint(-3000, 3000), rng.randint(0, 6000), rng.randint(-500, 500),
+                       rng.randint(-200, 200), rng.randint(0, 2000), rng.randint(0, 3), rng.randint(0, 4), 1)
+                for tid in rng.sample(range(1, 32), rng.randint(0, 5))], None
+    if attr.name == "zone_detect_setting":
+        return (rng.randint(1, 30), rng.randbytes(40)), None
+    if attr.decode is decode_grid_map:
+        return rng.randbytes(40), None
+    if attr.decode in (decode_zone_state, decode_zone_value):
+        return rng.randint(0, 3), rng.randint(0, 30)
+    if attr.enum is not None and attr.enum_on == "value":
+        return rng.choice(list(attr.enum)), None
+    if wire_type == UINT8:
+        return rng.randrange(0x100), None
+    if wire_type == UINT16:
+        return rng.randrange(0x10000), None
+    if wire_type == UINT32:
+        return rng.randrange(0x100000000), None
+    if wire_type == BOOL:
+        return rng.random() < 0.5, None
+    if wire_type == BLOB1:
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789 ") for _ in range(rng.randint(1, 48))), None
+    if wire_type == BLOB2:
+        return rng.randbytes(rng.randint(1, 32)), None
+    return None, None
+
+class TrafficGenerator:
+    """Endless valid FP2 traffic as (channel, frame bytes) pairs.
+
+    mix weights attributes by name and kinds weights exchange kinds (see
+    DEFAULT_KINDS); each exchange is an attribute frame plus its ACK or
+    answer on the other channel when acks is set. A firmware transfer of
+    xmodem_bytes, if any, is sent one block per xmodem_every exchanges.
+    """
+
+    def __init__(self, mix=None, kinds=None, acks=True, xmodem_bytes=0, xmodem_every=4, seed=0):
+        self.rng = random.Random(seed)
+        self.acks = acks
+        self.seq = [0, 0]
+        kinds = DEFAULT_KINDS if kinds is None else kinds
+        mix = DEFAULT_MIX if mix is None else mix
+        self.attrs = {}
+        for kind in kinds:
+            names = [name for name in mix if self._supports(ATTRIBUTES_BY_NAME[name], kind)]
+            if names and kinds[kind] > 0:
+                self.attrs[kind] = (names, [mix[name] for name in names])
+        if not self.attrs:
+            raise ValueError("no attribute in the mix supports the requested kinds")
+        self.kinds = list(self.attrs)
+        self.kind_weights = [kinds[kind] for kind in self.kinds]
+        self.xmodem = list(xmodem_blocks(self.rng.randbytes(xmodem_bytes))) if xmodem_bytes else []
+        self.xmodem_every = xmodem_every
+
+    @staticmethod
+    def _supports(attr, kind):
+        if attr.wire_type is None:
+            return False
+        if kind == "write":
+            return attr.rw in ("RW", "W")
+        if kind == "report":
+            return attr.rw != "W"
+        return True
+
+    def _next_seq(self, channel):
+        seq = self.seq[channel]
+        self.seq[channel] = (seq + 1) & 0xFF
+        return seq
+
+    def exchange(self):
+        """One attribute frame and its answer: list of (channel, frame)."""
+        rng = self.rng
+        kind = rng.choices(self.kinds, self.kind_weights)[0]
+        names, weights = self.attrs[kind]
+        attr = ATTRIBUTES_BY_NAME[rng.choices(names, weights)[0]]
+        value, zone_id = random_value(attr, rng)
+        payload = attr.encode_payload(value, zone_id)
+        if kind == "report":
+            seq = self._next_seq(RADAR)
+            out = [(RADAR, build_frame(seq, REP, payload))]
+            if self.acks:
+                # The ESP acknowledges with the report's seq
+                out.append((ESP, build_frame(seq, ACK, attr.encode_ack())))
+        elif kind == "write":
+            out = [(ESP, build_frame(self._next_seq(ESP), WRT, payload))]
+            if self.acks:
+                # The radar acknowledges with its own seq
+                out.append((RADAR, build_frame(self._next_seq(RADAR), ACK, attr.encode_ack())))
+        else:
+            seq = self._next_seq(RADAR)
+            out = [(RADAR, build_frame(seq, RSP, attr.encode_request()))]
+            if self.acks:
+                out.append((ESP, build_frame(seq, REQ, payload)))
+        return out
+
+    def frames(self, count=None):
+        """Yield (channel, frame bytes, is_xmodem) for count exchanges (endless if None)."""
+        blocks = self.xmodem + [bytes((XMODEM_EOT,))] if self.xmodem else []
+        pending = iter(blocks)
+        n = 0
+        while count is None or n < count:
+            for channel, frame in self.exchange():
+                yield channel, frame, False
+            n += 1
+            if blocks and n % self.xmodem_every == 0:
+                block = next(pending, None)
+                if block is not None:
+                    yield ESP, block, True
+
+class Corruptor:
+    """Corrupts a byte stream at per-byte rates, tracking what it hit.
+
+    Events are placed with exponential gaps, so cost is per event rather
+    than per byte.
+    """
+
+    def __init__(self, flip_rate=0.0, drop_rate=0.0, garbage_rate=0.0, garbage_len=(1, 16), seed=0):
+        self.rng = random.Random(seed)
+        self.rates = [("flip", flip_rate), ("drop", drop_rate), ("garbage", garbage_rate)]
+        self.garbage_len = garbage_len
+        self.total_rate = flip_rate + drop_rate + garbage_rate
+        self.events = {"flip": 0, "drop": 0, "garbage": 0}
+
+    def corrupt(self, frames):
+        """Corrupt a list of frames sent back to back on one channel.
+
+        Returns (parts, touched): the bytes sent in place of each frame, and
+        whether frame i was hit. Garbage inserted right before a frame goes
+        into its part but leaves it intact.
+        """
+        parts = []
+        touched = [False] * len(frames)
+        rng = self.rng
+        next_event = self._gap()
+        pos = 0
+        for i, frame in enumerate(frames):
+            end = pos + len(frame)
+            if next_event >= end:
+                parts.append(frame)
+                pos = end
+                continue
+            buf = bytearray(frame)
+            # Apply the events inside this frame from the back so offsets hold
+            hits = []
+            while next_event < end:
+                hits.append(next_event - pos)
+                next_event += 1 + self._gap()
+            garbage_before = bytearray()
+            for offset in reversed(hits):
+                kind = self._kind()
+                self.events[kind] += 1
+                if kind == "flip":
+                    buf[offset] ^= 1 << rng.randrange(8)
+                    touched[i] = True
+                elif kind == "drop":
+                    del buf[offset]
+                    touched[i] = True
+                elif offset == 0:
+                    garbage_before[:0] = rng.randbytes(rng.randint(*self.garbage_len))
+                else:
+                    buf[offset:offset] = rng.randbytes(rng.randint(*self.garbage_len))
+                    touched[i] = True
+            parts.append(bytes(garbage_before + buf))
+            pos = end
+        return parts, touched
+
+    def _gap(self):
+        if self.total_rate <= 0:
+            return float("inf")
+        return int(self.rng.expovariate(self.total_rate))
+
+    def _kind(self):
+        r = self.rng.random() * self.total_rate
+        for kind, rate in self.rates:
+            if r < rate:
+                return kind
+            r -= rate
+        return self.rates[-1][0]
+
+class SyntheticCapture:
+    """Generated traffic for both channels, corrupted, with ground truth."""
+
+    def __init__(self, generator, count, corruptor=None, gap=GAP):
+        # Frames go out one after another in generated order, so every ACK
+        # or answer starts after the frame it answers has ended
+        self.frames = ([], [])
+        self.xmodem = ([], [])
+        self.times = ([], [])
+        t = 0.0
+        for channel, frame, is_xmodem in generator.frames(count):
+            self.frames[channel].append(frame)
+            self.xmodem[channel].append(is_xmodem)
+            self.times[channel].append(t)
+            t += len(frame) * BYTE_TIME + gap
+        self.duration = t
+        self.parts = []
+        self.touched = []
+        for channel in (ESP, RADAR):
+            if corruptor is None:
+                self.parts.append(self.frames[channel])
+                self.touched.append([False] * len(self.frames[channel]))
+            else:
+                parts, touched = corruptor.corrupt(self.frames[channel])
+                self.parts.append(parts)
+                self.touched.append(touched)
+        self.streams = [b"".join(parts) for parts in self.parts]
+
+    def chunks(self, seed=0, t0=None):
+        """Cut both channels into UART-sized chunks, in wire time order.
+
+        Yields (timestamp, channel, data). Each chunk is stamped with the
+        time its last byte arrives at the baud rate, counting from t0
+        (default: now).
+        """
+        rng = random.Random(seed)
+        if t0 is None:
+            t0 = time.time()
+        per_channel = []
+        for channel in (ESP, RADAR):
+            out = []
+            for start, part in zip(self.times[channel], self.parts[channel]):
+                pos = 0
+                while pos < len(part):
+                    size = rng.choices(CHUNK_SIZES, CHUNK_WEIGHTS)[0]
+                    out.append((t0 + start + min(pos + size, len(part)) * BYTE_TIME, channel, part[pos:pos + size]))
+                    pos += size
+            per_channel.append(out)
+        yield from heapq.merge(*per_channel, key=lambda chunk: chunk[0])
+
+    def write(self, filename, fmt=None, seed=0):
+        """Write the chunked streams as a capture file; returns the record count."""
+        from .capture import open_writer
+        writer = open_writer(filename, fmt)
+        count = 0
+        try:
+            for ts, channel, data in self.chunks(seed):
+                writer.write(ts, channel, data)
+                count += 1
+        finally:
+            writer.close()
+        return count
+
+    def check(self, seed=0):
+        """Frame the chunked streams and compare with what was sent.
+
+        Returns a dict of counts per channel: sent, intact (untouched standard
+        frames), recovered (intact frames framed again), lost (intact frames
+        missed), false (framed packets never sent), plus the framer's resync
+        counters, XMODEM blocks seen and throughput.
+        """
+        from collections import Counter
+        from .framer import Framer
+
+        blocks = [0, 0]
+
+        def on_xmodem_block(channel, *args):
+            blocks[channel] += 1
+
+        framers = [Framer(ESP, on_xmodem_block=on_xmodem_block), Framer(RADAR, on_xmodem_block=on_xmodem_block)]
+        found = [Counter(), Counter()]
+        chunks = list(self.chunks(seed))
+        nbytes = sum(len(data) for _, _, data in chunks)
+        start = time.perf_counter()
+        for ts, channel, data in chunks:
+            for packet in framers[channel].feed(data):
+                found[channel][bytes(packet.raw)] += 1
+        elapsed = time.perf_counter() - start
+
+        result = {"bytes": nbytes, "seconds": elapsed, "bytes_per_s": nbytes / elapsed if elapsed else None}
+        for channel in (ESP, RADAR):
+            sent = Counter()
+            intact = Counter()
+            for frame, hit, is_xmodem in zip(self.frames[channel], self.touched[channel], self.xmodem[channel]):
+                if is_xmodem:
+                    continue
+                sent[frame] += 1
+                if not hit:
+                    intact[frame] += 1
+            got = found[channel]
+            recovered = sum(min(n, got[frame]) for frame, n in intact.items())
+            result[channel] = {
+                "sent": sum(sent.values()),
+                "intact": sum(intact.values()),
+                "recovered": recovered,
+                "lost": sum(intact.values()) - recovered,
+                "false": sum(n for frame, n in got.items() if frame not in sent),
+                "xmodem_blocks": blocks[channel],
+                "resyncs": dict(framers[channel].resyncs),
+            }
+        return result
@@ -0,0 +1,140 @@
+"""Bulk extraction of location_track_data (0x0117) targets into columns.
+
+Instead of unpacking each 14-byte target with struct, the target records of
+every report are concatenated and viewed through a big-endian structured
+dtype in one go, giving one NumPy array per field.
+"""
+import numpy as np
+
+from .capture import read_records, iter_packets
+
+LOCATION_TRACK_DATA = 0x0117
+REPORT = 5
+
+# Same layout as schema.TARGET_STRUCT (">BhhhhHBBB")
+TARGET_DTYPE = np.dtype([
+    ("tid", "u1"),
+    ("x", ">i2"),
+    ("y", ">i2"),
+    ("z", ">i2"),
+    ("velocity", ">i2"),
+    ("snr", ">u2"),
+    ("classifier", "u1"),
+    ("posture", "u1"),
+    ("active", "u1"),
+])
+
+COLUMNS = ("timestamp", "frame", "tid", "x", "y", "z", "velocity", "snr", "classifier", "posture", "active")
+
+def save_columns(path, columns, **extra):
+    """Save named 1-D columns as .npz (default), .parquet or .csv, by extension.
+
+    extra arrays (not row-aligned) only go into .npz files.
+    """
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        pq.write_table(pa.table(columns), path)
+    elif path.endswith(".csv"):
+        names = list(columns)
+        with open(path, "w") as f:
+            f.write(",".join(names) + "\n")
+            for row in zip(*(columns[n].tolist() for n in names)):
+                f.write(",".join(str(v) for v in row) + "\n")
+    else:
+        np.savez_compressed(path, **extra, **columns)
+
+class Tracks:
+    """Columnar target table: one row per target per location report.
+
+    frame numbers the reports, so rows sharing a frame were reported
+    together. frame_times holds the timestamp of every report, including
+    the ones that carried no targets.
+    """
+
+    def __init__(self, columns, frame_times=None):
+        self.columns = columns
+        if frame_times is None:
+            frame = columns["frame"]
+            frame_times = np.full(int(frame[-1]) + 1 if len(frame) else 0, np.nan)
+            frame_times[frame] = columns["timestamp"]
+        self.frame_times = frame_times
+
+    def __len__(self):
+        return len(self.columns["tid"])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def select(self, mask):
+        return Tracks({name: col[mask] for name, col in self.columns.items()}, self.frame_times)
+
+    def tids(self):
+        return np.unique(self.columns["tid"])
+
+    def by_tid(self, tid):
+        return self.select(self.columns["tid"] == tid)
+
+    def save(self, path):
+        """Save as .npz (default), .parquet or .csv, by extension."""
+        save_columns(path, self.columns, frame_times=self.frame_times)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            columns = {name: f[name] for name in f.files if name != "frame_times"}
+            frame_times = f["frame_times"] if "frame_times" in f.files else None
+        return cls(columns, frame_times)
+
+class TrackExtractor:
+    """Collects target records from packets, then decodes them all at once."""
+
+    def __init__(self):
+        self.buf = bytearray()
+        self.times = []
+        self.counts = []
+
+    def add(self, ts, packet):
+        data = packet.data
+        if packet.typ != REPORT or len(data) < 6 or (data[0] << 8 | data[1]) != LOCATION_TRACK_DATA:
+            return
+        sub_data_len = data[3] << 8 | data[4]
+        sub_data = data[5:5+sub_data_len]
+        if not sub_data:
+            return
+        count = min(sub_data[0], (len(sub_data) - 1) // TARGET_DTYPE.itemsize)
+        self.buf += sub_data[1:1+count*TARGET_DTYPE.itemsize]
+        self.times.append(np.nan if ts is None else ts)
+        self.counts.append(count)
+
+    def tracks(self):
+        targets = np.frombuffer(bytes(self.buf), dtype=TARGET_DTYPE)
+        counts = np.asarray(self.counts, dtype=np.intp)
+        frame_times = np.asarray(self.times, dtype=np.float64)
+        columns = {
+            "timestamp": np.repeat(frame_times, counts),
+            "frame": np.repeat(np.arange(len(counts), dtype=np.int64), counts),
+        }
+        for name in TARGET_DTYPE.names:
+            # Convert to native byte order so downstream maths is fast
+            columns[name] = targets[name].astype(TARGET_DTYPE[name].newbyteorder("="))
+        return Tracks(columns, frame_times)
+
+def extract_tracks(packets):
+    """Build a Tracks table from (ts, channel, packet) tuples."""
+    extractor = TrackExtractor()
+    for ts, channel, packet in packets:
+        if channel == 1:
+            extractor.add(ts, packet)
+    return extractor.tracks()
+
+def extract_tracks_from_file(path):
+    def radar_packets():
+        # Targets are only ever reported by the radar, so skip the ESP side
+        records = (r for r in read_records(path) if r[1] == 1)
+        for ts, channel, offset, skip, packet in iter_packets(records):
+            yield ts, channel, packet
+    return extract_tracks(radar_packets())
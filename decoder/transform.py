@@ -0,0 +1,228 @@
+"""Target coordinates to room coordinates, grid cells and zones (PROTOCOL.md 5).
+
+location_track_data reports raw x/y whose meaning depends on how the
+sensor is mounted (wall_corner_mount_position, 0x0170) and whether left
+and right are swapped (left_right_reverse, 0x0122). A Transform converts
+whole arrays of raw x/y for one mounting mode into room coordinates
+(metres from the top-left corner of the covered area, as seen from the
+sensor) and cells of the 20x16 grid used by the zone maps.
+
+A ZoneLookup turns a set of zone maps into one (20, 16) table holding, for
+every cell, a bitmask of the zones covering it, so finding the zones of N
+points is one fancy-indexing gather instead of N x zones map tests.
+
+RoomTracker follows the mounting mode and the zone maps (zone_detect_setting,
+0x0114) through a stream of records, for decode and the sniffer pipeline.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from .gridmap import ROWS, COLS, stack
+
+WALL, LEFT_CORNER, RIGHT_CORNER = 1, 2, 3
+CONSISTENT, OPPOSITE, AUTO = 0, 1, 2
+MOUNT_NAMES = {"wall": WALL, "left-corner": LEFT_CORNER, "right-corner": RIGHT_CORNER}
+
+WALL_CORNER_MOUNT_POSITION = 0x0170
+LEFT_RIGHT_REVERSE = 0x0122
+ZONE_DETECT_SETTING = 0x0114
+
+CELL_M = 0.5
+# Raw units per grid cell: raw x/y are centimetres
+CELL_RAW = 50
+MAX_ZONES = 64
+
+# mode -> (raw x span, raw y span). x runs from +400 at the left edge to
+# -400 at the right edge (5.1), y from 0 at the sensor down the room. 5.1
+# converts corner coordinates with 800 raw units over 14 cells, but that
+# puts the targets of sniff_data_zone_enter_exit.txt and test_data4.txt
+# (right corner) a column off the zone the radar reports them in; 50 units
+# a cell over the whole 16 columns of the map puts them inside it, and
+# outside it when the radar reports the zone empty. 5.2 leaves the wall
+# mode scaling open; it is taken to be the same, over the whole 8m x 10m map.
+LAYOUTS = {
+    LEFT_CORNER: (800, 800),
+    RIGHT_CORNER: (800, 800),
+    WALL: (800, 1000),
+}
+
+# left_right_reverse -> whether x is mirrored. Auto leaves the choice to
+# the radar, which reports the right corner captures (all auto) the 5.1 way
+# round, so it is taken as consistent.
+MIRROR = {CONSISTENT: False, OPPOSITE: True, AUTO: False}
+
+Located = namedtuple("Located", "room_x room_y row col zones")
+
+class Transform:
+    """Raw target x/y to room and grid coordinates for one mounting mode.
+
+    Column 0 is the left edge (x = +400) unless left_right_reverse mirrors
+    it, see MIRROR. Unknown modes fall back to the left corner layout and
+    unknown reverse values to consistent.
+    """
+
+    def __init__(self, mount=LEFT_CORNER, reverse=CONSISTENT):
+        self.mount = mount
+        self.reverse = reverse
+        self.x_span, self.y_span = LAYOUTS.get(mount, LAYOUTS[LEFT_CORNER])
+        self.cols = self.x_span // CELL_RAW
+        self.rows = self.y_span // CELL_RAW
+        self.mirror = MIRROR.get(reverse, False)
+
+    def __repr__(self):
+        return f"<Transform mount={self.mount} reverse={self.reverse}>"
+
+    def __eq__(self, other):
+        return isinstance(other, Transform) and (self.mount, self.reverse) == (other.mount, other.reverse)
+
+    def to_grid(self, x, y):
+        """Float (column, row) in grid cells, 0 at the room's top-left corner."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        gx = (self.x_span / 2 - x) / CELL_RAW
+        if self.mirror:
+            gx = self.cols - gx
+        return gx, y / CELL_RAW
+
+    def to_map(self, x, y):
+        """Float (column, row) in grid map cells, for plotting over zone maps.
+
+        The room starts at the map's top-left corner in every mode, so this
+        is to_grid.
+        """
+        return self.to_grid(x, y)
+
+    def to_room(self, x, y):
+        """(x, y) in metres from the room's top-left corner."""
+        gx, gy = self.to_grid(x, y)
+        return gx * CELL_M, gy * CELL_M
+
+    def to_cells(self, x, y):
+        """Integer (row, col) of the grid map cells, -1 for points outside the room."""
+        gx, gy = self.to_grid(x, y)
+        inside = (gx >= 0) & (gx < self.cols) & (gy >= 0) & (gy < self.rows)
+        row = np.where(inside, np.floor(gy), -1).astype(np.intp)
+        col = np.where(inside, np.floor(gx), -1).astype(np.intp)
+        return row, col
+
+class ZoneLookup:
+    """Per-cell bitmask of the zones covering it.
+
+    Bit i stands for zone_ids[i]. The table has a spare all-zero row and
+    column, so cell (-1, -1), which to_cells gives points outside the room,
+    is in no zone without a separate mask.
+    """
+
+    def __init__(self, zones):
+        """zones: {zone_id: GridMap}; empty maps (deleted zones) are left out."""
+        ids = sorted(zone for zone, grid in zones.items() if grid)
+        if len(ids) > MAX_ZONES:
+            raise ValueError(f"at most {MAX_ZONES} zones, got {len(ids)}")
+        self.zone_ids = np.array(ids, dtype=np.int64)
+        self.table = np.zeros((ROWS + 1, COLS + 1), dtype=np.uint64)
+        if ids:
+            maps = stack([zones[zone] for zone in ids]).astype(np.uint64)
+            bits = np.arange(len(ids), dtype=np.uint64)[:, None, None]
+            self.table[:ROWS, :COLS] = np.bitwise_or.reduce(maps << bits, axis=0)
+
+    def __len__(self):
+        return len(self.zone_ids)
+
+    def masks(self, row, col):
+        """Zone bitmask of each (row, col) cell."""
+        return self.table[row, col]
+
+    def bit(self, zone_id):
+        (i,) = np.flatnonzero(self.zone_ids == zone_id)
+        return np.uint64(1) << np.uint64(i)
+
+    def contains(self, masks, zone_id):
+        """Bool array: which masks include zone_id (all False for an unknown zone)."""
+        if zone_id not in self.zone_ids:
+            return np.zeros(np.shape(masks), dtype=bool)
+        return (masks & self.bit(zone_id)) != 0
+
+    def matrix(self, masks):
+        """(N, zones) bool array, column i for zone_ids[i]."""
+        shifts = np.arange(len(self.zone_ids), dtype=np.uint64)
+        return ((np.asarray(masks)[:, None] >> shifts) & np.uint64(1)).astype(bool)
+
+    def zones(self, mask):
+        """Zone ids in one mask."""
+        mask = int(mask)
+        return [int(zone) for i, zone in enumerate(self.zone_ids) if mask >> i & 1]
+
+def locate(x, y, transform, lookup=None):
+    """Located arrays for raw target x/y; zones are bitmasks over lookup.zone_ids."""
+    room_x, room_y = transform.to_room(x, y)
+    row, col = transform.to_cells(x, y)
+    zones = lookup.masks(row, col) if lookup is not None else np.zeros(len(row), dtype=np.uint64)
+    return Located(room_x, room_y, row, col, zones)
+
+class RoomTracker:
+    """Mounting mode and zone maps as seen so far in a stream of records.
+
+    update() is a pipeline consumer; records are taken the way the device
+    shadow takes them (writes, reports and answered requests).
+    """
+
+    def __init__(self, mount=LEFT_CORNER, reverse=CONSISTENT):
+        self.transform = Transform(mount, reverse)
+        self.zone_maps = {}
+        self._lookup = None
+
+    @classmethod
+    def from_shadow(cls, shadow, mount=LEFT_CORNER, reverse=CONSISTENT):
+        """Start from the mounting mode and zones held by a DeviceShadow."""
+        tracker = cls(shadow.value(WALL_CORNER_MOUNT_POSITION, default=mount),
+                      shadow.value(LEFT_RIGHT_REVERSE, default=reverse))
+        for zone, entry in shadow.zones(ZONE_DETECT_SETTING).items():
+            tracker.zone_maps[zone] = entry.value
+        return tracker
+
+    @property
+    def lookup(self):
+        if self._lookup is None:
+            self._lookup = ZoneLookup(self.zone_maps)
+        return self._lookup
+
+    def update(self, ts, rec):
+        if rec.typ not in (2, 4, 5) or rec.request:
+            return
+        sub_id = rec.sub_id
+        if sub_id == WALL_CORNER_MOUNT_POSITION and isinstance(rec.value, int):
+            self.transform = Transform(rec.value, self.transform.reverse)
+        elif sub_id == LEFT_RIGHT_REVERSE and isinstance(rec.value, int):
+            self.transform = Transform(self.transform.mount, rec.value)
+        elif sub_id == ZONE_DETECT_SETTING and rec.grid is not None and rec.zone_id is not None:
+            self.zone_maps[rec.zone_id] = rec.grid
+            self._lookup = None
+
+    def locate(self, targets):
+        """Located arrays for a list of schema.Target."""
+        x = np.fromiter((t.x for t in targets), dtype=np.float64, count=len(targets))
+        y = np.fromiter((t.y for t in targets), dtype=np.float64, count=len(targets))
+        return locate(x, y, self.transform, self.lookup)
+
+    def format_targets(self, targets):
+        """Text lines with the room position, cell and zones of each target."""
+        located = self.locate(targets)
+        lookup = self.lookup
+        lines = []
+        for t, room_x, room_y, row, col, mask in zip(targets, *located):
+            cell = f"({row},{col})" if row >= 0 else "outside"
+            zones = ",".join(str(z) for z in lookup.zones(mask)) or "-"
+            lines.append(f"      #{t.tid}: room {room_x:.2f}m, {room_y:.2f}m cell {cell} zones {zones}")
+        return lines
+
+def make_tracker(mount=None, shadow=None):
+    """RoomTracker for the --mount option (a MOUNT_NAMES key), starting from a shadow if given.
+
+    An explicit mount overrides the shadow's; either way the mounting mode
+    follows the writes seen afterwards.
+    """
+    tracker = RoomTracker.from_shadow(shadow) if shadow is not None else RoomTracker()
+    if mount is not None:
+        tracker.transform = Transform(MOUNT_NAMES[mount], tracker.transform.reverse)
+    return tracker
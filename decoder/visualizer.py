@@ -2,111 +2,161 @@ import matplotlib
 matplotlib.use('QtAgg')  # Set interactive backend before importing pyplot
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-from multiprocessing import Process, Queue
+from collections import deque
+from multiprocessing import Process, Array
 import numpy as np
 import time
 
-def visualizer_process(queue, x_range, y_range):
-    """Process function to run matplotlib visualization."""
+from .gridmap import ROWS, COLS
+from .transform import Transform
+
+# Latest-value channel layout (doubles): [update counter, target count,
+# then tid, x, y for up to MAX_TARGETS targets]
+MAX_TARGETS = 32
+HEADER = 2
+FIELDS = 3
+
+FRAME_INTERVAL = 1000 / 60  # ms
+TRAIL_LENGTH = 0  # positions kept per target, 0 = no trails
+
+def read_latest(shared):
+    """Copy (update counter, {tid: (x, y)}) out of the shared array."""
+    with shared.get_lock():
+        values = shared[:HEADER + int(shared[1]) * FIELDS]
     targets = {}
+    for i in range(HEADER, len(values), FIELDS):
+        targets[int(values[i])] = (values[i + 1], values[i + 2])
+    return int(values[0]), targets
 
+def visualizer_process(shared, x_range, y_range, trail_length=TRAIL_LENGTH):
+    """Process function to run matplotlib visualization."""
     fig, ax = plt.subplots(figsize=(10, 8))
     ax.set_xlim(x_range)
-    ax.set_ylim(y_range)
-    ax.set_xlabel('X Position (mm)')
-    ax.set_ylabel('Y Position (mm)')
+    # Row 0 (nearest the sensor) at the top, as the grid maps are drawn
+    ax.set_ylim(y_range[::-1])
+    ax.set_xlabel('Column (0.5 m cells)')
+    ax.set_ylabel('Row (0.5 m cells)')
     ax.set_title('Target Position Tracking')
     ax.grid(True, alpha=0.3)
     ax.set_aspect('equal')
 
-    scatter = ax.scatter([], [], c='blue', s=100, alpha=0.6, edgecolors='black')
-    annotations = {}
+    colors = plt.get_cmap('tab10')
+    trail_scatter = ax.scatter([], [], s=20, edgecolors='none', animated=True)
+    scatter = ax.scatter([], [], c='blue', s=100, alpha=0.6, edgecolors='black', animated=True)
+    # Label pool, reused across frames instead of recreated
+    labels = [ax.text(0, 0, "", fontsize=8, color='red', visible=False, animated=True)
+              for _ in range(MAX_TARGETS)]
+    status = ax.text(0.01, 0.99, "", transform=ax.transAxes, va='top', fontsize=8, animated=True)
+    artists = [trail_scatter, scatter, status] + labels
+
+    trails = {}
+    state = {"seq": 0, "targets": {}, "updates": 0, "dropped": 0, "frames": deque(maxlen=60)}
+
+    def update_trails(targets):
+        for tid, pos in targets.items():
+            if tid not in trails:
+                trails[tid] = deque(maxlen=trail_length)
+            trails[tid].append(pos)
+        # Trails of targets that left fade out one step per update
+        for tid in list(trails):
+            if tid not in targets:
+                trails[tid].popleft()
+                if not trails[tid]:
+                    del trails[tid]
+
+    def draw_trails():
+        points = []
+        rgba = []
+        for tid, trail in trails.items():
+            r, g, b, _ = colors(tid % 10)
+            n = len(trail)
+            for age, pos in enumerate(trail):
+                points.append(pos)
+                rgba.append((r, g, b, 0.5 * (age + 1) / max(n, 1)))
+        trail_scatter.set_offsets(np.array(points) if points else np.empty((0, 2)))
+        trail_scatter.set_facecolors(rgba)
 
     def animate(frame):
-        nonlocal targets, annotations
-
-        # Process all queued updates
-        while not queue.empty():
-            try:
-                targets = queue.get_nowait()
-            except:
-                break
-
-        if not targets:
-            scatter.set_offsets(np.empty((0, 2)))
-            for ann in annotations.values():
-                ann.remove()
-            annotations.clear()
-            return scatter,
-
-        # Extract positions and IDs
-        tids = list(targets.keys())
-        positions = list(targets.values())
-        xs = [pos[0] for pos in positions]
-        ys = [pos[1] for pos in positions]
-
-        # Update scatter plot
-        scatter.set_offsets(list(zip(xs, ys)))
-
-        # Update annotations
-        for ann in annotations.values():
-            ann.remove()
-        annotations.clear()
-
-        for tid, x, y in zip(tids, xs, ys):
-            ann = ax.annotate(f"T{tid}", (x, y),
-                            xytext=(5, 5), textcoords='offset points',
-                            fontsize=8, color='red')
-            annotations[tid] = ann
-
-        return scatter,
+        seq, targets = read_latest(shared)
+        if seq != state["seq"]:
+            # Updates overwritten before this frame could show them
+            state["dropped"] += max(seq - state["seq"] - 1, 0)
+            state["updates"] += seq - state["seq"]
+            state["seq"] = seq
+            state["targets"] = targets
+            if trail_length:
+                update_trails(targets)
+                draw_trails()
+        targets = state["targets"]
+
+        scatter.set_offsets(np.array(list(targets.values())) if targets else np.empty((0, 2)))
+        for label, (tid, (x, y)) in zip(labels, targets.items()):
+            label.set_text(f"T{tid}")
+            label.set_position((x, y))
+            label.set_visible(True)
+        for label in labels[len(targets):]:
+            label.set_visible(False)
+
+        now = time.monotonic()
+        frames = state["frames"]
+        frames.append(now)
+        fps = (len(frames) - 1) / (now - frames[0]) if len(frames) > 1 and now > frames[0] else 0.0
+        status.set_text(f"{fps:.0f} FPS  updates {state['updates']}  dropped {state['dropped']}")
+        return artists
 
     anim = animation.FuncAnimation(
         fig,
         animate,
-        interval=100,
-        blit=False,
+        interval=FRAME_INTERVAL,
+        blit=True,
         cache_frame_data=False
     )
 
     plt.show(block=True)
 
-SCALE = (1.0 / 800.0) * 14.0
-X_OFFSET = 400
-
 class TargetVisualizer:
-    """Real-time visualizer for target positions using multiprocessing."""
+    """Real-time visualizer for target positions using multiprocessing.
+
+    Only the latest target set is kept, in shared memory: the plot draws
+    whatever is newest at each frame and counts the updates it skipped,
+    so a burst of reports never builds a backlog.
 
-    def __init__(self, x_range=(0, 14), y_range=(0, 14)):
+    Positions are drawn in cells of the 20x16 zone grid, converted by a
+    transform.Transform for the mounting mode.
+    """
+
+    def __init__(self, x_range=(0, COLS), y_range=(0, ROWS), trail_length=TRAIL_LENGTH, transform=None):
         self.x_range = x_range
         self.y_range = y_range
-        self.queue = Queue()
+        self.trail_length = trail_length
+        self.transform = transform if transform is not None else Transform()
+        self.shared = Array('d', HEADER + MAX_TARGETS * FIELDS)
+        self.updates = 0
         self.process = None
 
-    def update_targets(self, target_list):
+    def update_targets(self, target_list, transform=None):
         """Update target positions from decoded location_track_data.
 
         Args:
             target_list: List of tuples (tid, x, y, z, velocity, snr, classifier, posture, active)
+            transform: Transform to use instead of self.transform (the mounting mode seen last)
         """
-        # Build target dict and send to visualization process
-        targets = {}
-        for target in target_list:
-            tid, x, y = target[0], target[1], target[2]
-            targets[tid] = ((x + X_OFFSET) * SCALE, y * SCALE)
-
-        # Non-blocking send to queue
-        try:
-            self.queue.put_nowait(targets)
-        except:
-            # Queue full, skip this update
-            pass
+        targets = np.array([t[:3] for t in target_list[:MAX_TARGETS]], dtype=np.float64).reshape(-1, 3)
+        col, row = (transform if transform is not None else self.transform).to_map(targets[:, 1], targets[:, 2])
+        values = np.column_stack((targets[:, 0], col, row)).ravel().tolist()
+
+        self.updates += 1
+        shared = self.shared
+        with shared.get_lock():
+            shared[0] = self.updates
+            shared[1] = len(values) // FIELDS
+            shared[HEADER:HEADER + len(values)] = values
 
     def start(self):
         """Start the visualizer in a separate process."""
         self.process = Process(
             target=visualizer_process,
-            args=(self.queue, self.x_range, self.y_range),
+            args=(self.shared, self.x_range, self.y_range, self.trail_length),
             daemon=True
         )
         self.process.start()
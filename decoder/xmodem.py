@@ -0,0 +1,231 @@
+"""Streaming reassembly of XMODEM(-1K) firmware transfers.
+
+The framer CRC-checks every SOH/STX block and hands (channel, seq, payload)
+to XmodemReassembler.on_xmodem_block. Blocks are written straight into a
+preallocated image, in memory or in a file, at the offset their sequence
+number implies, so a transfer never needs to be buffered or sorted. Seq
+is 8 bits and starts at 1, so the absolute block number is tracked across
+wraps: a repeat of the last seq is a retry (the sender resending after a
+NAK or a lost ACK), a jump forward leaves a gap of missing blocks, and a
+seq 1 that does not follow on starts a new transfer.
+"""
+import hashlib
+import os
+import sys
+import time
+
+# Initial image size, doubled as needed
+IMAGE_CAPACITY = 1024 * 1024
+# XMODEM pads the last block with this
+PAD_BYTE = 0x1A
+
+class Transfer:
+    """One firmware image being received."""
+
+    def __init__(self, channel, start_ts, path=None, capacity=IMAGE_CAPACITY):
+        self.channel = channel
+        self.path = path
+        self.capacity = capacity
+        self.file = None
+        self.image = None
+        if path:
+            # Preallocate on disk, then write blocks in place
+            self.file = open(path, "w+b")
+            self.file.truncate(capacity)
+        else:
+            self.image = bytearray(capacity)
+        self.start_ts = start_ts
+        self.end_ts = start_ts
+        self.blocks = 0
+        self.received = 0  # payload bytes, retries included
+        self.retries = 0
+        self.mismatched_retries = 0
+        self.stale = 0
+        self.missing = []  # absolute block numbers never received
+        self.size = 0  # end of the highest block written
+        self.block = 0  # absolute number of the last block (1 = first)
+        self.offset = 0  # image offset of the last block
+        self.last_len = 0
+        self.last_seq = None
+
+    def _ensure(self, end):
+        if end <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < end:
+            capacity *= 2
+        if self.file:
+            self.file.truncate(capacity)
+        else:
+            self.image.extend(bytes(capacity - self.capacity))
+        self.capacity = capacity
+
+    def _write(self, offset, payload):
+        end = offset + len(payload)
+        self._ensure(end)
+        if self.file:
+            os.pwrite(self.file.fileno(), payload, offset)
+        else:
+            self.image[offset:end] = payload
+        if end > self.size:
+            self.size = end
+
+    def _read(self, offset, length):
+        if self.file:
+            return os.pread(self.file.fileno(), length, offset)
+        if self.image is None:
+            # Closed; the file holds the trimmed image
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+        return bytes(self.image[offset:offset + length])
+
+    def add(self, ts, seq, payload):
+        self.end_ts = ts
+        length = len(payload)
+        self.received += length
+        if self.last_seq is None:
+            # First block of the transfer is seq 1 (or whatever we joined at)
+            self.block = 1
+            self.offset = 0
+            delta = 1
+        else:
+            delta = (seq - self.last_seq) & 0xFF
+            if delta == 0:
+                self.retries += 1
+                if self._read(self.offset, length) != bytes(payload):
+                    # A retry with different contents: keep the newer one
+                    self.mismatched_retries += 1
+                    self._write(self.offset, payload)
+                return
+            if delta >= 128:
+                # Behind the last block; nothing in XMODEM goes back
+                self.stale += 1
+                return
+            skipped = delta - 1
+            self.missing.extend(range(self.block + 1, self.block + 1 + skipped))
+            # Missing blocks are assumed to be the size of this one
+            self.offset += self.last_len + skipped * length
+            self.block += delta
+        self.last_seq = seq
+        self.last_len = length
+        self.blocks += 1
+        self._write(self.offset, payload)
+
+    @property
+    def duration(self):
+        return max(self.end_ts - self.start_ts, 0.0)
+
+    @property
+    def throughput(self):
+        """Payload bytes per second, counting retries."""
+        return self.received / self.duration if self.duration else 0.0
+
+    def data(self, strip_padding=True):
+        """The image received so far (missing blocks are zero-filled)."""
+        data = self._read(0, self.size)
+        if strip_padding:
+            data = data.rstrip(bytes((PAD_BYTE,)))
+        return data
+
+    def close(self, strip_padding=True):
+        """Trim the preallocated file to the image size."""
+        if self.file:
+            size = len(self.data(strip_padding)) if strip_padding else self.size
+            self.file.truncate(size)
+            self.file.close()
+            self.file = None
+
+    def summary(self):
+        data = self.data()
+        lines = [
+            f"transfer on channel {self.channel}: {self.blocks} blocks, {len(data)} bytes "
+            f"({self.size - len(data)} padding) in {self.duration:.2f}s, {self.throughput / 1024:.1f} KiB/s",
+            f"  retries {self.retries} ({self.mismatched_retries} with different data), stale {self.stale}, "
+            f"missing {len(self.missing)}" + (f" (blocks {format_ranges(self.missing)})" if self.missing else ""),
+            f"  sha256 {hashlib.sha256(data).hexdigest()}",
+        ]
+        if self.path:
+            lines.append(f"  written to {self.path}")
+        return lines
+
+def format_ranges(numbers):
+    """[1, 2, 3, 7] -> "1-3, 7"."""
+    ranges = []
+    for n in numbers:
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+def image_path(out, index):
+    """out for the first transfer, out.N.ext for later ones."""
+    if index == 0:
+        return out
+    stem, ext = os.path.splitext(out)
+    return f"{stem}.{index}{ext}"
+
+class XmodemReassembler:
+    """Collects the XMODEM blocks the framers find into Transfers.
+
+    clock gives the timestamp of the block being framed (time.time for
+    live traffic; captures pass the current record's timestamp).
+    """
+
+    def __init__(self, out=None, capacity=IMAGE_CAPACITY, clock=time.time):
+        self.out = out
+        self.capacity = capacity
+        self.clock = clock
+        self.transfers = []
+        self.current = [None, None]
+
+    def on_xmodem_block(self, channel, seq, payload):
+        ts = self.clock()
+        if ts is None:
+            ts = 0.0
+        transfer = self.current[channel]
+        if transfer is not None and seq == 1 and transfer.last_seq not in (0, 1) and transfer.blocks > 1:
+            # Starting over: a new image
+            transfer.close()
+            transfer = None
+        if transfer is None:
+            path = image_path(self.out, len(self.transfers)) if self.out else None
+            transfer = Transfer(channel, ts, path, self.capacity)
+            self.transfers.append(transfer)
+            self.current[channel] = transfer
+        transfer.add(ts, seq, payload)
+
+    def close(self):
+        for transfer in self.transfers:
+            transfer.close()
+        self.current = [None, None]
+
+    def summary(self):
+        lines = []
+        for transfer in self.transfers:
+            lines += transfer.summary()
+        return lines or ["no XMODEM transfers"]
+
+def reassemble_records(records, out=None):
+    """Reassemble every transfer in a capture's (ts, channel, data) records."""
+    from .framer import Framer
+    now = [None]
+    reassembler = XmodemReassembler(out, clock=lambda: now[0])
+    framers = [Framer(ch, on_xmodem_block=reassembler.on_xmodem_block) for ch in (0, 1)]
+    for ts, channel, data in records:
+        now[0] = ts
+        for packet in framers[channel].feed(data):
+            pass
+    reassembler.close()
+    return reassembler, framers
+
+def run_firmware(args):
+    from .capture import read_records
+    reassembler, framers = reassemble_records(read_records(args.file), args.out)
+    for line in reassembler.summary():
+        print(line)
+    for framer in framers:
+        bad = framer.resyncs.get("bad_xmodem_crc")
+        if bad:
+            print(f"channel {framer.channel}: {bad} block headers with a bad CRC", file=sys.stderr)
@@ -0,0 +1,18 @@
+"""Request/answer correlation on a normal boot."""
+from pathlib import Path
+
+from decoder.capture import read_records
+from decoder.correlate import correlate_records
+
+CAPTURES = Path(__file__).resolve().parent.parent / "test_decode"
+
+def test_periodic_reports_are_unanswered_not_missing():
+    rows = {(row["kind"], row["name"]): row
+            for row in correlate_records(read_records(str(CAPTURES / "boot_with_two_zones.txt"))).rows()}
+    sw_version = rows["REP/ACK", "radar_sw_version"]
+    assert (sw_version["matched"], sw_version["missing"], sw_version["unanswered"]) == (0, 0, 17)
+    for name in ("work_mode", "device_direction", "angle_sensor_data"):
+        assert rows["REP/ACK", name]["missing"] == 0
+    # Exchanges that do get answered still count their misses
+    assert rows["REP/ACK", "detect_zone_motion"]["matched"] == 3
+    assert not any(row["missing"] for (kind, name), row in rows.items() if kind == "REP/ACK")
@@ -0,0 +1,31 @@
+"""Zone occupancy rebuilt from the tracks against the radar's own events."""
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from decoder.occupancy import Occupancy, scan_file
+
+CAPTURES = Path(__file__).resolve().parent.parent / "test_decode"
+
+def test_zone_events_match_the_tracks():
+    occupancy = Occupancy(scan_file(str(CAPTURES / "sniff_data_zone_enter_exit.txt")))
+    (zone,) = occupancy.zone_rows()
+    assert zone["zone_id"] == 1
+    assert zone["runs"] == 3
+    for kind in ("occupied", "empty", "enter"):
+        events = zone["events"][kind]
+        assert (events["events"], events["matched"], events["unexplained"], events["missed"]) == (3, 3, 0, 0), kind
+        # Within a track report or so of the transition
+        assert abs(events["p50_s"]) < 1.0 and abs(events["max_s"]) < 1.0, kind
+
+def test_untimed_capture_matches_by_position():
+    # test_data4.txt has no timestamps: the radar fires one report after the target enters
+    occupancy = Occupancy(scan_file(str(CAPTURES / "test_data4.txt")))
+    assert not occupancy.timed
+    (zone,) = occupancy.zone_rows()
+    for kind in ("occupied", "enter"):
+        events = zone["events"][kind]
+        assert (events["events"], events["matched"], events["unexplained"]) == (1, 1, 0), kind
+        assert events["max_s"] == 1.0, kind
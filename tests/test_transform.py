@@ -0,0 +1,41 @@
+"""Target positions against the zones the radar reports them in."""
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from decoder.capture import read_records, iter_packets
+from decoder.protocol import decode_record
+from decoder.transform import Transform, RoomTracker, RIGHT_CORNER, AUTO, OPPOSITE
+
+CAPTURES = Path(__file__).resolve().parent.parent / "test_decode"
+DETECT_ZONE_PRESENCE = 0x0142
+
+def records(name):
+    for ts, channel, offset, skip, packet in iter_packets(read_records(str(CAPTURES / name))):
+        yield decode_record(channel, packet)
+
+def test_x_runs_from_left_to_right():
+    # PROTOCOL.md 5.1: x = +400 is the left edge, -400 the right edge
+    row, col = Transform(RIGHT_CORNER, AUTO).to_cells([399, -399], [0, 0])
+    assert col.tolist() == [0, 15]
+    row, col = Transform(RIGHT_CORNER, OPPOSITE).to_cells([399, -399], [0, 0])
+    assert col.tolist() == [15, 0]
+
+def test_targets_land_in_the_zone_the_radar_reports():
+    # Right corner, left_right_reverse auto; zone 1 is rows 0-2 of column 14
+    tracker = RoomTracker()
+    presence = None
+    checked = []
+    for rec in records("sniff_data_zone_enter_exit.txt"):
+        tracker.update(None, rec)
+        if rec.typ == 5 and rec.sub_id == DETECT_ZONE_PRESENCE and rec.zone_id == 1:
+            presence = rec.state
+        elif rec.targets and presence is not None:
+            # First target report after each presence change
+            zones = tracker.locate(rec.targets).zones
+            checked.append((presence, bool(np.any(tracker.lookup.contains(zones, 1)))))
+            presence = None
+    assert tracker.transform == Transform(RIGHT_CORNER, AUTO)
+    assert checked == [(1, True), (0, False)] * 3